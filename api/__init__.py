@@ -1,8 +1,17 @@
 import fastapi
 from . import connection, contact,content,user,order,webhooks,blockchain
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from managers.email_manager import EmailDispatcher
 
-app = fastapi.FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    yield
+    # 終了時に送信キューに残ったメールを送信する
+    await EmailDispatcher.shutdown()
+
+app = fastapi.FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,6 +19,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS","PUT"],  
     allow_headers=["*"],  
+    expose_headers=["x-continuation-token"],
 )
     
 app.include_router(connection.router)
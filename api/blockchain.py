@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Body, BackgroundTasks, Query, Path,Depends
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from models.blockchain import Block, Transaction, TransactionVin, TransactionOutput
 from repository import blockchain as blockchain_repo
 from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
@@ -22,13 +23,13 @@ async def get_block(
         if (hash is None) == (height is None):
             raise ValueError(f"hashとheightはどちらかを指定してください。hash:{hash}, height:{height}") 
         if hash is not None:
-            block=blockchain_repo.get_block("HISTORY",hash)
+            block=await run_in_threadpool(blockchain_repo.get_block,"HISTORY",hash)
             if block is None:
                 raise ValueError(f"指定したhashのブロックは存在しません. hash:{hash}")
             else:
                 return block
         elif height is not None:
-            block=blockchain_repo.get_block_by_height(height)
+            block=await run_in_threadpool(blockchain_repo.get_block_by_height,height)
             if block is None:
                 raise ValueError(f"指定したheightのブロックは存在しません. hash:{height}")
             else:
@@ -135,7 +136,7 @@ async def generate_block(
     ),
 ):
     try:
-        blockchain_repo.create_block(block)
+        await run_in_threadpool(blockchain_repo.create_block,block)
 
         return block
     except ValueError as e:
@@ -148,7 +149,7 @@ async def generate_block(
 @router.get("/blockchain/block/current", tags=["blockchain"])
 async def get_block_current():
     try:
-        current_block=blockchain_repo.get_block("CURRENT","0"*64)
+        current_block=await run_in_threadpool(blockchain_repo.get_block,"CURRENT","0"*64)
 
         return current_block
     except:
@@ -161,7 +162,7 @@ async def delete_block_current(
     token_data: JWTPayload = Depends(requires_scope("blockchain.delete")),
 ):
     try:
-        blockchain_repo.delete_block("CURRENT","0"*64)
+        await run_in_threadpool(blockchain_repo.delete_block,"CURRENT","0"*64)
 
         return True
     except ValueError as e:
@@ -179,7 +180,7 @@ async def get_block(
     try:
         MAX_BLOCKS = 100
         if start_height is None and end_height is None:
-            current_block_entity = blockchain_repo.get_block_entity("CURRENT", "0" * 64)
+            current_block_entity = await run_in_threadpool(blockchain_repo.get_block_entity,"CURRENT", "0" * 64)
             if current_block_entity is None:
                 return []
             eh = current_block_entity.height
@@ -212,7 +213,7 @@ async def get_block(
             eh = end_height
         
         # ブロックの取得
-        blocks = blockchain_repo.get_block_entities_in_range(sh, eh)
+        blocks = await run_in_threadpool(blockchain_repo.get_block_entities_in_range,sh, eh)
         return blocks
         
     except ValueError as e:
@@ -221,12 +222,27 @@ async def get_block(
         raise HTTPException(status_code=500, detail="内部サーバーエラーが発生しました")
 
 
+@router.get("/blockchain/block/template", tags=["blockchain"])
+async def get_block_template(
+    max_size: Optional[int] = Query(None, ge=1),
+    coinbase_txid: Optional[str] = Query(None, max_length=64, min_length=64, pattern="^[0-9a-fA-F]{64}$"),
+):
+    try:
+        template = await run_in_threadpool(blockchain_repo.get_block_template, max_size, coinbase_txid)
+        return template
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"エラー:{e}")
+        raise HTTPException(status_code=500, detail=f"内部サーバーエラーが発生しました")
+
+
 @router.get("/blockchain/transaction", tags=["blockchain"])
 async def get_transaction(
     txid: str = Query(...,max_length=64,min_length=64)
 ):
     try:
-        transaction=blockchain_repo.get_transaction(txid)
+        transaction=await run_in_threadpool(blockchain_repo.get_transaction,txid)
         return transaction
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -234,6 +250,21 @@ async def get_transaction(
         print(f"エラー:{e}")
         raise HTTPException(status_code=500, detail=f"内部サーバーエラーが発生しました")
 
+@router.get("/blockchain/transaction/proof", tags=["blockchain"])
+async def get_transaction_proof(
+    txid: str = Query(...,max_length=64,min_length=64)
+):
+    try:
+        proof=await run_in_threadpool(blockchain_repo.get_merkle_proof,txid)
+        if proof is None:
+            raise ValueError(f"指定したtxidのトランザクションは存在しません. txid:{txid}")
+        return proof
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"エラー:{e}")
+        raise HTTPException(status_code=500, detail=f"内部サーバーエラーが発生しました")
+
 @router.post("/blockchain/transaction", tags=["blockchain"])
 async def post_transaction(
     transaction: Transaction = Body(
@@ -302,7 +333,7 @@ async def post_transaction_mempool(
             vin.spent_block_hash="0"*64
         for output in transaction.outputs:
             output.block_hash="0"*64
-        result=blockchain_repo.create_transaction_in_mempool(transaction)
+        result=await run_in_threadpool(blockchain_repo.create_transaction_in_mempool,transaction)
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -317,7 +348,7 @@ async def get_transaction_mempool_list(
     try:
         qf=QueryFilter()
         qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": "0" * 64})
-        transaction_entities = blockchain_repo.query_transaction_entity(qf)
+        transaction_entities = await run_in_threadpool(blockchain_repo.query_transaction_entity,qf)
         return transaction_entities
         
     except ValueError as e:
@@ -3,8 +3,6 @@ from fastapi import HTTPException
 from models.email import EmailResponse,EmailRequest,EmailContent,EmailRecipients,EmailMessage,EmailAddress
 from models.contact import ContactMessage
 from models.order import Order
-from azure.communication.email import EmailClient
-from managers.email_manager import EmailManager
 from api.email import notify_contact_message
 import os
 import uuid
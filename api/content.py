@@ -1,18 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query, Path, Body,Depends
+from fastapi import APIRouter, HTTPException, Query, Path, Body,Depends,Response,BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import List, Optional
-from models.content import Content,PreviewContent
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional, Literal, Union
+from models.content import Content,ContentSummary,PreviewContent
 from managers.auth_manager import (
     JWTPayload,
     get_current_user,
     requires_scope,
     is_token_id_matching,
 )
-from managers.blob_manager import BLOBConnectionManager
 from repository import content as content_repo
+from repository import content_list as content_list_repo
 from datetime import datetime
 import uuid
 from models.query import QueryFilter
+from utils.table import encode_continuation_token,decode_continuation_token,CONTINUATION_TOKEN_HEADER
 from bs4 import BeautifulSoup
 import os
 import json
@@ -21,36 +23,75 @@ router = APIRouter()
 security = HTTPBearer()
 
 
-@router.get("/contents", response_model=List[Content], tags=["contents"])
+async def rebuild_contents_list(force: bool = False) -> List[PreviewContent]:
+    """全コンテンツからコンテンツ一覧ファイルを作り直す(forceの場合は内容が同じでもアップロードする)"""
+    previews = await content_repo.query_content_previews(QueryFilter())
+    await run_in_threadpool(content_list_repo.rebuild, previews, force)
+    return previews
+
+
+async def refresh_contents_list(content_id: Optional[str] = None, deleted_id: Optional[str] = None):
+    """コンテンツ一覧ファイルの該当項目だけを更新する(バックグラウンド処理用)"""
+    try:
+        if content_id is not None:
+            # 書き込み時に保存したプレビュー列から作成する
+            preview = await content_repo.get_content_preview(content_id)
+            updated = await run_in_threadpool(content_list_repo.upsert_previews, [preview])
+        else:
+            updated = await run_in_threadpool(content_list_repo.delete_preview, deleted_id)
+        
+        # マニフェストが未作成の場合は全体を作成
+        if updated is None:
+            await rebuild_contents_list()
+            
+    except Exception as e:
+        print(f"コンテンツ一覧ファイル更新エラー: {str(e)}")
+
+
+@router.get("/contents", response_model=Union[List[Content], List[ContentSummary]], tags=["contents"])
 async def list_contents(
+    response: Response,
     category: Optional[str] = Query(None, description="Filter by category"),
     title_no: Optional[int] = Query(None, description="Filter by title_no"),
-    limit: int = Query(50, description="Maximum number of contents to return"),
+    limit: int = Query(50, ge=1, le=1000, description="Maximum number of contents to return"),
+    view: Literal["full", "summary"] = Query("full", description="summary returns contents without content_html/content_text/full_speech_url"),
+    continuation_token: Optional[str] = Query(None, description="Continuation token returned in the x-continuation-token header"),
     token_data: JWTPayload = Depends(requires_scope("contents.read")),
 ):
-    """コンテンツの一覧を取得する"""
+    """コンテンツの一覧を取得する(続きがある場合はx-continuation-tokenヘッダーを返す)"""
+    try:
+        token = decode_continuation_token(continuation_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     qf = QueryFilter()
     qf.add_filter(f"category eq @category", {"category": category})
     qf.add_filter(f"title_no eq @title_no", {"title_no": title_no})
-    contents = content_repo.query_contents(qf, limit)
+    if view == "summary":
+        contents, next_token = await content_repo.query_content_summaries_page(qf, limit, token)
+    else:
+        contents, next_token = await content_repo.query_contents_page(qf, limit, token)
+    if next_token:
+        response.headers[CONTINUATION_TOKEN_HEADER] = encode_continuation_token(next_token)
     return contents
 
 
 @router.post("/contents", response_model=Content, status_code=201, tags=["contents"])
 async def create_content(
+    background_tasks: BackgroundTasks,
     content_item: Content = Body(..., description="Content to create"),
     token_data: JWTPayload = Depends(requires_scope("contents.write")),
 ):
     """新しいコンテンツを作成する"""
     
     # サブ関数
-    def check_existing_content():
+    async def check_existing_content():
         qf = QueryFilter()
         qf.add_filter(f"RowKey eq @content_id", {"content_id": content_item.id})
         qf.add_filter(
             f"title_no eq @title_no", {"title_no": content_item.title_no}, "or"
         )
-        contents = content_repo.query_contents(qf)
+        contents = await content_repo.query_contents(qf)
         if contents:
             return True
         return False
@@ -61,7 +102,7 @@ async def create_content(
         content_item.content_text = soup.get_text()
 
     # メイン処理
-    existing = check_existing_content()
+    existing = await check_existing_content()
     update_content(content_item)
     if existing:
         raise HTTPException(
@@ -69,9 +110,10 @@ async def create_content(
             detail=f"ID '{content_item.id}' または title_no '{content_item.title_no}' を持つリソースが既に存在します",
         )
     
-    success = content_repo.create_content(content_item)
+    success = await content_repo.create_content(content_item)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to create content")
+    background_tasks.add_task(refresh_contents_list, content_id=str(content_item.id))
 
     return content_item
 
@@ -83,7 +125,7 @@ async def get_content_by_id(
 ):
     """指定されたIDのコンテンツを取得する"""
     try:
-        content = content_repo.get_content(str(content_id))
+        content = await content_repo.get_content(str(content_id))
         return content
 
     except ValueError as e:
@@ -95,6 +137,7 @@ async def get_content_by_id(
 
 @router.put("/contents/{content_id}", response_model=Content, tags=["contents"])
 async def update_content(
+    background_tasks: BackgroundTasks,
     content_id: uuid.UUID = Path(..., description="Content ID to update"),
     content_item: Content = Body(..., description="Updated content data"),
     token_data: JWTPayload = Depends(requires_scope("contents.write")),
@@ -102,10 +145,10 @@ async def update_content(
     """指定されたIDのコンテンツを更新する"""
 
     # サブ関数
-    def get_existing_content():
+    async def get_existing_content():
         qf = QueryFilter()
         qf.add_filter(f"RowKey eq @content_id", {"content_id": content_item.id})
-        contents = content_repo.query_contents(qf)
+        contents = await content_repo.query_contents(qf)
         return contents
 
     # メイン処理
@@ -114,42 +157,45 @@ async def update_content(
             status_code=400,
             detail=f"パラメータのID {content_id} と更新するコンテンツのID {content_item.id} が一致しません。",
         )
-    contents = get_existing_content()
+    contents = await get_existing_content()
     if not contents:
         raise HTTPException(
             status_code=404,
             detail=f"指定されたID {content_id} のコンテンツが見つかりません",
         )
-    success = content_repo.update_content(content_item)
+    success = await content_repo.update_content(content_item)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to create content")
+    background_tasks.add_task(refresh_contents_list, content_id=str(content_item.id))
 
     return content_item
 
 
 @router.delete("/contents/{content_id}", status_code=204, tags=["contents"])
 async def delete_content_item(
+    background_tasks: BackgroundTasks,
     content_id: uuid.UUID = Path(..., description="Content ID to delete"),
     token_data: JWTPayload = Depends(requires_scope("contents.write")),
 ):
     """指定されたIDのコンテンツを削除する"""
 
     # サブ関数
-    def get_existing_content():
+    async def get_existing_content():
         qf = QueryFilter()
         qf.add_filter(f"RowKey eq @content_id", {"content_id": content_id})
-        contents = content_repo.query_contents(qf)
+        contents = await content_repo.query_contents(qf)
         return contents
 
     # メイン処理
-    contents = get_existing_content()
+    contents = await get_existing_content()
     if not contents:
         raise HTTPException(
             status_code=404, detail="指定されたIDのコンテンツが見つかりません"
         )
-    success = content_repo.delete_content(contents[0])
+    success = await content_repo.delete_content(contents[0])
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete content")
+    background_tasks.add_task(refresh_contents_list, deleted_id=str(content_id))
 
     return contents[0]
 
@@ -158,21 +204,10 @@ async def delete_content_item(
 async def generate_contents_list(
     token_data: JWTPayload = Depends(requires_scope("contents.read")),
 ):
-    """コンテンツ一覧ファイルを生成する"""
+    """コンテンツ一覧ファイルを生成する(内容が変わっていない場合も作り直す)"""
     try:
-        qf = QueryFilter()
-        contents = content_repo.query_contents(qf)
-
-        manager=BLOBConnectionManager()
-        contents_list = json.dumps([json.loads(c.to_preview().model_dump_json()) for c in contents])
-        
-        blob_client = manager.client.get_blob_client(
-                container=os.getenv("AZURE_BLOB_CONTAINER_NAME","root"), 
-                blob=os.getenv("CONTENT_LIST_FILE_NAME"), 
-        )
-            
-        blob_client.upload_blob(contents_list, overwrite=True)
-        return [c.to_preview().model_dump() for c in contents]
+        previews = await rebuild_contents_list(force=True)
+        return [p.model_dump() for p in previews]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"コンテンツ一覧ファイル生成に失敗しました:{e}")
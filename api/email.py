@@ -1,6 +1,6 @@
 from typing import List, Optional,Literal
 from models.user import User
-from managers.email_manager import EmailManager
+from managers.email_manager import EmailDispatcher
 from models.email import EmailResponse,EmailRequest,EmailContent,EmailRecipients,EmailMessage,EmailAddress
 from models.contact import ContactMessage
 import os
@@ -8,10 +8,8 @@ import json
 import datetime
 
 # 登録完了メール送信関数
-def send_registration_email(user_item: User):
+async def send_registration_email(user_item: User):
     try:
-        email_manager = EmailManager()
-        
         reply=EmailRequest(
         content=EmailContent.registration(
             email=user_item.email,
@@ -24,17 +22,15 @@ def send_registration_email(user_item: User):
         senderAddress=os.getenv('SENDER_ADDRESS'),
         )
         
-        poller = email_manager.client.begin_send(reply.model_dump())
-        mail_result = poller.result()
-        return mail_result
+        # 送信キューに追加(送信はEmailDispatcherのワーカーが行う)
+        return await EmailDispatcher().enqueue(reply.model_dump())
         
     except Exception as e:
         print(f"登録完了メール送信エラー: {str(e)}")
         
 #問い合わせメール送信
-def notify_contact_message(message: ContactMessage):
+async def notify_contact_message(message: ContactMessage):
     try:
-        email_manager=EmailManager()
         reply=EmailRequest(
                 content=EmailContent.contact(
                     contact_name=message.name,
@@ -49,19 +45,16 @@ def notify_contact_message(message: ContactMessage):
             )
         
         
-        poller = email_manager.client.begin_send(reply.model_dump())
-        mail_result = poller.result()
-        
-        return mail_result
+        # 送信キューに追加(送信はEmailDispatcherのワーカーが行う)
+        return await EmailDispatcher().enqueue(reply.model_dump())
         
     except Exception as e:
         print(f"メール送信エラー: {str(e)}")
         
         
 #購入完了メール送信
-def purchased_complete(customer_name: str,customer_email:str,order_id:str,order_date:datetime.datetime,content_title:str,price:int,content_html:str,payment_method:str="クレジットカード"):
+async def purchased_complete(customer_name: str,customer_email:str,order_id:str,order_date:datetime.datetime,content_title:str,price:int,content_html:str,payment_method:str="クレジットカード"):
     try:
-        email_manager=EmailManager()
         reply=EmailRequest(
             content=EmailContent.purchased_order(
                 name=customer_name,
@@ -79,10 +72,8 @@ def purchased_complete(customer_name: str,customer_email:str,order_id:str,order_
             senderAddress=os.getenv('SENDER_ADDRESS'),
         )
         
-        poller = email_manager.client.begin_send(reply.model_dump())
-        mail_result = poller.result()
-        
-        return mail_result
+        # 送信キューに追加(送信はEmailDispatcherのワーカーが行う)
+        return await EmailDispatcher().enqueue(reply.model_dump())
         
     except Exception as e:
         print(f"メール送信エラー: {str(e)}")
\ No newline at end of file
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Query, Path, Body, Depends,Header,Request
+from fastapi import APIRouter, HTTPException, Query, Path, Body, Depends,Header,Request,Response
 import stripe
 import os
 from pathlib import Path as PathlibPath
 from models.order import OrderItem,Order,OrderStatus,OrderResponse
 from models.query import QueryFilter
+from utils.table import encode_continuation_token,decode_continuation_token,CONTINUATION_TOKEN_HEADER
 from typing import Dict, Any,List,Optional
 from repository import user as user_repo
 from repository import content as content_repo
@@ -18,32 +19,43 @@ router = APIRouter()
 
 @router.get("/orders", response_model=List[Order], tags=["orders"])
 async def list_orders(
-    limit: int = Query(50, description="Maximum number of users to return"),
+    response: Response,
+    limit: int = Query(50, ge=1, le=1000, description="Maximum number of users to return"),
     user_id:str= Query(...,description="Filter by user_id"),
     content_id:Optional[str]= Query(None,description="Filter by content_id"),
     status:Optional[OrderStatus]= Query(None,description="Filter by content_id"),
     sas:Optional[bool]= Query(False,description="generate_sas_url"),
+    continuation_token: Optional[str] = Query(None, description="Continuation token returned in the x-continuation-token header"),
     token_data: JWTPayload  = Depends(requires_scope("orders.read"))
 ):
-    """注文情報一覧を取得する"""
+    """注文情報一覧を取得する(続きがある場合はx-continuation-tokenヘッダーを返す)"""
     if not is_token_id_matching(token_data,user_id):
             raise HTTPException(
                 status_code=403,
                 detail=f"user_id {user_id} とトークンのidが一致しません"
             )
+    try:
+        token = decode_continuation_token(continuation_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     qf=QueryFilter()
     qf.add_filter(f"user_id eq @user_id",{"user_id":user_id})
     qf.add_filter(f"content_id eq @content_id",{"content_id":content_id})
     qf.add_filter(f"checkout_status eq @status",{"status":status})
-    orders = order_repo.query_orders(qf,limit)
+    orders,next_token = await order_repo.query_orders_page(qf,limit,token)
+    if next_token:
+        response.headers[CONTINUATION_TOKEN_HEADER] = encode_continuation_token(next_token)
     if sas:
-        for order in orders:
-            if not order.content.full_speech_url:
-                continue
-            filename = PathlibPath(order.content.full_speech_url).name
-            manager=BLOBConnectionManager()
-            sas_url=await manager.generate_sas_url(f"{os.getenv('CONTENT_SPEECH_FILE_DIR')}/{filename}")
-            order.content.full_speech_url=sas_url
+        speech_orders = [order for order in orders if order.content.full_speech_url]
+        blob_names = [
+            f"{os.getenv('CONTENT_SPEECH_FILE_DIR')}/{PathlibPath(order.content.full_speech_url).name}"
+            for order in speech_orders
+        ]
+        manager=BLOBConnectionManager()
+        sas_urls=await manager.generate_sas_urls(blob_names)
+        for order,blob_name in zip(speech_orders,blob_names):
+            order.content.full_speech_url=sas_urls[blob_name]
     return orders
 
 @router.post("/orders/checkout", response_model=OrderResponse, status_code=201, tags=["orders"])
@@ -54,8 +66,8 @@ async def make_checkout_session(
         token_data = Depends(requires_scope("orders.write"))
     ):
     try:
-        user=user_repo.get_user(str(order_item.user_id))
-        content=content_repo.get_content(str(order_item.content_id))
+        user=await user_repo.get_user(str(order_item.user_id))
+        content=await content_repo.get_content(str(order_item.content_id))
         order=Order(content=content,user=user,**order_item.model_dump())
         
         stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
@@ -76,7 +88,7 @@ async def make_checkout_session(
         )
         
         order.checkout_id=session.id
-        order_repo.create_order(order)
+        await order_repo.create_order(order)
         
         return OrderResponse(
             session_id=session.id,
@@ -97,7 +109,7 @@ async def get_order(
 ):
     """指定されたIDの注文情報を取得する"""
     try:
-        order = order_repo.get_order(str(order_id))
+        order = await order_repo.get_order(str(order_id))
         
         if not is_token_id_matching(token_data,order.user.id):
             raise HTTPException(
@@ -119,8 +131,8 @@ async def delete_order(
 ):
     """指定されたIDの注文情報を削除する"""
     try:
-        order = order_repo.get_order(str(order_id))
-        order_repo.delete_order(str(order_id))
+        order = await order_repo.get_order(str(order_id))
+        await order_repo.delete_order(str(order_id))
         return True
     
     except ValueError as e:
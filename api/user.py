@@ -1,13 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query, Path, Body, Depends,Header,Request,BackgroundTasks,status
+from fastapi import APIRouter, HTTPException, Query, Path, Body, Depends,Header,Request,Response,BackgroundTasks,status
 from typing import List, Optional,Literal
 from models.user import User
 from managers.auth_manager import  JWTPayload,get_current_user,requires_scope,is_token_id_matching
 from repository import user as user_repo
 from datetime import datetime
 from models.query import QueryFilter
+from utils.table import encode_continuation_token,decode_continuation_token,CONTINUATION_TOKEN_HEADER
 from api.email import send_registration_email
 import uuid
-from managers.email_manager import EmailManager
 from models.email import EmailResponse,EmailRequest,EmailContent,EmailRecipients,EmailMessage,EmailAddress
 import os
 from fastapi.responses import JSONResponse
@@ -26,7 +26,7 @@ async def get_current_user_profile(
         raise HTTPException(status_code=400, detail="ユーザーIDが見つかりません")
     
     try:
-        user = user_repo.get_user(user_id)
+        user = await user_repo.get_user(user_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
     
@@ -34,12 +34,21 @@ async def get_current_user_profile(
 
 @router.get("/users", response_model=List[User], tags=["users"])
 async def list_users(
-    limit: int = Query(50, description="Maximum number of users to return"),
+    response: Response,
+    limit: int = Query(50, ge=1, le=1000, description="Maximum number of users to return"),
+    continuation_token: Optional[str] = Query(None, description="Continuation token returned in the x-continuation-token header"),
     token_data: JWTPayload = Depends(requires_scope("users.list"))
 ):
-    """ユーザーの一覧を取得する"""
+    """ユーザーの一覧を取得する(続きがある場合はx-continuation-tokenヘッダーを返す)"""
+    try:
+        token = decode_continuation_token(continuation_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     qf=QueryFilter()
-    users = user_repo.query_users(qf,limit)
+    users,next_token = await user_repo.query_users_page(qf,limit,token)
+    if next_token:
+        response.headers[CONTINUATION_TOKEN_HEADER] = encode_continuation_token(next_token)
     return users
 
 @router.post("/users", response_model=User, status_code=201, tags=["users"])
@@ -55,7 +64,7 @@ async def create_user_item(
         )
     # 既存ユーザーの確認
     try:
-        existing_user = user_repo.get_user(str(user_item.id))
+        existing_user = await user_repo.get_user(str(user_item.id))
         if existing_user:
             raise HTTPException(
                 status_code=409,
@@ -71,30 +80,9 @@ async def create_user_item(
     
     # ユーザー作成
     try:
-        user_repo.create_user(user_item)
-        # 登録完了メールを送信
-        try:
-            email_manager = EmailManager()
-            
-            reply=EmailRequest(
-                content=EmailContent.registration(
-                    email=user_item.email,
-                    name=user_item.email
-                    ),
-                recipients=EmailRecipients(
-                    to=[EmailAddress(address=user_item.email,displayName=user_item.email)],
-                    bcc=[EmailAddress(address=os.getenv('RECIPENTS_ADDRESS'),displayName=os.getenv('RECIPENTS_ADDRESS'))]
-                    ),
-                senderAddress=os.getenv('SENDER_ADDRESS'),
-            )
-            
-            poller = email_manager.client.begin_send(reply.model_dump())
-            mail_result = poller.result()
-            
-            
-        except Exception as e:
-            # メール送信に失敗してもユーザー作成は成功とする
-            print(f"登録完了メール送信エラー: {str(e)}")
+        await user_repo.create_user(user_item)
+        # 登録完了メールを送信(失敗してもユーザー作成は成功とする)
+        await send_registration_email(user_item)
             
         return user_item
     except Exception as e:
@@ -115,7 +103,7 @@ async def get_user(
             detail=f"user_id {user_id} とトークンのsubが一致しません"
         )
     try:
-        user = user_repo.get_user(str(user_id))
+        user = await user_repo.get_user(str(user_id))
         return user
     
     except ValueError as e:
@@ -141,7 +129,7 @@ async def update_user_item(
             )
     try:
         user_item.set_timestamp('update')
-        user_repo.update_user(user_item)
+        await user_repo.update_user(user_item)
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content=json.loads(user_item.model_dump_json())
@@ -150,7 +138,7 @@ async def update_user_item(
     except ValueError as e:
         if mode=="upsert":
             user_item.set_timestamp('create')
-            user_repo.create_user(user_item)
+            await user_repo.create_user(user_item)
             
             # 登録完了メールを送信
             background_tasks.add_task(send_registration_email, user_item)
@@ -183,8 +171,8 @@ async def delete_user_item(
                 detail=f"user_id {user_id} とトークンのidが一致しません"
             )
     try:
-        user = user_repo.get_user(str(user_id))
-        user_repo.delete_user(str(user_id))
+        user = await user_repo.get_user(str(user_id))
+        await user_repo.delete_user(str(user_id))
     except ValueError as e:
         raise HTTPException(
             status_code=404,
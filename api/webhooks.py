@@ -8,7 +8,6 @@ from typing import Dict, Any
 from repository import user as user_repo
 from repository import content as content_repo
 from repository import order as order_repo
-from managers.email_manager import EmailManager
 from models.email import EmailResponse,EmailRequest,EmailContent,EmailRecipients,EmailMessage,EmailAddress
 import datetime
 from api.email import purchased_complete
@@ -41,12 +40,12 @@ async def webhook(
         if event.type == 'checkout.session.expired' or event.type == 'checkout.session.completed':
             status = event.data.object.get("status")
             order_id = event.data.object.get('metadata', {}).get('order_id')
-            order_item = order_repo.update_order_status(order_id, status)
+            order_item = await order_repo.update_order_status(order_id, status)
             result = order_item
 
             if event.type == 'checkout.session.completed':
-                content = content_repo.get_content(str(order_item.content_id))
-                user = user_repo.get_user(str(order_item.user_id))
+                content = await content_repo.get_content(str(order_item.content_id))
+                user = await user_repo.get_user(str(order_item.user_id))
                 dt = datetime.datetime.fromtimestamp(event.data.object.get("created"))
                 background_tasks.add_task(purchased_complete, user.email, user.email, order_id, dt, content.title, int(content.price), content.content_html)
     except ValueError as e:
@@ -62,10 +61,10 @@ async def webhook(azure_user: AzureUser=Body(...,description="azure user data"))
         user_item = azure_user.to_user()
         
         try:
-            user_repo.update_user(user_item)
+            await user_repo.update_user(user_item)
         
         except ValueError as e:
-            user_repo.create_user(user_item)
+            await user_repo.create_user(user_item)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -18,7 +18,12 @@ import jwt
 import requests
 from typing import TypedDict, List, cast
 from pydantic import ValidationError
+from threading import Lock, Thread
+from utils.cache import LRUCache
+import copy
+import hashlib
 import logging
+import time
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
@@ -51,13 +56,36 @@ class JWTPayload(TypedDict, total=False):
 
 
 class AuthManager:
+    """
+    JWTの検証を行う
+
+    検証キー(JWKS)はkidごとに公開鍵へ変換してキャッシュする。
+    AUTH_JWKS_TTL_SECONDSを過ぎたキーはバックグラウンドで再取得し、
+    未知のkidの場合のみAUTH_JWKS_REFRESH_INTERVAL_SECONDSに1回まで即時に再取得する。
+    検証済みのトークンはSHA-256をキーにexpまでキャッシュし、再検証時は署名検証を省略する。
+    """
     _instance: Optional["AuthManager"] = None
+    _lock = Lock()
     jwt_keys: List[JWKKey] = []
+    signing_keys: Dict[str, Any] = {}
+    keys_loaded_at: float = 0.0
+    last_forced_refresh: float = float("-inf")
+    keys_ttl: float = 3600.0
+    refresh_interval: float = 60.0
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.jwt_keys = cls._instance._get_jwt_keys()
+            with cls._lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance.keys_ttl = float(os.getenv("AUTH_JWKS_TTL_SECONDS", "3600"))
+                    instance.refresh_interval = float(os.getenv("AUTH_JWKS_REFRESH_INTERVAL_SECONDS", "60"))
+                    instance._refresh_lock = Lock()
+                    instance._state_lock = Lock()
+                    instance._refreshing = False
+                    instance.token_cache = LRUCache(int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024")))
+                    instance._set_jwt_keys(instance._get_jwt_keys())
+                    cls._instance = instance
         return cls._instance
 
     def _get_jwt_keys(self) -> List[JWKKey]:
@@ -91,79 +119,148 @@ class AuthManager:
         except requests.exceptions.RequestException as e:
             raise ValueError(f"JWT検証キーの取得に失敗しました: {e}")
 
+    def _set_jwt_keys(self, jwt_keys: List[JWKKey]) -> None:
+        """JWKSを公開鍵に変換してkidごとに保持する"""
+        signing_keys = {}
+        for key in jwt_keys:
+            if key.get("kty") != "RSA" or not key.get("kid"):
+                continue
+            jwk = {
+                "kty": key.get("kty"),
+                "kid": key.get("kid"),
+                "use": key.get("use"),
+                "n": key.get("n"),
+                "e": key.get("e"),
+            }
+            try:
+                signing_keys[key["kid"]] = RSAAlgorithm.from_jwk(jwk)
+            except Exception as e:
+                logger.warning(f"JWT検証キーの変換に失敗しました。kid: {key.get('kid')}, error: {e}")
+
+        self.jwt_keys = jwt_keys
+        self.signing_keys = signing_keys
+        self.keys_loaded_at = time.monotonic()
+
     def reload_jwt_keys(self) -> None:
-        self.jwt_keys = self._get_jwt_keys()
+        with self._refresh_lock:
+            self._set_jwt_keys(self._get_jwt_keys())
+
+    def _refresh_in_background(self) -> None:
+        """TTLを過ぎたキーをバックグラウンドで再取得する(取得中は既存のキーを使用する)"""
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.reload_jwt_keys()
+            except Exception as e:
+                logger.warning(f"JWT検証キーの再取得に失敗しました: {e}")
+            finally:
+                with self._state_lock:
+                    self._refreshing = False
+
+        Thread(target=refresh, daemon=True).start()
+
+    def _refresh_for_unknown_kid(self) -> bool:
+        """未知のkid用の即時再取得(refresh_intervalに1回まで)。再取得した場合はTrue"""
+        with self._refresh_lock:
+            now = time.monotonic()
+            if now - self.last_forced_refresh < self.refresh_interval:
+                return False
+            self.last_forced_refresh = now
+            self._set_jwt_keys(self._get_jwt_keys())
+            return True
 
     def get_signing_key(self, jwt_token: str) -> Any:
         header = jwt.get_unverified_header(jwt_token)
-        signing_key = None
-
-        for key in self.jwt_keys:
-            if key.get("kid") == header.get("kid"):
-                jwk = {
-                    "kty": key.get("kty"),
-                    "kid": key.get("kid"),
-                    "use": key.get("use"),
-                    "n": key.get("n"),
-                    "e": key.get("e"),
-                }
-                signing_key = RSAAlgorithm.from_jwk(jwk)
-                return signing_key
-        if not signing_key:
-            print(f"Available keys: {[key.get('kid') for key in self.jwt_keys]}")
-            print(f"Looking for kid: {header.get('kid')}")
-            raise ValueError(f"署名キーが見つかりません。kid: {header.get('kid')}")
+        kid = header.get("kid")
+
+        if time.monotonic() - self.keys_loaded_at > self.keys_ttl:
+            self._refresh_in_background()
+
+        signing_key = self.signing_keys.get(kid)
+        if signing_key is None and self._refresh_for_unknown_kid():
+            signing_key = self.signing_keys.get(kid)
+
+        if signing_key is None:
+            print(f"Available keys: {list(self.signing_keys)}")
+            print(f"Looking for kid: {kid}")
+            raise ValueError(f"署名キーが見つかりません。kid: {kid}")
 
         return signing_key
 
+    def _get_cached_token(self, cache_key: bytes, audience: Optional[str], issuer: str) -> Optional[JWTPayload]:
+        """キャッシュ済みのトークンのクレーム(exp/nbf/aud/iss)を確認して返す。無効な場合はNone"""
+        decoded = self.token_cache.get(cache_key)
+        if decoded is None:
+            return None
+
+        now = time.time()
+        aud = decoded.get("aud")
+        audiences = aud if isinstance(aud, list) else [aud]
+        if (
+            decoded["exp"] <= now
+            or decoded.get("nbf", 0) > now
+            or (audience is not None and audience not in audiences)
+            or decoded.get("iss") != issuer
+        ):
+            self.token_cache.pop(cache_key)
+            return None
+        # 呼び出し元での変更がキャッシュに影響しないようコピーを返す
+        return cast(JWTPayload, copy.deepcopy(decoded))
+
     def verify_jwt_token(self, jwt_token: str) -> JWTPayload:
-        def try_decode(keys_reloaded: bool = False) -> JWTPayload:
-            try:
-                signing_key = self.get_signing_key(jwt_token)
-
-                # External IDの設定
-                audience = os.getenv("AZURE_API_APP_ID")
-                tenant_id = os.getenv("AZURE_B2C_TENANT_ID")
-
-                if not tenant_id:
-                    raise ValueError("AZURE_B2C_TENANT_ID環境変数が設定されていません")
-
-                # External IDの正しいissuer形式
-                issuer = f"https://{tenant_id}.ciamlogin.com/{tenant_id}/v2.0"
-
-                options = {
-                    "verify_signature": True,
-                    "verify_aud": True,
-                    "verify_iat": True,
-                    "verify_exp": True,
-                    "verify_nbf": True,
-                    "verify_iss": True,
-                }
-
-                decoded = jwt.decode(
-                    jwt_token,
-                    signing_key,
-                    audience=audience,
-                    issuer=issuer,
-                    algorithms=["RS256"],
-                    options=options,
-                )
-
-                return cast(JWTPayload, decoded)
-
-            except jwt.exceptions.InvalidTokenError as e:
-                print(f"Token validation error: {str(e)}")
-                if not keys_reloaded:
-                    self.reload_jwt_keys()
-                    return try_decode(keys_reloaded=True)
-                else:
-                    raise HTTPException(
-                        status_code=401,
-                        detail=f"不正なIDトークンです: {str(e)}",
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-
-        return try_decode()
+        try:
+            # External IDの設定
+            audience = os.getenv("AZURE_API_APP_ID")
+            tenant_id = os.getenv("AZURE_B2C_TENANT_ID")
+
+            if not tenant_id:
+                raise ValueError("AZURE_B2C_TENANT_ID環境変数が設定されていません")
+
+            # External IDの正しいissuer形式
+            issuer = f"https://{tenant_id}.ciamlogin.com/{tenant_id}/v2.0"
+
+            # 検証済みのトークン
+            cache_key = hashlib.sha256(jwt_token.encode()).digest()
+            cached = self._get_cached_token(cache_key, audience, issuer)
+            if cached is not None:
+                return cached
+
+            # 未知のkidの場合はget_signing_key内で検証キーを再取得する
+            signing_key = self.get_signing_key(jwt_token)
+
+            options = {
+                "verify_signature": True,
+                "verify_aud": True,
+                "verify_iat": True,
+                "verify_exp": True,
+                "verify_nbf": True,
+                "verify_iss": True,
+            }
+
+            decoded = jwt.decode(
+                jwt_token,
+                signing_key,
+                audience=audience,
+                issuer=issuer,
+                algorithms=["RS256"],
+                options=options,
+            )
+
+            if "exp" in decoded:
+                self.token_cache.put(cache_key, copy.deepcopy(decoded))
+            return cast(JWTPayload, decoded)
+
+        except jwt.exceptions.InvalidTokenError as e:
+            print(f"Token validation error: {str(e)}")
+            raise HTTPException(
+                status_code=401,
+                detail=f"不正なIDトークンです: {str(e)}",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
 
 
 # セキュリティスキーマ
@@ -3,54 +3,101 @@ from pydantic import BaseModel, ValidationError
 from typing import Literal, Dict, Any, List, Union,Optional
 from threading import local,Lock
 from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient,generate_blob_sas,BlobSasPermissions
+from utils.cache import LRUCache
 import os
 import datetime
 
 class BLOBConnectionManager:
+    """
+    Blob Storageの接続を管理する
+
+    SAS URLの署名に使う接続文字列は初回のみ解析し、
+    発行したSAS URLは残りの有効期間が有効期間の半分(BLOB_SAS_REFRESH_MARGIN_SECONDSの方が長い場合はその秒数)
+    になるまでblob名ごとに再利用する。クライアントが受け取ったURLは常に有効期間の半分以上使える。
+    (キャッシュは最大BLOB_SAS_CACHE_SIZE件で、古いものから破棄する)
+    """
     _instance: Optional['BLOBConnectionManager'] = None
+    _lock = Lock()
     client:Optional['BlobServiceClient']=None
+    account_name: Optional[str] = None
+    account_key: Optional[str] = None
+    sas_lifetime = datetime.timedelta(hours=1)
+    sas_refresh_margin = datetime.timedelta(minutes=5)
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls.client = BlobServiceClient.from_connection_string(os.getenv("AZURE_STORAGE_CONNECTION_STRING"))
+            with cls._lock:
+                if cls._instance is None:
+                    conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+                    instance = super().__new__(cls)
+                    cls.client = BlobServiceClient.from_connection_string(conn_str)
+                    
+                    # SAS署名用の資格情報
+                    settings = dict(pair.split('=', 1) for pair in conn_str.split(";") if '=' in pair)
+                    instance.account_name = settings.get("AccountName")
+                    instance.account_key = settings.get("AccountKey")
+                    instance.sas_refresh_margin = datetime.timedelta(seconds=int(os.getenv("BLOB_SAS_REFRESH_MARGIN_SECONDS", "300")))
+                    instance._sas_cache = LRUCache(int(os.getenv("BLOB_SAS_CACHE_SIZE", "1024")))
+                    cls._instance = instance
             
         return cls._instance
     
     def __init__(self):
         pass
     
+    def _get_sas_url(self, container_name: str, blob_name: str, now: datetime.datetime) -> str:
+        """キャッシュ済みのSAS URLを返す。期限が近い場合は新しく署名する"""
+        cache_key = f"{container_name}/{blob_name}"
+        cached = self._sas_cache.get(cache_key)
+        refresh_margin = max(self.sas_refresh_margin, self.sas_lifetime / 2)
+        if cached and now < cached[1] - refresh_margin:
+            return cached[0]
+        
+        start_time = now
+        expiry_time = start_time + self.sas_lifetime
+        
+        blob_client = self.client.get_blob_client(
+                container=container_name, 
+                blob=blob_name, 
+        )
+        
+        sas_token = generate_blob_sas(
+            account_name=self.account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            account_key=self.account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=expiry_time,
+            start=start_time
+        )
+        
+        sas_url = f"{blob_client.url}?{sas_token}"
+        self._sas_cache.put(cache_key, (sas_url, expiry_time))
+        return sas_url
     
     async def generate_sas_url(self,blob_name: str):
         """Azure Blob Storage用のSAS URLを生成する"""
         try:
-            conn_str=os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-            result = {}
-            for pair in conn_str.split(";"):
-                key, value = pair.split('=', 1)
-                result[key] = value
-            start_time = datetime.datetime.now(datetime.timezone.utc)
-            expiry_time = start_time + datetime.timedelta(hours=1)
-            
-            blob_client = self.client.get_blob_client(
-                    container=os.getenv("AZURE_BLOB_PRIVATE_CONTAINER_NAME"), 
-                    blob=blob_name, 
-            )
-            
-            sas_token = generate_blob_sas(
-                account_name=result["AccountName"],
-                container_name=os.getenv("AZURE_BLOB_PRIVATE_CONTAINER_NAME"),
-                blob_name=blob_name,
-                account_key=result["AccountKey"],
-                permission=BlobSasPermissions(read=True),
-                expiry=expiry_time,
-                start=start_time
-            )
+            now = datetime.datetime.now(datetime.timezone.utc)
+            return self._get_sas_url(os.getenv("AZURE_BLOB_PRIVATE_CONTAINER_NAME"), blob_name, now)
             
-            sas_url = f"{blob_client.url}?{sas_token}"
-            
-            return sas_url
+        except Exception as e:
+            raise ValueError(f"SAS URL生成に失敗しました: {str(e)}")
+    
+    async def generate_sas_urls(self,blob_names: List[str]) -> Dict[str, str]:
+        """
+        複数のblobのSAS URLをまとめて生成する
+
+        Returns:
+            blob名 -> SAS URL
+        """
+        try:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            container_name = os.getenv("AZURE_BLOB_PRIVATE_CONTAINER_NAME")
+            return {
+                blob_name: self._get_sas_url(container_name, blob_name, now)
+                for blob_name in dict.fromkeys(blob_names)
+            }
             
         except Exception as e:
             raise ValueError(f"SAS URL生成に失敗しました: {str(e)}")
-    
\ No newline at end of file
@@ -1,16 +1,130 @@
 from fastapi import APIRouter, HTTPException, Query, Path, Body, Depends, Header, Request, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Optional, Literal, Dict, Any
+from azure.communication.email.aio import EmailClient as AsyncEmailClient
+from azure.core.exceptions import HttpResponseError
+from weakref import WeakKeyDictionary
+import asyncio
+import logging
 import os
-from azure.communication.email import EmailClient
+import random
 
-class EmailManager:
-    _instance: Optional['EmailManager'] = None
-    client: Optional[EmailClient] = None
+logger = logging.getLogger(__name__)
+
+class EmailDispatcher:
+    """
+    メール送信キュー(非同期)
+
+    enqueueしたメッセージをEMAIL_WORKERS個のワーカーが非同期のEmailClientで送信する。
+    送信はbegin_sendの受付までとし、完了までポーリングしない。
+    失敗した場合はEMAIL_MAX_RETRIES回まで指数バックオフで再送する。
+    キューやワーカーはイベントループに紐づくため、イベントループごとにインスタンスを作成する。
+    アプリの終了時はshutdownでキューに残ったメッセージをEMAIL_SHUTDOWN_TIMEOUT_SECONDS秒まで送信する。
+
+    Examples:
+        >>> await EmailDispatcher().enqueue(reply.model_dump())
+        >>> EmailDispatcher().get_metrics()
+        >>> await EmailDispatcher.shutdown()
+    """
+    _instances: 'WeakKeyDictionary[asyncio.AbstractEventLoop, EmailDispatcher]' = WeakKeyDictionary()
     
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
+        loop = asyncio.get_running_loop()
+        instance = cls._instances.get(loop)
+        if instance is None:
+            instance = super().__new__(cls)
             connection_string = os.getenv("EMAIL_CONNECTION_STRING")
-            cls._instance.client = EmailClient.from_connection_string(connection_string)
-        return cls._instance
\ No newline at end of file
+            instance.client = AsyncEmailClient.from_connection_string(connection_string)
+            instance.queue = asyncio.Queue(maxsize=int(os.getenv("EMAIL_QUEUE_SIZE", "1000")))
+            instance.worker_count = int(os.getenv("EMAIL_WORKERS", "4"))
+            instance.max_retries = int(os.getenv("EMAIL_MAX_RETRIES", "3"))
+            instance.retry_backoff = float(os.getenv("EMAIL_RETRY_BACKOFF_SECONDS", "1.0"))
+            instance.workers = []
+            instance.metrics = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0}
+            cls._instances[loop] = instance
+        return instance
+    
+    def __init__(self):
+        pass
+    
+    def _start_workers(self) -> None:
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.worker_count:
+            self.workers.append(asyncio.create_task(self._worker()))
+    
+    async def enqueue(self, message: Dict[str, Any]) -> bool:
+        """メッセージを送信キューに追加する。キューが一杯の場合は破棄してFalse"""
+        self._start_workers()
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.metrics["dropped"] += 1
+            logger.error(f"メール送信キューが一杯のため破棄しました。queue size: {self.queue.qsize()}")
+            return False
+        self.metrics["enqueued"] += 1
+        return True
+    
+    async def _send(self, message: Dict[str, Any]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.client.begin_send(message)
+                self.metrics["sent"] += 1
+                return
+            except Exception as e:
+                # 429/5xx/通信エラー以外(リクエスト不正など)は再送しない
+                status_code = getattr(e, "status_code", None)
+                retryable = not (isinstance(e, HttpResponseError) and status_code is not None and status_code < 500 and status_code != 429)
+                if attempt >= self.max_retries or not retryable:
+                    self.metrics["failed"] += 1
+                    logger.error(f"メール送信エラー: {str(e)}")
+                    return
+                self.metrics["retried"] += 1
+                delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"メール送信を{delay:.1f}秒後に再試行します({attempt + 1}/{self.max_retries}): {str(e)}")
+                await asyncio.sleep(delay)
+    
+    async def _worker(self) -> None:
+        while True:
+            message = await self.queue.get()
+            try:
+                await self._send(message)
+            finally:
+                self.queue.task_done()
+    
+    async def join(self) -> None:
+        """キュー内のメッセージがすべて処理されるまで待つ"""
+        await self.queue.join()
+    
+    async def drain(self, timeout: float) -> bool:
+        """
+        キュー内のメッセージの送信をtimeout秒まで待ち、ワーカーとクライアントを停止する
+
+        Returns:
+            すべて処理された場合True、タイムアウトした場合False
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+            drained = True
+        except asyncio.TimeoutError:
+            drained = False
+            logger.error(f"メール送信キューの処理がタイムアウトしました。未送信: {self.queue.qsize()}")
+        
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.client.close()
+        return drained
+    
+    @classmethod
+    async def shutdown(cls, timeout: Optional[float] = None) -> bool:
+        """実行中のイベントループのインスタンスがあればdrainする(アプリの終了処理用)"""
+        instance = cls._instances.pop(asyncio.get_running_loop(), None)
+        if instance is None:
+            return True
+        if timeout is None:
+            timeout = float(os.getenv("EMAIL_SHUTDOWN_TIMEOUT_SECONDS", "10"))
+        return await instance.drain(timeout)
+    
+    def get_metrics(self) -> Dict[str, int]:
+        return {**self.metrics, "queued": self.queue.qsize(), "workers": len(self.workers)}
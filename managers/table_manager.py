@@ -3,8 +3,12 @@ from pydantic import BaseModel, ValidationError
 from typing import Literal, Dict, Any, List, Union,Optional
 from threading import local,Lock
 from azure.data.tables import TableServiceClient,TableClient
+from azure.data.tables.aio import TableServiceClient as AsyncTableServiceClient,TableClient as AsyncTableClient
 from azure.core.exceptions import ResourceExistsError
 from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from weakref import WeakKeyDictionary
+import asyncio
 import os
 
 class TableConnectionManager:
@@ -16,9 +20,12 @@ class TableConnectionManager:
     order_table:Optional['TableClient']=None
     blockchain_address_table:Optional['TableClient']=None
     blockchain_block_table:Optional['TableClient']=None
+    blockchain_block_height_table:Optional['TableClient']=None
     blockchain_transaction_table:Optional['TableClient']=None
+    blockchain_transaction_index_table:Optional['TableClient']=None
     blockchain_transaction_vin_table:Optional['TableClient']=None
     blockchain_transaction_output_table:Optional['TableClient']=None
+    blockchain_spent_outpoint_table:Optional['TableClient']=None
     
     def __new__(cls):
         if cls._instance is None:
@@ -47,14 +54,57 @@ class TableConnectionManager:
                     cls._instance.order_table = get_table_client("order",cls._instance.client)
                     cls._instance.blockchain_address_table = get_table_client("blockchain_address",cls._instance.client)
                     cls._instance.blockchain_block_table = get_table_client("blockchain_block",cls._instance.client)
+                    cls._instance.blockchain_block_height_table = get_table_client("blockchain_block_height",cls._instance.client)
                     cls._instance.blockchain_transaction_table = get_table_client("blockchain_transaction",cls._instance.client)
+                    cls._instance.blockchain_transaction_index_table = get_table_client("blockchain_transaction_index",cls._instance.client)
                     cls._instance.blockchain_transaction_vin_table = get_table_client("blockchain_transaction_vin",cls._instance.client)
                     cls._instance.blockchain_transaction_output_table = get_table_client("blockchain_transaction_output",cls._instance.client)
+                    cls._instance.blockchain_spent_outpoint_table = get_table_client("blockchain_spent_outpoint",cls._instance.client)
                     
         return cls._instance
     
     def __init__(self):
         pass
+
+
+class AsyncTableConnectionManager:
+    """
+    azure.data.tables.aio版のTableConnectionManager
+
+    aioクライアントは最初に使用したイベントループに紐づくため、イベントループごとにインスタンスを作成する。
+    テーブルの作成はTableConnectionManagerで行う。
+
+    Examples:
+        >>> manager = AsyncTableConnectionManager()
+        >>> entity = await manager.user_table.get_entity(partition_key='user', row_key=user_id)
+    """
+    _instances: 'WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncTableConnectionManager]' = WeakKeyDictionary()
+    _lock = Lock()
+    client:Optional['AsyncTableServiceClient']=None
+    contents_table:Optional['AsyncTableClient']=None
+    user_table:Optional['AsyncTableClient']=None
+    order_table:Optional['AsyncTableClient']=None
     
+    def __new__(cls):
+        loop = asyncio.get_running_loop()
+        instance = cls._instances.get(loop)
+        if instance is None:
+            with cls._lock:
+                instance = cls._instances.get(loop)
+                if instance is None:
+                    # テーブルが存在しない場合に作成
+                    TableConnectionManager()
+                    
+                    instance = super().__new__(cls)
+                    instance.client = AsyncTableServiceClient(
+                        endpoint=os.getenv("AZURE_COSMOSDB_ENDPOINT"),
+                        credential=AsyncDefaultAzureCredential()
+                    )
+                    instance.contents_table = instance.client.get_table_client("content")
+                    instance.user_table = instance.client.get_table_client("user")
+                    instance.order_table = instance.client.get_table_client("order")
+                    cls._instances[loop] = instance
+        return instance
     
-
+    def __init__(self):
+        pass
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, field_validator, computed_field, model_validator
+from pydantic import BaseModel, Field, field_validator, computed_field, model_validator, PrivateAttr
 from typing import List, Optional, Literal, Dict, Any
 import bech32
 from utils.blockchain import (
@@ -9,6 +9,9 @@ from utils.blockchain import (
     validate_readonly,
     validate_script_type,
     Base,
+    ByteWriter,
+    MerkleTree,
+    hash256,
 )
 from azure.data.tables import TableEntity
 from cryptography.hazmat.primitives.asymmetric import ec
@@ -32,6 +35,7 @@ class Block(Base):
     nonce: int = Field(..., ge=0, le=2**32 - 1)
     transaction_count: Optional[int] = Field(None)
     transactions: List["Transaction"] = Field(..., min_length=1)
+    _merkle_tree: Optional[MerkleTree] = PrivateAttr(default=None)
 
     @field_validator("hash", "previous_hash", "merkle_root", "bits")
     @classmethod
@@ -40,20 +44,18 @@ class Block(Base):
 
     @model_validator(mode="after")
     def validate_hash(self):
-        raw = self.get_raw_data()
-        cal_hash = self.hash256_hex(raw)
+        cal_hash = self.hash_bytes()[::-1].hex()
         if self.hash != cal_hash:
             raise ValueError(
-                f"hashが正しくないです。与えられたhash:{self.hash},計算されたhash:{cal_hash},計算元hash:{raw}"
+                f"hashが正しくないです。与えられたhash:{self.hash},計算されたhash:{cal_hash},計算元hash:{self.get_raw_data()}"
             )
         return self
 
     @model_validator(mode="after")
     def validate_merkle_root(self):
-        txids = [t.txid for t in self.transactions]
-        cal_merkle_root = self.get_merkle_root(txids)
+        cal_merkle_root = self.get_merkle_tree().root_hex()
         if self.merkle_root != cal_merkle_root:
-            txids_str = " ".join(txids)
+            txids_str = " ".join([t.txid for t in self.transactions])
             raise ValueError(
                 f"merkle_rootが正しくないです。"
                 f"与えられたmerkle_root:{self.merkle_root}, "
@@ -79,9 +81,10 @@ class Block(Base):
     def update_optional_field(self):
         self.transaction_count = len(self.transactions)
 
-        for t in self.transactions:
+        for position, t in enumerate(self.transactions):
             t.block_height = self.height
             t.block_hash = self.hash
+            t.position = position
 
             for i, vin in enumerate(t.vin):
                 vin.spent_block_hash = self.hash
@@ -91,46 +94,35 @@ class Block(Base):
 
         return self
 
-    def get_raw_data(self) -> str:
-        version_hex = self.int_to_hex(self.version, 4)
-        previous_hash_le = self.hex_to_little_endian(self.previous_hash)
-        merkle_root_le = self.hex_to_little_endian(self.merkle_root)
-        bits_le = self.hex_to_little_endian(self.bits)
-        nonce_hex = self.int_to_hex(self.nonce, 4)
-        time_hex = self.int_to_hex(self.timestamp, 4)
-
+    def serialize(self) -> bytes:
+        """80バイトのブロックヘッダーをシリアライズする"""
         return (
-            version_hex
-            + previous_hash_le
-            + merkle_root_le
-            + time_hex
-            + bits_le
-            + nonce_hex
+            ByteWriter()
+            .write_uint32(self.version)
+            .write_hash(self.previous_hash)
+            .write_hash(self.merkle_root)
+            .write_uint32(self.timestamp)
+            .write_hash(self.bits)
+            .write_uint32(self.nonce)
+            .getvalue()
         )
 
-    def get_merkle_root(self, txids: list[str]) -> str:
-        # 終了条件: ハッシュが1つになったら返す
-        if len(txids) == 1:
-            return txids[0]
-
-        # 結果を格納する配列
-        result = []
+    def hash_bytes(self) -> bytes:
+        return hash256(self.serialize())
 
-        # ペアに分割して処理
-        for i in range(0, len(txids), 2):
-            one = self.hex_to_little_endian(txids[i])
-            if i + 1 < len(txids):
-                two = self.hex_to_little_endian(txids[i + 1])
-                concat = one + two
-            else:
-                # ペアがない場合は自分自身と結合
-                concat = one + one
+    def get_raw_data(self) -> str:
+        return self.serialize().hex()
 
-            # 結合したデータをハッシュして結果に追加
-            result.append(self.hash256_hex(concat))
+    def get_merkle_root(self, txids: list[str]) -> str:
+        return MerkleTree.from_txids(txids).root_hex()
 
-        # 再帰: 結果に対して同じ処理を繰り返す
-        return self.get_merkle_root(result)
+    def get_merkle_tree(self) -> MerkleTree:
+        """transactionsの順にMerkle treeを構築し、以降はキャッシュを返す"""
+        if self._merkle_tree is None:
+            self._merkle_tree = MerkleTree(
+                [bytes.fromhex(t.txid)[::-1] for t in self.transactions]
+            )
+        return self._merkle_tree
 
     def to_entity(self, partition_type: "PartitionType", row_key: str):
         return BlockEntity(
@@ -162,10 +154,19 @@ class Transaction(Base):
     weight: Optional[int] = None
     fee: int = Field(0)
     locktime: int = Field(..., ge=0, le=2**32 - 1)
+    position: Optional[int] = None
     vin: List["TransactionVin"] = Field(default_factory=list)
     outputs: List["TransactionOutput"] = Field(default_factory=list)
+    _sighash_parts: Optional[tuple] = PrivateAttr(default=None)
+    _sighash_midstates: list = PrivateAttr(default_factory=list)
     
 
+    @field_validator("position", mode="before")
+    @classmethod
+    def ignore_position(cls, v: Optional[int]) -> Optional[int]:
+        # ブロック内の位置はBlockが設定する(取得したトランザクションをそのまま送信できるよう入力値は無視する)
+        return None
+
     @model_validator(mode="after")
     def update_optional_field(self):
         for i, vin in enumerate(self.vin):
@@ -180,31 +181,33 @@ class Transaction(Base):
 
     @model_validator(mode="after")
     def validate_hash(self):
-        raw = self.get_raw_data()
-        cal_hash = self.hash256_hex(raw)
+        cal_hash = self.txid_bytes()[::-1].hex()
         if self.txid != cal_hash:
             raise ValueError(
-                f"txidが正しくないです。与えられたhash:{self.txid},計算されたhash:{cal_hash},計算元hash:{raw}"
+                f"txidが正しくないです。与えられたhash:{self.txid},計算されたhash:{cal_hash},計算元hash:{self.get_raw_data()}"
             )
         return self
 
-    def get_raw_data(self):
-        version_le = self.int_to_hex(self.version, 4)
-        vin_count = self.int_to_compact_size(len(self.vin))
-        vin_raw_data = "".join([vin.get_raw_data() for vin in self.vin])
-        vout_count = self.int_to_compact_size(len(self.outputs))
-        vout_raw_data = "".join([vout.get_raw_data() for vout in self.outputs])
-        locktime_le = self.int_to_hex(self.locktime, 4)
+    def serialize_into(self, writer: ByteWriter) -> ByteWriter:
+        writer.write_uint32(self.version)
+        writer.write_compact_size(len(self.vin))
+        for vin in self.vin:
+            vin.serialize_into(writer)
+        writer.write_compact_size(len(self.outputs))
+        for vout in self.outputs:
+            vout.serialize_into(writer)
+        writer.write_uint32(self.locktime)
+        return writer
 
-        # 全てを連結
-        return (
-            version_le
-            + vin_count
-            + vin_raw_data
-            + vout_count
-            + vout_raw_data
-            + locktime_le
-        )
+    def serialize(self) -> bytes:
+        return self.serialize_into(ByteWriter()).getvalue()
+
+    def txid_bytes(self) -> bytes:
+        """txid(内部バイト順)を返す"""
+        return hash256(self.serialize())
+
+    def get_raw_data(self) -> str:
+        return self.serialize().hex()
 
     def to_entity(self):
         return TransactionEntity(
@@ -216,29 +219,66 @@ class Transaction(Base):
     def is_coinbase(self):
         return self.vin[0].is_coinbase()
 
-    def get_hash_raw_message(self, target_index: int, sighash: int = 0x01):
-        version_le = self.int_to_hex(self.version, 4)
-        vin_count = self.int_to_compact_size(len(self.vin))
-        input_raw = "".join(
-            [
-                vin.get_unsigned_data(target_index == i)
-                for (i, vin) in enumerate(self.vin)
-            ]
-        )
-        vout_count = self.int_to_compact_size(len(self.outputs))
-        vout_raw_data = "".join([vout.get_raw_data() for vout in self.outputs])
-        locktime_le = self.int_to_hex(self.locktime, 4)
-        sighash_hex = self.int_to_hex(sighash, 4)
+    def get_sighash_parts(self) -> tuple:
+        """
+        署名メッセージの共通部分を返す(初回のみシリアライズしてキャッシュ)
+
+        Returns:
+            (prefix, vins, offsets, suffix)
+            prefix: version + vin数
+            vins: scriptを空にした全vinを連結したもの。i番目のvinはvins[offsets[i]:offsets[i+1]]
+            suffix: outputs + locktime
+        """
+        if self._sighash_parts is None:
+            prefix = ByteWriter().write_uint32(self.version).write_compact_size(len(self.vin)).getvalue()
+            writer = ByteWriter()
+            offsets = [0]
+            for vin in self.vin:
+                vin.serialize_unsigned_into(writer, False)
+                offsets.append(len(writer.buffer))
+            suffix = ByteWriter().write_compact_size(len(self.outputs))
+            for vout in self.outputs:
+                vout.serialize_into(suffix)
+            suffix.write_uint32(self.locktime)
+            self._sighash_parts = (prefix, writer.getvalue(), offsets, suffix.getvalue())
+        return self._sighash_parts
+
+    def get_sighash_midstate(self, target_index: int):
+        """target_indexより前の部分(prefix + vins[:target_index])までのsha256の途中状態を返す"""
+        prefix, vins, offsets, _ = self.get_sighash_parts()
+        midstates = self._sighash_midstates
+        if not midstates:
+            midstates.append(hashlib.sha256(prefix))
+        view = memoryview(vins)
+        while len(midstates) <= target_index:
+            i = len(midstates)
+            midstate = midstates[-1].copy()
+            midstate.update(view[offsets[i - 1]:offsets[i]])
+            midstates.append(midstate)
+        return midstates[target_index]
 
-        return (
-            version_le
-            + vin_count
-            + input_raw
-            + vout_count
-            + vout_raw_data
-            + locktime_le
-            + sighash_hex
-        )
+    def get_hash_raw_message(self, target_index: int, sighash: int = 0x01):
+        prefix, vins, offsets, suffix = self.get_sighash_parts()
+        writer = ByteWriter().write(prefix).write(vins[:offsets[target_index]])
+        self.vin[target_index].serialize_unsigned_into(writer, True)
+        writer.write(vins[offsets[target_index + 1]:]).write(suffix).write_uint32(sighash)
+
+        return writer.getvalue().hex()
+
+    def get_signature_hash(self, target_index: int, sighash: int = 0x01) -> bytes:
+        """
+        target_indexのvinの署名メッセージ(get_hash_raw_messageのhash256)を返す
+
+        共通部分のシリアライズとtarget_indexより前のハッシュ計算は全vinで共有する。
+        vinやoutputsを変更した場合はキャッシュが古くなるため使用しないこと。
+        """
+        _, vins, offsets, suffix = self.get_sighash_parts()
+        hasher = self.get_sighash_midstate(target_index).copy()
+        hasher.update(self.vin[target_index].serialize_unsigned_into(ByteWriter(), True).buffer)
+        hasher.update(memoryview(vins)[offsets[target_index + 1]:])
+        hasher.update(suffix)
+        hasher.update(sighash.to_bytes(4, "little"))
+        return hashlib.sha256(hasher.digest()).digest()
         
     def balance_check(self):
         try:
@@ -252,6 +292,40 @@ class Transaction(Base):
             raise
 
 
+class BlockTemplate(BaseModel):
+    """mempoolから作成したブロックのひな形(coinbaseはposition 0に追加する)"""
+    version: int = Field(1, ge=0, le=2**32 - 1)
+    height: int = Field(..., ge=0, le=2**16 - 1)
+    previous_hash: str = Field(..., min_length=64, max_length=64)
+    bits: str = Field(..., min_length=8, max_length=8)
+    timestamp: int = Field(..., ge=0)
+    subsidy: int = Field(..., ge=0)
+    total_fee: int = Field(0, ge=0)
+    size: int = Field(0, ge=0)  # coinbaseを除くトランザクションのサイズ合計
+    transactions: List["Transaction"] = Field(default_factory=list)  # coinbaseを除く
+    merkle_branch: List[str] = Field(default_factory=list)  # coinbase(position 0)のMerkle proof
+    coinbase_txid: Optional[str] = Field(None, min_length=64, max_length=64)
+    merkle_root: Optional[str] = Field(None, min_length=64, max_length=64)  # coinbase_txid指定時のみ
+
+
+class MerkleProof(BaseModel):
+    txid: str = Field(..., min_length=64, max_length=64)
+    block_hash: str = Field(..., min_length=64, max_length=64)
+    merkle_root: str = Field(..., min_length=64, max_length=64)
+    position: int = Field(..., ge=0)
+    branch: List[str] = Field(default_factory=list)  # leaf側から順に兄弟ノードのhash
+
+    @classmethod
+    def from_tree(cls, tree: MerkleTree, block_hash: str, position: int) -> "MerkleProof":
+        return cls(
+            txid=tree.levels[0][position][::-1].hex(),
+            block_hash=block_hash,
+            merkle_root=tree.root_hex(),
+            position=position,
+            branch=[h[::-1].hex() for h in tree.get_proof(position)],
+        )
+
+
 ScriptType = Literal[
     "P2PK",
     "P2PKH",
@@ -319,20 +393,18 @@ class TransactionVin(Base):
     def is_coinbase(self):
         return self.utxo_txid == "0" * 64 and self.utxo_vout == 0xFFFFFFFF
 
-    def get_raw_data(self) -> str:
-        utxo_txid_le = self.hex_to_little_endian(self.utxo_txid)
-        utxo_vout_le = self.int_to_hex(self.utxo_vout, 4)
-        script_size = self.int_to_compact_size(len(self.script_sig_hex) // 2)
-        sequence_le = self.int_to_hex(self.sequence, 4)
+    def serialize_into(self, writer: ByteWriter) -> ByteWriter:
+        writer.write_hash(self.utxo_txid)
+        writer.write_uint32(self.utxo_vout)
+        writer.write_var_bytes(bytes.fromhex(self.script_sig_hex))
+        writer.write_uint32(self.sequence)
+        return writer
 
-        # 全てを連結
-        return (
-            utxo_txid_le
-            + utxo_vout_le
-            + script_size
-            + self.script_sig_hex
-            + sequence_le
-        )
+    def serialize(self) -> bytes:
+        return self.serialize_into(ByteWriter()).getvalue()
+
+    def get_raw_data(self) -> str:
+        return self.serialize().hex()
 
     def to_entity(self):
         return TransactionVinEntity(
@@ -341,16 +413,17 @@ class TransactionVin(Base):
             **self.model_dump(),
         )
 
-    def get_unsigned_data(self, is_target: bool = True):
+    def serialize_unsigned_into(self, writer: ByteWriter, is_target: bool = True) -> ByteWriter:
         if is_target and self.utxo_script_pubkey is None :
             raise ValueError(f"署名検証のためにutxo_script_pubkeyをセットしてください,txid:{self.spent_txid},vin_n:{self.n}")
-        utxo_txid_le = self.hex_to_little_endian(self.utxo_txid)
-        utxo_vout_le = self.int_to_hex(self.utxo_vout, 4)
-        script_size = self.int_to_compact_size(len(self.utxo_script_pubkey) // 2) if is_target else "00"
-        script_pubkey = self.utxo_script_pubkey if is_target else ""
-        sequence_le = self.int_to_hex(self.sequence, 4)
-        # 全てを連結
-        return utxo_txid_le + utxo_vout_le + script_size + script_pubkey + sequence_le
+        writer.write_hash(self.utxo_txid)
+        writer.write_uint32(self.utxo_vout)
+        writer.write_var_bytes(bytes.fromhex(self.utxo_script_pubkey) if is_target else b"")
+        writer.write_uint32(self.sequence)
+        return writer
+
+    def get_unsigned_data(self, is_target: bool = True):
+        return self.serialize_unsigned_into(ByteWriter(), is_target).getvalue().hex()
     
     def get_utxo_value(self):
         if self.utxo_value is None:
@@ -387,12 +460,16 @@ class TransactionOutput(Base):
     def check_script_type(self):
         return validate_script_type(self)
 
-    def get_raw_data(self) -> str:
-        value_hex = self.int_to_hex(self.value, 8)
-        script_size = self.int_to_compact_size(len(self.script_pubkey_hex) // 2)
+    def serialize_into(self, writer: ByteWriter) -> ByteWriter:
+        writer.write_uint64(self.value)
+        writer.write_var_bytes(bytes.fromhex(self.script_pubkey_hex))
+        return writer
+
+    def serialize(self) -> bytes:
+        return self.serialize_into(ByteWriter()).getvalue()
 
-        # 全てを連結
-        return value_hex + script_size + self.script_pubkey_hex
+    def get_raw_data(self) -> str:
+        return self.serialize().hex()
 
     def to_entity(self):
         return TransactionOutputEntity(
@@ -420,6 +497,42 @@ class BlockEntity(BaseModel):
     transaction_count: Optional[int] = Field(None)
 
 
+class BlockHeightEntity(BaseModel):
+    """heightからブロックを引くためのインデックス(一覧用にヘッダーも保持する)"""
+    PartitionKey: Literal["HEIGHT"] = "HEIGHT"
+    RowKey: str = Field(..., min_length=20, max_length=20)  # height 20桁
+    hash: str = Field(..., min_length=64, max_length=64)
+    version: int = Field(..., ge=0, le=2**32 - 1)
+    height: int = Field(..., ge=0, le=2**16 - 1)
+    previous_hash: str = Field(..., min_length=64, max_length=64)
+    merkle_root: str = Field(..., min_length=64, max_length=64)
+    timestamp: int = Field(..., ge=0)
+    bits: str = Field(..., min_length=8, max_length=8)
+    nonce: int = Field(..., ge=0, le=2**32 - 1)
+    transaction_count: Optional[int] = Field(None)
+
+    @field_validator("RowKey", mode="before")
+    @classmethod
+    def format_rowkey(cls, v):
+        if isinstance(v, int):
+            return f"{v:020d}"
+        return v
+
+    @classmethod
+    def from_block_entity(cls, block_entity: BlockEntity):
+        return cls(
+            RowKey=block_entity.height,
+            **block_entity.model_dump(exclude={"PartitionKey", "RowKey"}),
+        )
+
+    def to_block_entity(self) -> BlockEntity:
+        return BlockEntity(
+            PartitionKey="HISTORY",
+            RowKey=self.hash,
+            **self.model_dump(exclude={"PartitionKey", "RowKey"}),
+        )
+
+
 class TransactionEntity(BaseModel):
     PartitionKey: str = Field(..., min_length=64, max_length=64)  # block hash
     RowKey: str = Field(..., min_length=64, max_length=64)  # txid
@@ -432,6 +545,7 @@ class TransactionEntity(BaseModel):
     weight: Optional[int] = None
     fee: int = Field(0)
     locktime: int = Field(..., ge=0, le=2**32 - 1)
+    position: Optional[int] = None
 
 
 class TransactionVinEntity(BaseModel):
@@ -489,3 +603,46 @@ class TransactionOutputEntity(Base):
         return TransactionOutput.model_construct(
             **self.model_dump(exclude={"PartitionKey", "RowKey"}),
         )
+
+
+class TransactionIndexEntity(BaseModel):
+    """txidからトランザクションのブロック(PartitionKey)を引くためのインデックス"""
+    PartitionKey: str = Field(..., min_length=64, max_length=64)  # txid
+    RowKey: Literal["CURRENT"] = "CURRENT"
+    block_hash: str = Field(..., min_length=64, max_length=64)  # mempoolは"0"*64
+    position: Optional[int] = None
+
+    @classmethod
+    def from_transaction_entity(cls, transaction_entity: "TransactionEntity"):
+        return cls(
+            PartitionKey=transaction_entity.txid,
+            block_hash=transaction_entity.block_hash,
+            position=transaction_entity.position,
+        )
+
+
+class SpentOutpointEntity(BaseModel):
+    PartitionKey: str = Field(..., min_length=64, max_length=64)  # utxo_txid
+    RowKey: str = Field(..., min_length=20, max_length=20)  # utxo_vout 20桁
+    spent_txid: str = Field(..., min_length=64, max_length=64)
+    spent_block_hash: str = Field(..., min_length=64, max_length=64)
+    n: int
+    is_mempool: Optional[int] = Field(0)
+
+    @field_validator("RowKey", mode="before")
+    @classmethod
+    def format_rowkey(cls, v):
+        if isinstance(v, int):
+            return f"{v:020d}"
+        return v
+
+    @classmethod
+    def from_vin(cls, vin: "TransactionVin"):
+        return cls(
+            PartitionKey=vin.utxo_txid,
+            RowKey=vin.utxo_vout,
+            spent_txid=vin.spent_txid,
+            spent_block_hash=vin.spent_block_hash,
+            n=vin.n,
+            is_mempool=vin.is_mempool or 0,
+        )
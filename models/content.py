@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, ClassVar
 from datetime import datetime
 import re
 import uuid
@@ -40,7 +40,8 @@ class Content(BaseModel):
         soup = BeautifulSoup(self.content_html, 'html.parser')
         first_h2 = soup.find('h2')
         if not first_h2:
-            return PreviewContent(**self.model_dump(),preview_html=preview_html,preview_text=preview_text,remaining_text_length=remaining_text_length)
+            remaining_text_length = len(soup.get_text())
+            return PreviewContent(**self.model_dump(exclude={"full_speech_url"}),preview_html=preview_html,preview_text=preview_text,remaining_text_length=remaining_text_length)
         
         # 最初のh2とその後の連続するp要素を収集
         first_section_elements = [first_h2]
@@ -85,9 +86,38 @@ class PreviewContent(BaseModel):
     preview_speech_url: Optional[str] = None
     preview_moovie_url: Optional[str] = None
     meta_description:Optional[str]=None
+    
+    # ContentTableEntityから取得する列
+    table_columns: ClassVar[List[str]] = [
+        "RowKey","title_no","title","preview_text","preview_html","image_url","price","category","tags",
+        "publish_date","remaining_text_length","note_url","preview_speech_url","preview_moovie_url","meta_description",
+    ]
             
 
 
+class ContentSummary(BaseModel):
+    """一覧表示用のContent(content_html/content_text/full_speech_urlを含まない)"""
+    id:uuid.UUID =Field(default_factory=uuid.uuid4)
+    title_no: int
+    title: str
+    image_url: str
+    price: float
+    category: str
+    tags: List[str]
+    publish_date: datetime
+    preview_text_length: int = 100
+    note_url: Optional[str] = None
+    preview_speech_url: Optional[str] = None
+    preview_movie_url: Optional[str] = None
+    meta_description:Optional[str]=None
+    
+    # ContentTableEntityから取得する列
+    table_columns: ClassVar[List[str]] = [
+        "RowKey","title_no","title","image_url","price","category","tags","publish_date",
+        "preview_text_length","note_url","preview_speech_url","preview_moovie_url","meta_description",
+    ]
+
+
 class ContentTableEntity(BaseModel):
     PartitionKey: str ="content"
     RowKey: str
@@ -106,6 +136,9 @@ class ContentTableEntity(BaseModel):
     full_speech_url: Optional[str] = None
     preview_moovie_url: Optional[str] = None
     meta_description:Optional[str]=None
+    preview_html: Optional[str] = None
+    preview_text: Optional[str] = None
+    remaining_text_length: Optional[int] = None
     
     # Content モデルに変換するメソッド
     def to_content(self) -> Content:
@@ -115,6 +148,33 @@ class ContentTableEntity(BaseModel):
         deserialized_id=uuid.UUID(self.RowKey)
         return Content(id=deserialized_id,tags=deserialized_tags,publish_date=deserialized_publish_date,
                        **self.model_dump(exclude={"PartitionKey","RowKey","tags","publish_date"}))
+    
+    # 保存済みのプレビューからPreviewContentに変換するメソッド(プレビュー未保存の場合はNone)
+    def to_preview_content(self) -> Optional[PreviewContent]:
+        if self.preview_html is None or self.preview_text is None or self.remaining_text_length is None:
+            return None
+        deserialized_tags= json.loads(self.tags)
+        deserialized_publish_date=datetime.fromisoformat(self.publish_date)
+        deserialized_id=uuid.UUID(self.RowKey)
+        return PreviewContent(id=deserialized_id,tags=deserialized_tags,publish_date=deserialized_publish_date,
+                              **self.model_dump(include=set(PreviewContent.table_columns),exclude={"RowKey","tags","publish_date"},exclude_none=True))
+    
+    # 書き込み前にプレビューを設定するメソッド
+    def set_preview(self, preview: PreviewContent) -> "ContentTableEntity":
+        self.preview_html=preview.preview_html
+        self.preview_text=preview.preview_text
+        self.remaining_text_length=preview.remaining_text_length
+        return self
+    
+    # ContentSummary.table_columnsで射影したエンティティをContentSummaryに変換するメソッド
+    def to_content_summary(self) -> ContentSummary:
+        deserialized_tags= json.loads(self.tags)
+        deserialized_publish_date=datetime.fromisoformat(self.publish_date)
+        deserialized_id=uuid.UUID(self.RowKey)
+        # テーブルの列名はpreview_moovie_url
+        return ContentSummary(id=deserialized_id,tags=deserialized_tags,publish_date=deserialized_publish_date,
+                              preview_movie_url=self.preview_moovie_url,
+                              **self.model_dump(include=set(ContentSummary.table_columns),exclude={"RowKey","tags","publish_date","preview_moovie_url"},exclude_none=True))
         
     
     @classmethod
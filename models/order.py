@@ -94,6 +94,13 @@ class OrderTableEntity(BaseModel):
         return OrderItem(id=deserialized_id,user_id=deserialized_user_id,content_id=deserialized_content_id,created_at=deserialized_created_at,updated_at=deserialized_updated_at,
                         notes=self.notes,checkout_status=self.checkout_status,checkout_id=self.checkout_id)
     
+    def to_order(self, user: User, content: Content) -> Order:
+        deserialized_created_at = datetime.fromisoformat(self.created_at) if self.created_at else None
+        deserialized_updated_at = datetime.fromisoformat(self.updated_at) if self.updated_at else None
+        
+        return Order(id=self.RowKey,user=user,content=content,created_at=deserialized_created_at,updated_at=deserialized_updated_at,
+                     checkout_status=self.checkout_status,quantity=self.quantity)
+    
     @classmethod
     def from_order(cls, order: Order) -> "OrderTableEntity":
         serialized_id = str(order.id)
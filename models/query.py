@@ -11,6 +11,7 @@ import json
 class QueryFilter(BaseModel):
     query_filter: Optional[str] = None
     parameters: Dict[str, Any] = {}
+    select: Optional[List[str]] = None
     
     def add_filter(self, filter: str, param: Dict[str, Any]={}, operator: Literal['and', 'or'] = 'and'):
         """
@@ -1,14 +1,548 @@
 from managers.table_manager import TableConnectionManager
 from models.query import QueryFilter
 from typing import List, Optional, Dict, Any,Literal
-from models.blockchain import Block,BlockEntity,PartitionType,Transaction,TransactionVin,TransactionOutput,TransactionEntity,TransactionVinEntity,TransactionOutputEntity
+from models.blockchain import Block,BlockEntity,BlockHeightEntity,PartitionType,Transaction,TransactionVin,TransactionOutput,TransactionEntity,TransactionVinEntity,TransactionOutputEntity,MerkleProof,SpentOutpointEntity,TransactionIndexEntity,BlockTemplate
 from azure.core.exceptions import ResourceNotFoundError
 from azure.data.tables import EntityProperty, EdmType
 from cryptography.hazmat.primitives.asymmetric import ec
-from utils.blockchain import execute_script
+from utils.blockchain import execute_script,verify_signatures,DEFERRABLE_SCRIPT_TYPES,MerkleTree
+from utils.cache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock
+import bisect
+import heapq
 import os
 import time
 
+# submit_transactionの1回あたりの最大操作数
+TABLE_BATCH_SIZE = 100
+
+# ブロックhash -> MerkleTree (proof応答用)
+merkle_tree_cache = LRUCache(int(os.getenv("BLOCKCHAIN_MERKLE_TREE_CACHE_SIZE", "64")))
+
+# vin/outputのパーティション読み込み用(TableClientのコネクションプール既定値10を超えない数)
+_table_read_executor: Optional[ThreadPoolExecutor] = None
+_table_read_executor_lock = Lock()
+
+
+def get_table_read_executor() -> ThreadPoolExecutor:
+    global _table_read_executor
+    if _table_read_executor is None:
+        with _table_read_executor_lock:
+            if _table_read_executor is None:
+                _table_read_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("BLOCKCHAIN_TABLE_READ_WORKERS", "8")),
+                    thread_name_prefix="tableread",
+                )
+    return _table_read_executor
+
+
+class UTXOSet:
+    """
+    ブロックに取り込まれたoutputのUTXOセット(メモリ上)
+
+    (txid, vout) -> TransactionOutputEntity で未使用outputを保持する。
+    初回アクセス時にblockchain_transaction_output/blockchain_transaction_vinから読み込み、
+    以降はconnect_block/disconnect_blockで更新する(mempoolのoutput/vinは含まない)。
+    読み込み時のCURRENTのhashを保持し、他のインスタンスでブロックが追加された場合は
+    refresh_interval秒以内に追加されたブロックだけを反映する(削除やフォークの場合は読み込み直す)。
+    使用済みかどうかはblockchain_spent_outpointで管理する(このセットでは判定しない)。
+    """
+    # 追加されたブロックだけを反映する最大ブロック数(超える場合は読み込み直す)
+    max_extension_blocks = 10
+
+    def __init__(self):
+        self.unspent: Dict[tuple, TransactionOutputEntity] = {}
+        self.tip_hash: Optional[str] = None
+        self.loaded = False
+        self.checked_at = 0.0
+        self.refresh_interval = float(os.getenv("BLOCKCHAIN_UTXO_SET_REFRESH_SECONDS", "60"))
+        self.lock = RLock()
+
+    def load(self):
+        with self.lock:
+            current_block_entity = get_block_entity("CURRENT", "0"*64)
+            unspent = {}
+            # 書き込みに失敗したブロック(HISTORYがない)のoutput/vinは含めない
+            history = {e.hash for e in query_block_entity_by_partition("HISTORY") or []}
+            
+            qf = QueryFilter()
+            qf.add_filter(f"block_hash ne @block_hash", {"block_hash": "0"*64})
+            for output_entity in query_transaction_output_entity(qf) or []:
+                if output_entity.block_hash in history:
+                    unspent[(output_entity.txid, output_entity.n)] = output_entity
+            
+            qf = QueryFilter()
+            qf.add_filter(f"is_mempool ne {1}L")
+            for vin_entity in query_transaction_vin_entity(qf) or []:
+                if vin_entity.utxo_txid == "0"*64 or vin_entity.spent_block_hash not in history:
+                    continue
+                unspent.pop((vin_entity.utxo_txid, vin_entity.utxo_vout), None)
+            
+            self.unspent = unspent
+            self.tip_hash = current_block_entity.hash if current_block_entity else None
+            self.loaded = True
+            self.checked_at = time.monotonic()
+            print(f"UTXOセットを読み込みました。未使用:{len(unspent)}")
+
+    def refresh(self, current_block_entity: Optional[BlockEntity] = None, force: bool = False):
+        """
+        未読み込みの場合は読み込み、refresh_interval秒経過していれば(forceの場合は常に)CURRENTと比較する
+
+        Args:
+            current_block_entity: 呼び出し元で取得済みのCURRENT(Noneの場合は取得する)
+            force: refresh_intervalに関わらずCURRENTと比較する場合True
+        """
+        with self.lock:
+            if not self.loaded:
+                self.load()
+                return
+            if not force and time.monotonic() - self.checked_at < self.refresh_interval:
+                return
+            if current_block_entity is None:
+                current_block_entity = get_block_entity("CURRENT", "0"*64)
+            self.checked_at = time.monotonic()
+            if (current_block_entity.hash if current_block_entity else None) == self.tip_hash:
+                return
+            
+            # tipに続くブロックが追加された場合はそのブロックだけを反映する
+            extension = self.get_extension(current_block_entity)
+            if extension is None:
+                self.load()
+                return
+            for block_entity in extension:
+                qf = QueryFilter()
+                qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": block_entity.hash})
+                self.apply_transactions(query_transaction(qf) or [])
+                self.tip_hash = block_entity.hash
+            print(f"UTXOセットに追加されたブロックを反映しました。ブロック数:{len(extension)}")
+
+    def get_extension(self, current_block_entity: Optional[BlockEntity]) -> Optional[List[BlockEntity]]:
+        """tipからCURRENTまでに追加されたブロック(古い順)。削除やフォークの場合はNone"""
+        blocks = []
+        block_entity = current_block_entity
+        while block_entity and len(blocks) < self.max_extension_blocks:
+            blocks.append(block_entity)
+            if block_entity.previous_hash == (self.tip_hash or "0"*64):
+                return blocks[::-1]
+            block_entity = get_block_entity("HISTORY", block_entity.previous_hash)
+        return None
+
+    def apply_transactions(self, transactions: List[Transaction]):
+        """ブロックのトランザクションのoutputを追加し、vinが使用したoutputを除く"""
+        for t in transactions:
+            for output in t.outputs:
+                self.unspent[(t.txid, output.n)] = output.to_entity()
+        for t in transactions:
+            for vin in t.vin:
+                if vin.utxo_txid != "0"*64:
+                    self.unspent.pop((vin.utxo_txid, vin.utxo_vout), None)
+
+    def get(self, txid: str, vout: int) -> Optional[TransactionOutputEntity]:
+        self.refresh()
+        return self.unspent.get((txid, vout))
+
+    def connect_block(self, block: Block):
+        """ブロックのトランザクションを反映する(ストレージへの書き込み完了後に呼ぶこと)"""
+        with self.lock:
+            if not self.loaded:
+                return
+            # 読み込み後に他のインスタンスでブロックが追加されている場合は読み込み直す
+            if block.previous_hash != (self.tip_hash or "0"*64):
+                self.clear()
+                return
+            self.apply_transactions(block.transactions)
+            self.tip_hash = block.hash
+
+    def disconnect_block(self, block_entity: BlockEntity,
+                         output_entities: List[TransactionOutputEntity],
+                         restored_outputs: List[TransactionOutputEntity]):
+        """
+        削除したブロックのトランザクションを取り消す(ストレージからの削除完了後に呼ぶこと)
+
+        Args:
+            block_entity: 削除したブロック
+            output_entities: 削除したoutput
+            restored_outputs: 削除したvinが使用していたoutput(削除したブロック以外のもの)
+        """
+        with self.lock:
+            if not self.loaded:
+                return
+            if block_entity.hash != self.tip_hash:
+                self.clear()
+                return
+            for output_entity in output_entities:
+                self.unspent.pop((output_entity.txid, output_entity.n), None)
+            for output_entity in restored_outputs:
+                self.unspent[(output_entity.txid, output_entity.n)] = output_entity
+            self.tip_hash = block_entity.previous_hash if block_entity.previous_hash != "0"*64 else None
+
+    def clear(self):
+        with self.lock:
+            self.unspent = {}
+            self.tip_hash = None
+            self.loaded = False
+
+
+utxo_set = UTXOSet()
+
+
+class HeaderRecord:
+    """ヘッダーチェーン用のブロックヘッダー(BlockEntityより省メモリ)"""
+    __slots__ = ("hash", "version", "height", "previous_hash", "merkle_root",
+                 "timestamp", "bits", "nonce", "transaction_count")
+
+    def __init__(self, hash: str, version: int, height: int, previous_hash: str, merkle_root: str,
+                 timestamp: int, bits: str, nonce: int, transaction_count: Optional[int] = None):
+        self.hash = hash
+        self.version = version
+        self.height = height
+        self.previous_hash = previous_hash
+        self.merkle_root = merkle_root
+        self.timestamp = timestamp
+        self.bits = bits
+        self.nonce = nonce
+        self.transaction_count = transaction_count
+
+    @classmethod
+    def from_block_entity(cls, block_entity: BlockEntity) -> "HeaderRecord":
+        return cls(**block_entity.model_dump(exclude={"PartitionKey", "RowKey"}))
+
+    def to_block_entity(self, partition_type: PartitionType = "HISTORY") -> BlockEntity:
+        return BlockEntity(
+            PartitionKey=partition_type,
+            RowKey=self.hash if partition_type == "HISTORY" else "0"*64,
+            **{name: getattr(self, name) for name in self.__slots__},
+        )
+
+
+class HeaderChain:
+    """
+    CURRENTからgenesisまでのブロックヘッダー(メモリ上)
+
+    hash -> HeaderRecord と height -> HeaderRecord で保持する。
+    初回アクセス時にblockchain_blockのHISTORYパーティションから読み込み、
+    以降はconnect_block/disconnect_blockで更新する。
+    他のインスタンスでの追加/削除に追従するため、refresh_interval秒ごとにCURRENTを確認する。
+    """
+
+    def __init__(self):
+        self.by_hash: Dict[str, HeaderRecord] = {}
+        self.by_height: Dict[int, HeaderRecord] = {}
+        self.tip: Optional[HeaderRecord] = None
+        self.loaded = False
+        self.checked_at = 0.0
+        self.refresh_interval = float(os.getenv("BLOCKCHAIN_HEADER_CHAIN_REFRESH_SECONDS", "60"))
+        self.lock = RLock()
+
+    def load(self):
+        with self.lock:
+            current_block_entity = get_block_entity("CURRENT", "0"*64)
+            history = {e.hash: e for e in query_block_entity_by_partition("HISTORY") or []}
+            
+            # CURRENTからprevious_hashをたどる
+            by_hash: Dict[str, HeaderRecord] = {}
+            by_height: Dict[int, HeaderRecord] = {}
+            block_hash = current_block_entity.hash if current_block_entity else None
+            while block_hash in history:
+                record = HeaderRecord.from_block_entity(history.pop(block_hash))
+                by_hash[record.hash] = record
+                by_height[record.height] = record
+                block_hash = record.previous_hash
+            
+            self.by_hash = by_hash
+            self.by_height = by_height
+            self.tip = by_hash.get(current_block_entity.hash) if current_block_entity else None
+            self.loaded = True
+            self.checked_at = time.monotonic()
+            print(f"ヘッダーチェーンを読み込みました。ブロック数:{len(by_hash)}")
+
+    def refresh(self):
+        """未読み込みの場合は読み込み、refresh_interval秒経過していればCURRENTと比較する"""
+        with self.lock:
+            if not self.loaded:
+                self.load()
+                return
+            if time.monotonic() - self.checked_at < self.refresh_interval:
+                return
+            current_block_entity = get_block_entity("CURRENT", "0"*64)
+            self.checked_at = time.monotonic()
+            current_hash = current_block_entity.hash if current_block_entity else None
+            tip_hash = self.tip.hash if self.tip else None
+            if current_hash == tip_hash:
+                return
+            if current_block_entity and current_block_entity.previous_hash == (tip_hash or "0"*64):
+                self.add(HeaderRecord.from_block_entity(current_block_entity))
+            else:
+                self.load()
+
+    def add(self, record: HeaderRecord):
+        self.by_hash[record.hash] = record
+        self.by_height[record.height] = record
+        self.tip = record
+
+    def get_by_hash(self, block_hash: str) -> Optional[HeaderRecord]:
+        self.refresh()
+        return self.by_hash.get(block_hash)
+
+    def get_by_height(self, height: int) -> Optional[HeaderRecord]:
+        self.refresh()
+        return self.by_height.get(height)
+
+    def get_range(self, start_height: int, end_height: int) -> Optional[List[HeaderRecord]]:
+        """start_height～end_heightのヘッダー。tipより先を含む場合や欠けがある場合はNone"""
+        with self.lock:
+            self.refresh()
+            if self.tip is None or end_height > self.tip.height:
+                return None
+            records = [self.by_height.get(height) for height in range(start_height, end_height + 1)]
+            if any(record is None for record in records):
+                return None
+            return records
+
+    def connect_block(self, block_entity: BlockEntity):
+        """追加したブロックを反映する(ストレージへの書き込み完了後に呼ぶこと)"""
+        with self.lock:
+            if not self.loaded:
+                return
+            tip_hash = self.tip.hash if self.tip else "0"*64
+            if block_entity.previous_hash != tip_hash:
+                self.clear()
+                return
+            self.add(HeaderRecord.from_block_entity(block_entity))
+
+    def disconnect_block(self, block_hash: str):
+        """削除したブロックを取り消す(ストレージからの削除完了後に呼ぶこと)"""
+        with self.lock:
+            if not self.loaded:
+                return
+            if self.tip is None or self.tip.hash != block_hash:
+                self.clear()
+                return
+            self.by_hash.pop(block_hash, None)
+            self.by_height.pop(self.tip.height, None)
+            self.tip = self.by_hash.get(self.tip.previous_hash)
+
+    def clear(self):
+        with self.lock:
+            self.by_hash = {}
+            self.by_height = {}
+            self.tip = None
+            self.loaded = False
+
+
+header_chain = HeaderChain()
+
+
+class MempoolEntry:
+    """mempoolのトランザクションと手数料率、mempool内の親子関係"""
+    __slots__ = ("transaction", "txid", "fee", "size", "fee_rate", "parents", "children")
+
+    def __init__(self, transaction: Transaction):
+        self.transaction = transaction
+        self.txid = transaction.txid
+        self.fee = transaction.fee or 0
+        self.size = transaction.size or len(transaction.serialize())
+        self.fee_rate = self.fee / self.size
+        self.parents: set = set()
+        self.children: set = set()
+
+
+class Mempool:
+    """
+    mempoolのトランザクション(メモリ上)
+
+    txid -> MempoolEntry、使用するoutpoint(utxo_txid, utxo_vout) -> txid、
+    手数料率の降順リスト(-fee_rate, txid)で保持する。
+    初回アクセス時にblockchain_transactionのmempoolパーティションから読み込み、
+    以降はadd/connect_blockで更新する。
+    他のインスタンスで追加/削除されたトランザクションはrefresh_interval秒ごとに反映する。
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, MempoolEntry] = {}
+        self.by_outpoint: Dict[tuple, str] = {}
+        self.by_fee_rate: List[tuple] = []
+        self.loaded = False
+        self.checked_at = 0.0
+        self.refresh_interval = float(os.getenv("BLOCKCHAIN_MEMPOOL_REFRESH_SECONDS", "30"))
+        self.lock = RLock()
+
+    def load(self):
+        with self.lock:
+            self.entries = {}
+            self.by_outpoint = {}
+            self.by_fee_rate = []
+            self.sync()
+            self.loaded = True
+            print(f"mempoolを読み込みました。トランザクション数:{len(self.entries)}")
+
+    def sync(self):
+        """mempoolパーティションと比較し、追加/削除されたトランザクションを反映する"""
+        with self.lock:
+            qf = QueryFilter()
+            qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": "0"*64})
+            transaction_entities = query_transaction_entity(qf) or []
+            txids = {e.txid for e in transaction_entities}
+            for txid in [txid for txid in self.entries if txid not in txids]:
+                self.remove(txid)
+            new_entities = [e for e in transaction_entities if e.txid not in self.entries]
+            for tran in load_transactions(new_entities):
+                self.add(tran)
+            self.checked_at = time.monotonic()
+
+    def refresh(self):
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            elif time.monotonic() - self.checked_at >= self.refresh_interval:
+                self.sync()
+
+    def add(self, tran: Transaction):
+        """トランザクションを追加する(ストレージへの書き込み完了後に呼ぶこと)"""
+        with self.lock:
+            if tran.txid in self.entries:
+                return
+            entry = MempoolEntry(tran)
+            for vin in tran.vin:
+                self.by_outpoint[(vin.utxo_txid, vin.utxo_vout)] = entry.txid
+                if vin.utxo_txid in self.entries:
+                    entry.parents.add(vin.utxo_txid)
+                    self.entries[vin.utxo_txid].children.add(entry.txid)
+            # 先に追加された子(読み込み順による)
+            for output in tran.outputs:
+                child_txid = self.by_outpoint.get((tran.txid, output.n))
+                if child_txid in self.entries:
+                    entry.children.add(child_txid)
+                    self.entries[child_txid].parents.add(entry.txid)
+            self.entries[entry.txid] = entry
+            bisect.insort(self.by_fee_rate, (-entry.fee_rate, entry.txid))
+
+    def remove(self, txid: str) -> Optional[MempoolEntry]:
+        with self.lock:
+            entry = self.entries.pop(txid, None)
+            if entry is None:
+                return None
+            for vin in entry.transaction.vin:
+                if self.by_outpoint.get((vin.utxo_txid, vin.utxo_vout)) == txid:
+                    del self.by_outpoint[(vin.utxo_txid, vin.utxo_vout)]
+            index = bisect.bisect_left(self.by_fee_rate, (-entry.fee_rate, txid))
+            if index < len(self.by_fee_rate) and self.by_fee_rate[index][1] == txid:
+                del self.by_fee_rate[index]
+            for parent_txid in entry.parents:
+                if parent_txid in self.entries:
+                    self.entries[parent_txid].children.discard(txid)
+            for child_txid in entry.children:
+                if child_txid in self.entries:
+                    self.entries[child_txid].parents.discard(txid)
+            return entry
+
+    def remove_with_descendants(self, txid: str):
+        with self.lock:
+            entry = self.remove(txid)
+            for child_txid in entry.children if entry else []:
+                self.remove_with_descendants(child_txid)
+
+    def get_spending_txid(self, utxo_txid: str, utxo_vout: int) -> Optional[str]:
+        self.refresh()
+        return self.by_outpoint.get((utxo_txid, utxo_vout))
+
+    def get_sorted_entries(self) -> List[MempoolEntry]:
+        """手数料率の高い順"""
+        with self.lock:
+            self.refresh()
+            return [self.entries[txid] for _, txid in self.by_fee_rate]
+
+    def connect_block(self, block: Block):
+        """ブロックに取り込まれたトランザクションと、それと競合するトランザクション(子孫を含む)を除く"""
+        with self.lock:
+            if not self.loaded:
+                return
+            for t in block.transactions:
+                self.remove(t.txid)
+                if t.is_coinbase():
+                    continue
+                for vin in t.vin:
+                    conflict_txid = self.by_outpoint.get((vin.utxo_txid, vin.utxo_vout))
+                    if conflict_txid:
+                        self.remove_with_descendants(conflict_txid)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.by_outpoint = {}
+            self.by_fee_rate = []
+            self.loaded = False
+
+    def get_ancestors(self, txid: str, excluded: set) -> set:
+        """txidとmempool内の祖先(excludedを除く)"""
+        ancestors = set()
+        stack = [txid]
+        while stack:
+            current = stack.pop()
+            if current in ancestors or current in excluded:
+                continue
+            ancestors.add(current)
+            stack.extend(self.entries[current].parents)
+        return ancestors
+
+    def select_transactions(self, max_size: int) -> List[MempoolEntry]:
+        """
+        祖先を含めた手数料率(パッケージの手数料合計/サイズ合計)の高い順に、max_sizeまで選択する
+        親は必ず子より前に並ぶ
+        """
+        with self.lock:
+            self.refresh()
+            selected: set = set()
+            result: List[MempoolEntry] = []
+            total_size = 0
+
+            def package_score(txid: str):
+                package = self.get_ancestors(txid, selected)
+                fee = sum(self.entries[t].fee for t in package)
+                size = sum(self.entries[t].size for t in package)
+                return fee / size, package, size
+
+            heap = []
+            for txid in self.entries:
+                score, _, _ = package_score(txid)
+                heap.append((-score, txid))
+            heapq.heapify(heap)
+
+            while heap:
+                negative_score, txid = heapq.heappop(heap)
+                if txid in selected:
+                    continue
+                score, package, size = package_score(txid)
+                # 祖先が選択されてスコアが変わった場合は新しいスコアで積み直し済み
+                if -negative_score != score:
+                    continue
+                if total_size + size > max_size:
+                    continue
+
+                # 祖先数の少ない順(親が先)に追加
+                for t in sorted(package, key=lambda t: len(self.get_ancestors(t, selected))):
+                    result.append(self.entries[t])
+                selected |= package
+                total_size += size
+
+                # 選択したトランザクションの子孫はスコアが変わるため積み直す
+                descendants = set()
+                stack = [child for t in package for child in self.entries[t].children]
+                while stack:
+                    current = stack.pop()
+                    if current in descendants or current in selected:
+                        continue
+                    descendants.add(current)
+                    stack.extend(self.entries[current].children)
+                for descendant in descendants:
+                    heapq.heappush(heap, (-package_score(descendant)[0], descendant))
+
+            return result
+
+
+mempool = Mempool()
+
 
 #utilyty
 def int_to_int64(entity_dict: dict) -> dict:
@@ -17,6 +551,21 @@ def int_to_int64(entity_dict: dict) -> dict:
             entity_dict[key] = EntityProperty(value, EdmType.INT64)
     return entity_dict
 
+def submit_entity_operations(table_client, operations: List[tuple]):
+    """
+    (operation, entity)のリストをPartitionKeyごとにTABLE_BATCH_SIZE件ずつsubmit_transactionする
+
+    Examples:
+        >>> submit_entity_operations(manager.blockchain_transaction_table, [("upsert", entity_dict)])
+    """
+    partitions: Dict[str, List[tuple]] = {}
+    for operation in operations:
+        partitions.setdefault(operation[1]["PartitionKey"], []).append(operation)
+    
+    for partition_operations in partitions.values():
+        for i in range(0, len(partition_operations), TABLE_BATCH_SIZE):
+            table_client.submit_transaction(partition_operations[i:i + TABLE_BATCH_SIZE])
+
 def unwrap_entity_properties(entity_dict: dict) -> dict:
     result = {}
     for key, value in entity_dict.items():
@@ -35,7 +584,10 @@ def get_block(partition_type:PartitionType,row_key:str):
         
         qf=QueryFilter()
         qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": block_entity.hash})
-        transactions=query_transaction(qf)
+        transactions=query_transaction(qf) or []
+        # ブロック内の順序に並べ替え(position未保存の旧データはtxid順のまま)
+        if all(t.position is not None for t in transactions):
+            transactions.sort(key=lambda t: t.position)
 
         return Block.model_construct(**block_entity.model_dump(),transactions=transactions)
     
@@ -48,15 +600,9 @@ def get_block(partition_type:PartitionType,row_key:str):
     
 def get_block_by_height(height:int)->Block:
     try:
-        qf=QueryFilter()
-        qf.add_filter(f"height eq {height}L")
-        qf.add_filter(f"PartitionKey eq 'HISTORY'")
-        block_entities=query_block_entity(qf)
-        if not block_entities:
+        block_entity=get_block_entity_by_height(height)
+        if block_entity is None:
             return None
-        elif len(block_entities)>1:
-            raise Exception("指定されたheightのブロックが複数存在します。")
-        block_entity=block_entities[0]
         block=get_block("HISTORY",block_entity.hash)
 
         return block
@@ -68,26 +614,147 @@ def get_block_by_height(height:int)->Block:
     except Exception as e:
         raise
 
+def get_block_entity_by_height(height:int)->Optional[BlockEntity]:
+    try:
+        record=header_chain.get_by_height(height)
+        if record:
+            return record.to_block_entity()
+        
+        height_entity=get_block_height_entity(height)
+        if height_entity:
+            return height_entity.to_block_entity()
+        
+        # インデックス作成前のブロックはHISTORYから検索してインデックスを作成する
+        current_block_entity=get_block_entity("CURRENT","0"*64)
+        if current_block_entity is None or height>current_block_entity.height:
+            return None
+        block_entities=query_block_entity_by_height(height,height)
+        if not block_entities:
+            return None
+        elif len(block_entities)>1:
+            raise Exception("指定されたheightのブロックが複数存在します。")
+        create_block_height_entity(block_entities[0])
+        return block_entities[0]
+    
+    except Exception as e:
+        raise
+
 def get_block_entities_in_range(start_height:int,end_height:int)->List[BlockEntity]:
+    try:
+        records=header_chain.get_range(start_height,end_height)
+        if records is not None:
+            return [record.to_block_entity() for record in records]
+        
+        qf=QueryFilter()
+        qf.add_filter(f"PartitionKey eq 'HEIGHT'")
+        qf.add_filter(f"RowKey ge @StartRowKey", {"StartRowKey": f"{start_height:020d}"})
+        qf.add_filter(f"RowKey le @EndRowKey", {"EndRowKey": f"{end_height:020d}"})
+        block_entities=[e.to_block_entity() for e in query_block_height_entity(qf)]
+        
+        # インデックスに不足がある場合はHISTORYから検索してインデックスを作成する
+        current_block_entity=get_block_entity("CURRENT","0"*64)
+        if current_block_entity is None:
+            return block_entities
+        expected_count=max(0,min(end_height,current_block_entity.height)-start_height+1)
+        if len(block_entities)<expected_count:
+            indexed_heights={e.height for e in block_entities}
+            for block_entity in query_block_entity_by_height(start_height,end_height) or []:
+                if block_entity.height not in indexed_heights:
+                    create_block_height_entity(block_entity)
+                    block_entities.append(block_entity)
+            block_entities.sort(key=lambda e: e.height)
+        return block_entities
+    
+    except ResourceNotFoundError as e:
+        print(f"エンティティが見つかりません: {e}")
+        return None
+        
+    except Exception as e:
+        raise
+
+def query_block_entity_by_partition(partition_type:PartitionType)->List[BlockEntity]:
+    try:
+        qf=QueryFilter()
+        qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": partition_type})
+        return query_block_entity(qf)
+        
+    except Exception as e:
+        raise
+
+def query_block_entity_by_height(start_height:int,end_height:int)->List[BlockEntity]:
+    """HISTORYパーティションをheightで検索する(インデックスがないブロック用)"""
     try:
         qf=QueryFilter()
         qf.add_filter(f"height ge {start_height}L")
         qf.add_filter(f"height le {end_height}L")
         qf.add_filter(f"PartitionKey eq 'HISTORY'")
-        block_entities=query_block_entity(qf)
-        if not block_entities:
-            return []        
-        return block_entities
+        return query_block_entity(qf)
+        
+    except Exception as e:
+        raise
+
+def get_block_height_entity(height:int)->Optional[BlockHeightEntity]:
+    try:
+        manager = TableConnectionManager()
+        
+        table_entity=manager.blockchain_block_height_table.get_entity(
+            partition_key="HEIGHT",
+            row_key=f"{height:020d}"
+        )
+        return BlockHeightEntity.model_validate(unwrap_entity_properties(table_entity))
     
     except ResourceNotFoundError as e:
-        print(f"エンティティが見つかりません: {e}")
         return None
         
     except Exception as e:
         raise
 
+def query_block_height_entity(query_filter: QueryFilter)->List[BlockHeightEntity]:
+    try:
+        manager = TableConnectionManager()
+        
+        table_entities = manager.blockchain_block_height_table.query_entities(**query_filter.model_dump(exclude_none=True))
+        return [BlockHeightEntity.model_validate(unwrap_entity_properties(e)) for e in table_entities]
+        
+    except Exception as e:
+        raise
+
+def create_block_height_entity(block_entity:BlockEntity):
+    try:
+        manager = TableConnectionManager()
+        
+        height_entity=BlockHeightEntity.from_block_entity(block_entity)
+        entity_dict=int_to_int64(height_entity.model_dump(exclude_none=True))
+        manager.blockchain_block_height_table.upsert_entity(entity_dict)
+        return height_entity
+        
+    except Exception as e:
+        raise
+
+def delete_block_height_entity(block_entity:BlockEntity):
+    try:
+        # 同じheightに別のブロックが登録されている場合は削除しない
+        height_entity=get_block_height_entity(block_entity.height)
+        if height_entity is None or height_entity.hash!=block_entity.hash:
+            return False
+        
+        manager = TableConnectionManager()
+        manager.blockchain_block_height_table.delete_entity(
+            partition_key=height_entity.PartitionKey,
+            row_key=height_entity.RowKey
+        )
+        return True
+        
+    except Exception as e:
+        raise
+
 def get_block_entity(partition_type:PartitionType,row_key:str):
     try:
+        if partition_type=="HISTORY":
+            record=header_chain.get_by_hash(row_key)
+            if record:
+                return record.to_block_entity()
+        
         manager = TableConnectionManager()
         
         table_entity=manager.blockchain_block_table.get_entity(
@@ -129,6 +796,8 @@ def create_block(block: Block) :
         manager = TableConnectionManager()
 
         current_block = get_block_entity("CURRENT", "0"*64)
+        # 他のインスタンスで追加/削除されたブロックをUTXOセットに反映してから検証する
+        utxo_set.refresh(current_block, force=True)
 
         #BITS check
         BLOCKCHAIN_BITS=os.getenv("BLOCKCHAIN_BITS")
@@ -148,7 +817,21 @@ def create_block(block: Block) :
                 f"previous_hashが不正です。現在のhash:{current_block.hash}, 対象のhash:{block.previous_hash}"
             )
         
+        # 同じUTXOを複数のvinで使用していないか(使用済みoutpointのバッチが途中で失敗しないよう先に確認する)
+        block_outpoints=set()
+        for t in block.transactions:
+            if t.is_coinbase():
+                continue
+            for vin in t.vin:
+                outpoint=(vin.utxo_txid,vin.utxo_vout)
+                if outpoint in block_outpoints:
+                    raise ValueError(f"ブロック内で同じUTXOが複数回使用されています, utxo:{vin.utxo_txid}, vout:{vin.utxo_vout}")
+                block_outpoints.add(outpoint)
+        
         # vin utxo_txid check
+        block_transactions={t.txid: t for t in block.transactions}
+        deferred_checks=[]
+        mempool_conflicts=set()
         for t in block.transactions:
             if t.is_coinbase():
                 #SUBSIDY Check
@@ -163,82 +846,116 @@ def create_block(block: Block) :
             for i,vin in enumerate(t.vin):
                 # UTXOの存在確認
                 utxo_output=get_utxo(vin)
+                spent_outpoint=get_spent_outpoint(vin.utxo_txid,vin.utxo_vout)
+                
+                # 同じUTXOを使用するmempoolの別のトランザクション(ブロックの書き込み後に削除する)
+                if spent_outpoint and spent_outpoint.is_mempool==1 and spent_outpoint.spent_txid!=t.txid:
+                    mempool_conflicts.add(spent_outpoint.spent_txid)
                 
-                # UTXOが存在しない
-                if not utxo_output:
+                if utxo_output:
+                    # UTXOの使用済みチェック
+                    if is_confirmed_spent(spent_outpoint):
+                        raise ValueError(f"指定されたUTXOは利用済みです, utxo:{vin.utxo_txid}, vout:{vin.utxo_vout}")
+                    vin.utxo_block_hash = utxo_output.block_hash
+                else:
                     # 同じブロック内の他のトランザクションでUTXOが生成されているかチェック
-                    utxo_found_in_block = False
-                    for tx in block.transactions:
-                        if tx.txid == vin.utxo_txid:
-                            if vin.utxo_vout < len(tx.outputs):
-                                utxo_found_in_block = True
-                                break
-                    
-                    if not utxo_found_in_block:
+                    utxo_tx=block_transactions.get(vin.utxo_txid)
+                    if utxo_tx is None or vin.utxo_vout >= len(utxo_tx.outputs):
                         raise ValueError(f"指定されたUTXOが存在しません, utxo:{vin.utxo_txid}, vout:{vin.utxo_vout}")
-                    else:
-                        # 同一ブロック内のトランザクションからUTXO情報を取得
-                        for tx in block.transactions:
-                            if tx.txid == vin.utxo_txid:
-                                utxo_output = tx.outputs[vin.utxo_vout]
-                                vin.utxo_block_hash = block.hash
-                                vin.script_type = utxo_output.script_type
-                                vin.utxo_script_pubkey = utxo_output.script_pubkey_hex
-                                
-                                # 署名検証
-                                raw_message = t.get_hash_raw_message(i)
-                                message = t.hash256_hex(raw_message, False)
-                                if not execute_script(vin.script_sig_asm, utxo_output.script_pubkey_asm, message, block.timestamp):
-                                    raise ValueError(f"署名検証エラーです。script sig:{vin.script_sig_asm},script pubkey:{utxo_output.script_pubkey_asm},script type:{utxo_output.script_type}")
-                                break
-                        # 次のvinへ続行
-                        continue
-                
-                # UTXOの使用済みチェック
-                if is_spent_utxo(vin.utxo_txid,vin.utxo_vout):
-                    raise ValueError(f"指定されたUTXOは利用済みです, utxo:{vin.utxo_txid}, vout:{vin.utxo_vout}")
+                    # 同一ブロック内のトランザクションからUTXO情報を取得
+                    utxo_output = utxo_tx.outputs[vin.utxo_vout]
+                    vin.utxo_block_hash = block.hash
                 
                 # UTXOの情報を取得してvinに設定
-                vin.utxo_block_hash = utxo_output.block_hash
                 vin.script_type = utxo_output.script_type
                 vin.utxo_script_pubkey=utxo_output.script_pubkey_hex
                 vin.utxo_value=utxo_output.value
 
-                #verify signature
-                raw_message=t.get_hash_raw_message(i)
-                message=t.hash256_hex(raw_message,False)
-                if not execute_script(vin.script_sig_asm,utxo_output.script_pubkey_asm,message,block.timestamp):
+                #verify script (標準形式の署名はブロック全体でまとめて検証)
+                message=t.get_signature_hash(i).hex()
+                sig_checks=[] if utxo_output.script_type in DEFERRABLE_SCRIPT_TYPES else None
+                if not execute_script(vin.script_sig_hex,utxo_output.script_pubkey_hex,message,block.timestamp,sig_checks=sig_checks,script_type=utxo_output.script_type):
                     raise ValueError(f"署名検証エラーです。script sig:{vin.script_sig_asm},script pubkey:{utxo_output.script_pubkey_asm},script type:{utxo_output.script_type}")
+                deferred_checks.extend([(check,t,i) for check in sig_checks or []])
 
             # satoshis check
             t.balance_check()
+
+        #verify signature
+        verify_deferred_signatures(deferred_checks)
         
         #height更新
         block.height = current_block.height + 1 if current_block else 0
         for t in block.transactions:
             t.block_height=block.height
 
-        # CURRENTエンティティを更新
-        current_entity = block.to_entity("CURRENT", "0"*64)
-        entity_dict=int_to_int64(current_entity.model_dump(exclude_none=True))
-        manager.blockchain_block_table.upsert_entity(entity_dict)
+        #Transactionエンティティ作成(失敗した場合にヘッダーが存在しないトランザクションを指さないよう先に書き込む)
+        #HISTORYが作成されるまで、このブロックの使用済みoutpointとoutputはis_spent_utxo/get_utxoで無視される
+        create_transactions(block.transactions)
         
-        # HISTORYエンティティを作成
         history_entity = block.to_entity("HISTORY", block.hash)
-        entity_dict=int_to_int64(history_entity.model_dump(exclude_none=True))
-        manager.blockchain_block_table.create_entity(entity_dict)
+        history_created = False
+        try:
+            # HISTORYエンティティを作成
+            entity_dict=int_to_int64(history_entity.model_dump(exclude_none=True))
+            manager.blockchain_block_table.create_entity(entity_dict)
+            history_created = True
+            
+            # heightインデックスを作成
+            create_block_height_entity(history_entity)
+            
+            # CURRENTエンティティを更新(最後に更新する)
+            current_entity = block.to_entity("CURRENT", "0"*64)
+            entity_dict=int_to_int64(current_entity.model_dump(exclude_none=True))
+            manager.blockchain_block_table.upsert_entity(entity_dict)
+        except Exception:
+            # CURRENTに続かないHISTORYが残らないよう取り消す(同じブロックを再送できるようにする)
+            if history_created:
+                delete_block_height_entity(history_entity)
+                manager.blockchain_block_table.delete_entity(partition_key="HISTORY", row_key=block.hash)
+            raise
+        
+        # txidインデックスをブロックに向け、mempoolから削除する(ブロックの書き込み完了後)
+        create_transaction_indexes(block.transactions)
+        delete_mempool_transactions(block.transactions)
+        try:
+            # 競合するトランザクションを残すと他のインスタンスのsyncで再び読み込まれるため削除する
+            delete_mempool_conflicts(mempool_conflicts - set(block_transactions))
+        except Exception as e:
+            print(f"警告: mempoolの競合トランザクションの削除に失敗しました: {e}")
 
-        #Transactionエンティティ作成
-        for t in block.transactions:
-            create_transaction(t)
+        utxo_set.connect_block(block)
+        header_chain.connect_block(history_entity)
+        mempool.connect_block(block)
+        merkle_tree_cache.put(block.hash, block.get_merkle_tree())
 
         return block
         
     except Exception as e:
         raise
 
+def verify_deferred_signatures(deferred_checks: List[tuple]):
+    """execute_scriptで収集した(SignatureCheck, transaction, vin index)をまとめて検証する"""
+    try:
+        results=verify_signatures([check for check,_,_ in deferred_checks])
+        failed=[
+            f"txid:{t.txid},vin:{i},pubkey:{check.pubkey_hex}"
+            for (check,t,i),result in zip(deferred_checks,results) if not result
+        ]
+        if failed:
+            raise ValueError(f"署名検証エラーです。{' / '.join(failed)}")
+
+    except Exception as e:
+        raise
+
 def get_utxo(vin:TransactionVin):
     try:
+        # ブロックに取り込まれた未使用outputはUTXOセットから取得
+        utxo_output = utxo_set.get(vin.utxo_txid, vin.utxo_vout)
+        if utxo_output:
+            return utxo_output
+        
+        # mempoolのoutput、使用済みoutput
         manager = TableConnectionManager()
         qf = QueryFilter()
         qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": vin.utxo_txid})
@@ -256,6 +973,10 @@ def get_utxo(vin:TransactionVin):
                 unwrap_entity_properties(table_entities_list[0])
             )
         
+        # 書き込みに失敗したブロックのoutput
+        if utxo_output.block_hash != "0"*64 and not is_connected_block(utxo_output.block_hash):
+            return None
+        
         return utxo_output
     
     except Exception as e:
@@ -263,17 +984,36 @@ def get_utxo(vin:TransactionVin):
     
 def is_spent_utxo(utxo_txid:str,utxo_vout:int):
     try:
-        # UTXOの使用済みチェック
-        manager = TableConnectionManager()
-        qf2 = QueryFilter()
-        qf2.add_filter(f"utxo_txid eq @utxo_txid", {"utxo_txid": utxo_txid})
-        qf2.add_filter(f"utxo_vout eq @utxo_vout", {"utxo_vout": f"{utxo_vout:020d}"})
-        qf2.add_filter(f"is_mempool ne {1}L")
-        table2_entities = manager.blockchain_transaction_vin_table.query_entities(**qf2.model_dump())
-        table2_entities_list = list(table2_entities)
-        result=bool(table2_entities_list)
-        
-        return result
+        # UTXOの使用済みチェック(mempoolのvinは含まない)
+        # UTXOセットは他のインスタンスでの使用を反映していない場合があるため、常にストレージを確認する
+        return is_confirmed_spent(get_spent_outpoint(utxo_txid, utxo_vout))
+    
+    except Exception as e:
+        raise
+
+def get_spent_outpoint(utxo_txid:str,utxo_vout:int) -> Optional[SpentOutpointEntity]:
+    """使用済みoutpoint(mempoolを含む)を取得する"""
+    try:
+        spent_outpoint = get_spent_outpoint_entity(utxo_txid, utxo_vout)
+        if spent_outpoint is None:
+            # 使用済みoutpoint作成前のvinはvinテーブルから検索して作成する
+            spent_outpoint = backfill_spent_outpoint(utxo_txid, utxo_vout)
+        return spent_outpoint
+    
+    except Exception as e:
+        raise
+
+def is_confirmed_spent(spent_outpoint: Optional[SpentOutpointEntity]) -> bool:
+    """ブロックに取り込まれたトランザクションで使用済みか"""
+    if spent_outpoint is None or spent_outpoint.is_mempool == 1:
+        return False
+    # 書き込みに失敗したブロック(HISTORYがない)の使用済みoutpointは無視する
+    return is_connected_block(spent_outpoint.spent_block_hash)
+
+def is_connected_block(block_hash: str) -> bool:
+    """ブロックのHISTORYエンティティが存在するか(create_blockはトランザクションの書き込み後にHISTORYを作成する)"""
+    try:
+        return get_block_entity("HISTORY", block_hash) is not None
     
     except Exception as e:
         raise
@@ -296,6 +1036,8 @@ def delete_block(partition_type: PartitionType, row_key: str):
         transaction_entities = query_transaction_entity(qf)
         
         # 各トランザクションのvin/outputを削除
+        deleted_vin_entities = []
+        deleted_output_entities = []
         for tx_entity in transaction_entities:
             txid = tx_entity.txid
             
@@ -309,9 +1051,12 @@ def delete_block(partition_type: PartitionType, row_key: str):
                     partition_key=vin_entity.PartitionKey,
                     row_key=vin_entity.RowKey
                 )
+                delete_spent_outpoint(vin_entity)
+            deleted_vin_entities.extend(vin_entities)
             
             # トランザクションのoutputを削除
             output_entities = query_transaction_output_entity(qf_tx)
+            deleted_output_entities.extend(output_entities)
             
             for output_entity in output_entities:
                 manager.blockchain_transaction_output_table.delete_entity(
@@ -324,21 +1069,18 @@ def delete_block(partition_type: PartitionType, row_key: str):
                 partition_key=tx_entity.PartitionKey,
                 row_key=tx_entity.RowKey
             )
+            delete_transaction_index(txid, block_hash)
         
         # 前のブロックを取得（CURRENTエンティティ更新用）
         if block_entity.previous_hash and block_entity.previous_hash != "0" * 64:
             previous_block_entity = get_block_entity("HISTORY", block_entity.previous_hash)
             
             if previous_block_entity:
-                # 前のブロックの完全な情報を取得
-                previous_block = get_block("HISTORY", block_entity.previous_hash)
-                
-                if previous_block:
-                    # CURRENTエンティティを前のブロック情報に更新
-                    current_entity = previous_block.to_entity("CURRENT", "0" * 64)
-                    entity_dict = int_to_int64(current_entity.model_dump(exclude_none=True))
-                    manager.blockchain_block_table.upsert_entity(entity_dict)
-                    print(f"CURRENTエンティティを前のブロックに更新しました: {block_entity.previous_hash}")
+                # CURRENTエンティティを前のブロック情報に更新(ヘッダーのみで作成できる)
+                current_entity = previous_block_entity.model_copy(update={"PartitionKey": "CURRENT", "RowKey": "0" * 64})
+                entity_dict = int_to_int64(current_entity.model_dump(exclude_none=True))
+                manager.blockchain_block_table.upsert_entity(entity_dict)
+                print(f"CURRENTエンティティを前のブロックに更新しました: {block_entity.previous_hash}")
             else:
                 print(f"警告: 前のブロックが見つかりません: {block_entity.previous_hash}")
         else:
@@ -357,6 +1099,22 @@ def delete_block(partition_type: PartitionType, row_key: str):
             partition_key="HISTORY",
             row_key=block_hash
         )
+        delete_block_height_entity(block_entity)
+        header_chain.disconnect_block(block_hash)
+        merkle_tree_cache.pop(block_hash)
+        
+        # UTXOセットを更新(削除したvinが使用していたoutputを未使用に戻す)
+        block_txids = {tx_entity.txid for tx_entity in transaction_entities}
+        restored_outputs = []
+        for vin_entity in deleted_vin_entities:
+            if vin_entity.utxo_txid == "0"*64 or vin_entity.utxo_txid in block_txids:
+                continue
+            output_entity = get_transaction_output_entity(vin_entity.utxo_txid, vin_entity.utxo_vout)
+            if output_entity:
+                restored_outputs.append(output_entity)
+        utxo_set.disconnect_block(block_entity, deleted_output_entities, restored_outputs)
+        # 削除したブロックのoutputを使用するトランザクションがあるため読み込み直す
+        mempool.clear()
         
         
         print(f"ブロックを削除しました: {block_hash}")
@@ -370,6 +1128,39 @@ def delete_block(partition_type: PartitionType, row_key: str):
         print(f"ブロック削除中にエラーが発生しました: {e}")
         raise
 
+def delete_mempool_conflicts(txids: set) -> List[str]:
+    """
+    ブロックと競合したmempoolのトランザクションと、その子孫をストレージとメモリから削除する
+
+    Returns:
+        削除したtxid
+    """
+    try:
+        deleted = []
+        stack = list(txids)
+        while stack:
+            txid = stack.pop()
+            if txid in deleted:
+                continue
+            
+            # 削除するトランザクションのoutputを使用するmempoolのトランザクション(子)
+            qf = QueryFilter()
+            qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": txid})
+            for output_entity in query_transaction_output_entity(qf) or []:
+                spent_outpoint = get_spent_outpoint_entity(txid, output_entity.n)
+                if spent_outpoint and spent_outpoint.is_mempool == 1:
+                    stack.append(spent_outpoint.spent_txid)
+            
+            delete_transaction("0"*64, txid)
+            deleted.append(txid)
+        
+        if deleted:
+            print(f"ブロックと競合するmempoolのトランザクションを削除しました: {deleted}")
+        return deleted
+    
+    except Exception as e:
+        raise
+
 def delete_transaction(block_hash: str, txid: str):
     try:
         manager = TableConnectionManager()
@@ -384,6 +1175,7 @@ def delete_transaction(block_hash: str, txid: str):
                 partition_key=vin_entity.PartitionKey,
                 row_key=vin_entity.RowKey
             )
+            delete_spent_outpoint(vin_entity)
         
         # トランザクションのoutputを削除
         output_entities = query_transaction_output_entity(qf_tx)
@@ -399,6 +1191,9 @@ def delete_transaction(block_hash: str, txid: str):
             partition_key=block_hash,
             row_key=txid
         )
+        delete_transaction_index(txid, block_hash)
+        if block_hash == "0"*64:
+            mempool.remove(txid)
         
         return True
     
@@ -414,20 +1209,42 @@ def delete_transaction(block_hash: str, txid: str):
 def query_transaction(query_filter:QueryFilter):
     try:
         transaction_entities=query_transaction_entity(query_filter)
+        if transaction_entities is None:
+            return None
+        return load_transactions(transaction_entities)
 
-        transactions:List[Transaction]=[]
+    except ResourceNotFoundError as e:
+        print(f"エンティティが見つかりません: {e}")
+        return None
+        
+    except Exception as e:
+        raise
+
+def load_transactions(transaction_entities:List[TransactionEntity])->List[Transaction]:
+    """
+    トランザクションエンティティにvin/outputを付けてTransactionにする
+    vin/outputはtxidごとのパーティションにあるため、全パーティションを並列に読み込んでからまとめる
+    """
+    try:
+        executor = get_table_read_executor()
+        futures = []
         for e in transaction_entities:
             qf=QueryFilter()
             qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": e.txid})
-            vin=query_transaction_vin(qf)
-            output=query_transaction_output(qf)
-            transactions.append(Transaction.model_construct(**e.model_dump(exclude={"PartitionKey","RowKey"}),vin=vin,outputs=output))
+            futures.append((
+                executor.submit(query_transaction_vin, qf),
+                executor.submit(query_transaction_output, qf),
+            ))
+
+        transactions:List[Transaction]=[]
+        for e, (vin_future, output_future) in zip(transaction_entities, futures):
+            transactions.append(Transaction.model_construct(
+                **e.model_dump(exclude={"PartitionKey","RowKey"}),
+                vin=vin_future.result(),
+                outputs=output_future.result(),
+            ))
         return transactions
 
-    except ResourceNotFoundError as e:
-        print(f"エンティティが見つかりません: {e}")
-        return None
-        
     except Exception as e:
         raise
 
@@ -467,56 +1284,194 @@ def get_transaction_entity(block_hash:str,txid:str):
 
 def get_transaction(txid: str) :
     try:
+        transaction_entity=get_transaction_entity_by_txid(txid)
+        if transaction_entity is None:
+            return None
+        return load_transactions([transaction_entity])[0]
+        
+    except Exception as e:
+        raise
+
+def get_transaction_entity_by_txid(txid: str) -> Optional[TransactionEntity]:
+    """txidインデックスからブロックを特定し、トランザクションをポイント読み込みする"""
+    try:
+        index_entity=get_transaction_index_entity(txid)
+        if index_entity:
+            transaction_entity=get_transaction_entity(index_entity.block_hash,txid)
+            if transaction_entity:
+                return transaction_entity
+        
+        # インデックス作成前のトランザクションは全パーティションから検索してインデックスを作成する
         qf=QueryFilter()
         qf.add_filter(f"RowKey eq @RowKey", {"RowKey": txid})
-        transactions=query_transaction(qf)
-        if not transactions:
+        transaction_entities=query_transaction_entity(qf)
+        if not transaction_entities:
             return None
-        if len(transactions)>1:
+        if len(transaction_entities)>1:
             raise Exception(f"内部エラー。指定されたIDのトランザクションが複数存在します。txid:{txid}")
-        return transactions[0]
+        create_transaction_index(transaction_entities[0])
+        return transaction_entities[0]
         
     except Exception as e:
         raise
 
-def create_transaction(tran: Transaction) :
+def get_transaction_index_entity(txid: str) -> Optional[TransactionIndexEntity]:
     try:
-        create_transaction_entity(tran)
-        for vin in tran.vin:
-            create_transaction_vin(vin)
-            
-        for output in tran.outputs:
-            create_transaction_output(output)
-            
-        #mempool Transaction削除
         manager = TableConnectionManager()
-        manager.blockchain_transaction_table.delete_entity(
-            partition_key="0"*64,
-            row_key=tran.txid
+        
+        table_entity=manager.blockchain_transaction_index_table.get_entity(
+            partition_key=txid,
+            row_key="CURRENT"
         )
+        return TransactionIndexEntity.model_validate(unwrap_entity_properties(table_entity))
+    
+    except ResourceNotFoundError as e:
+        return None
+        
+    except Exception as e:
+        raise
 
-        return tran
+def create_transaction_index(transaction_entity: TransactionEntity):
+    try:
+        manager = TableConnectionManager()
+        
+        index_entity=TransactionIndexEntity.from_transaction_entity(transaction_entity)
+        entity_dict=int_to_int64(index_entity.model_dump(exclude_none=True))
+        manager.blockchain_transaction_index_table.upsert_entity(entity_dict)
+        return index_entity
         
     except Exception as e:
         raise
 
-def create_transaction_entity(tran: Transaction) :
+def delete_transaction_index(txid: str, block_hash: str):
     try:
+        # 別のブロック(mempool)のトランザクションを指している場合は削除しない
+        index_entity=get_transaction_index_entity(txid)
+        if index_entity is None or index_entity.block_hash!=block_hash:
+            return False
+        
         manager = TableConnectionManager()
+        manager.blockchain_transaction_index_table.delete_entity(
+            partition_key=index_entity.PartitionKey,
+            row_key=index_entity.RowKey
+        )
+        return True
+        
+    except Exception as e:
+        raise
+
+def get_merkle_proof(txid: str):
+    try:
+        transaction_entity=get_transaction_entity_by_txid(txid)
+        if not transaction_entity:
+            return None
+        block_hash=transaction_entity.block_hash
+        if block_hash=="0"*64:
+            raise ValueError(f"mempoolのトランザクションはブロックに含まれていません。txid:{txid}")
+
+        tree=get_merkle_tree(block_hash)
+        return MerkleProof.from_tree(tree,block_hash,transaction_entity.position)
+
+    except Exception as e:
+        raise
+
+def get_merkle_tree(block_hash: str) -> MerkleTree:
+    try:
+        tree=merkle_tree_cache.get(block_hash)
+        if tree is not None:
+            return tree
 
-        #block check
-        block_entity = get_block_entity("HISTORY", tran.block_hash)
+        block_entity=get_block_entity("HISTORY",block_hash)
         if not block_entity:
-            raise ValueError(
-                f"blockが存在しません。対象のblock hash:{tran.block_hash}"
-            )
+            raise ValueError(f"blockが存在しません。対象のblock hash:{block_hash}")
 
-        #エンティティ作成
-        tran_entity= tran.to_entity()
-        entity_dict=int_to_int64(tran_entity.model_dump(exclude_none=True))
-        manager.blockchain_transaction_table.upsert_entity(entity_dict)
+        qf=QueryFilter()
+        qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": block_hash})
+        transaction_entities=query_transaction_entity(qf)
+        if any(e.position is None for e in transaction_entities):
+            raise ValueError(f"ブロック内のトランザクション順序が保存されていません。block hash:{block_hash}")
+        transaction_entities.sort(key=lambda e: e.position)
 
-        return tran
+        tree=MerkleTree.from_txids([e.txid for e in transaction_entities])
+        if tree.root_hex()!=block_entity.merkle_root:
+            raise ValueError(f"merkle_rootが一致しません。block hash:{block_hash}")
+        merkle_tree_cache.put(block_hash,tree)
+        return tree
+
+    except Exception as e:
+        raise
+
+def create_transactions(transactions: List[Transaction]) :
+    """
+    トランザクションとvin/output/使用済みoutpointをPartitionKeyごとにまとめて書き込む
+    (ブロックのヘッダーはこの書き込みが成功した後に作成し、
+    その後create_transaction_indexes/delete_mempool_transactionsを呼ぶこと)
+    """
+    try:
+        manager = TableConnectionManager()
+        
+        tran_operations=[]
+        vin_operations=[]
+        output_operations=[]
+        spent_operations=[]
+        for tran in transactions:
+            tran_entity=tran.to_entity()
+            tran_operations.append(("upsert",int_to_int64(tran_entity.model_dump(exclude_none=True))))
+            
+            for vin in tran.vin:
+                vin_entity=vin.to_entity()
+                vin_operations.append(("upsert",int_to_int64(vin_entity.model_dump(exclude_none=True))))
+                if not vin.is_coinbase():
+                    spent_entity=SpentOutpointEntity.from_vin(vin)
+                    spent_operations.append(("upsert",int_to_int64(spent_entity.model_dump(exclude_none=True))))
+            
+            for output in tran.outputs:
+                output_entity=output.to_entity()
+                output_operations.append(("upsert",int_to_int64(output_entity.model_dump(exclude_none=True))))
+        
+        submit_entity_operations(manager.blockchain_transaction_table,tran_operations)
+        submit_entity_operations(manager.blockchain_transaction_vin_table,vin_operations)
+        submit_entity_operations(manager.blockchain_transaction_output_table,output_operations)
+        submit_entity_operations(manager.blockchain_spent_outpoint_table,spent_operations)
+
+        return transactions
+        
+    except Exception as e:
+        raise
+
+def create_transaction_indexes(transactions: List[Transaction]):
+    """トランザクションのtxidインデックスをまとめて作成(mempoolを指している場合は上書き)する"""
+    try:
+        manager = TableConnectionManager()
+        
+        index_operations=[]
+        for tran in transactions:
+            index_entity=TransactionIndexEntity.from_transaction_entity(tran.to_entity())
+            index_operations.append(("upsert",int_to_int64(index_entity.model_dump(exclude_none=True))))
+        submit_entity_operations(manager.blockchain_transaction_index_table,index_operations)
+        
+        return transactions
+        
+    except Exception as e:
+        raise
+
+def delete_mempool_transactions(transactions: List[Transaction]):
+    """ブロックに取り込まれたトランザクションをmempoolパーティションから削除する"""
+    try:
+        manager = TableConnectionManager()
+        
+        #存在しないエンティティを含むとバッチ全体が失敗するため絞り込む
+        qf = QueryFilter()
+        qf.add_filter(f"PartitionKey eq @PartitionKey", {"PartitionKey": "0"*64})
+        qf.select = ["RowKey"]
+        mempool_entities = manager.blockchain_transaction_table.query_entities(**qf.model_dump())
+        mempool_txids = {e["RowKey"] for e in mempool_entities}
+        submit_entity_operations(
+            manager.blockchain_transaction_table,
+            [("delete",{"PartitionKey":"0"*64,"RowKey":tran.txid}) for tran in transactions if tran.txid in mempool_txids]
+        )
+
+        return transactions
         
     except Exception as e:
         raise
@@ -551,22 +1506,84 @@ def create_transaction_vin(vin: TransactionVin):
     try:
         manager = TableConnectionManager()
 
-        #transaction check
-        tran_entity = get_transaction_entity(vin.spent_block_hash,vin.spent_txid)
-        if not tran_entity:
-            raise ValueError(
-                f"transactionが存在しません。対象のtxid:{vin.spent_block_hash},block hash:{vin.spent_txid}"
-            )
-        
-        #エンティティ作成
+        #エンティティ作成(transactionの存在確認は呼び出し元で行うこと)
         vin_entity = vin.to_entity()
         entity_dict=int_to_int64(vin_entity.model_dump(exclude_none=True))
         manager.blockchain_transaction_vin_table.upsert_entity(entity_dict)
+        
+        #使用済みoutpoint作成
+        if not vin.is_coinbase():
+            create_spent_outpoint(vin)
         return vin
         
     except Exception as e:
         raise
 
+def create_spent_outpoint(vin: TransactionVin) -> SpentOutpointEntity:
+    try:
+        manager = TableConnectionManager()
+        
+        spent_entity = SpentOutpointEntity.from_vin(vin)
+        entity_dict=int_to_int64(spent_entity.model_dump(exclude_none=True))
+        manager.blockchain_spent_outpoint_table.upsert_entity(entity_dict)
+        return spent_entity
+        
+    except Exception as e:
+        raise
+
+def get_spent_outpoint_entity(utxo_txid:str,utxo_vout:int):
+    try:
+        manager = TableConnectionManager()
+        
+        table_entity=manager.blockchain_spent_outpoint_table.get_entity(
+            partition_key=utxo_txid,
+            row_key=f"{utxo_vout:020d}"
+        )
+        return SpentOutpointEntity.model_validate(unwrap_entity_properties(table_entity))
+    
+    except ResourceNotFoundError as e:
+        return None
+        
+    except Exception as e:
+        raise
+
+def backfill_spent_outpoint(utxo_txid:str,utxo_vout:int) -> Optional[SpentOutpointEntity]:
+    """使用済みoutpoint作成前のvin(mempoolを除く)を検索し、見つかった場合は使用済みoutpointを作成する"""
+    try:
+        qf = QueryFilter()
+        qf.add_filter(f"utxo_txid eq @utxo_txid", {"utxo_txid": utxo_txid})
+        qf.add_filter(f"utxo_vout eq {utxo_vout}L")
+        qf.add_filter(f"is_mempool ne {1}L")
+        vin_entities = query_transaction_vin_entity(qf)
+        if not vin_entities:
+            return None
+        if len(vin_entities) > 1:
+            raise Exception(f"内部エラー。指定されたUTXOを使用するvinが複数存在します, utxo:{utxo_txid}, vout:{utxo_vout}")
+        return create_spent_outpoint(vin_entities[0].to_original())
+        
+    except Exception as e:
+        raise
+
+def delete_spent_outpoint(vin_entity:TransactionVinEntity):
+    try:
+        if vin_entity.utxo_txid == "0"*64:
+            return False
+        
+        # 他のトランザクションが使用している場合は削除しない
+        spent_outpoint = get_spent_outpoint_entity(vin_entity.utxo_txid, vin_entity.utxo_vout)
+        if spent_outpoint is None or spent_outpoint.spent_txid != vin_entity.spent_txid:
+            return False
+        
+        manager = TableConnectionManager()
+        manager.blockchain_spent_outpoint_table.delete_entity(
+            partition_key=spent_outpoint.PartitionKey,
+            row_key=spent_outpoint.RowKey
+        )
+        return True
+        
+    except Exception as e:
+        raise
+
 def query_transaction_output_entity(query_filter:QueryFilter):
     try:
         manager = TableConnectionManager()
@@ -581,6 +1598,23 @@ def query_transaction_output_entity(query_filter:QueryFilter):
     except Exception as e:
         raise
 
+def get_transaction_output_entity(txid:str,vout:int):
+    try:
+        manager = TableConnectionManager()
+        
+        table_entity=manager.blockchain_transaction_output_table.get_entity(
+            partition_key=txid,
+            row_key=f"{vout:020d}"
+        )
+        return TransactionOutputEntity.model_validate(unwrap_entity_properties(table_entity))
+    
+    except ResourceNotFoundError as e:
+        print(f"エンティティが見つかりません: {e}")
+        return None
+        
+    except Exception as e:
+        raise
+
 def query_transaction_output(query_filter:QueryFilter):
     try:
         transaction_output_entities=query_transaction_output_entity(query_filter)
@@ -597,14 +1631,7 @@ def create_transaction_output(output: TransactionOutput) -> bool:
     try:
         manager = TableConnectionManager()
 
-        #transaction check
-        tran_entity = get_transaction_entity(output.block_hash,output.txid)
-        if not tran_entity:
-            raise ValueError(
-                f"transactionが存在しません。対象のtxid:{output.block_hash},block hash:{output.txid}"
-            )
-        
-        #エンティティ作成
+        #エンティティ作成(transactionの存在確認は呼び出し元で行うこと)
         output_entity=output.to_entity()
         entity_dict=int_to_int64(output_entity.model_dump(exclude_none=True))
 
@@ -614,11 +1641,50 @@ def create_transaction_output(output: TransactionOutput) -> bool:
     except Exception as e:
         raise 
 
+def get_block_template(max_size: Optional[int] = None, coinbase_txid: Optional[str] = None) -> BlockTemplate:
+    """
+    mempoolから手数料率の高い順にトランザクションを選択し、CURRENTの次のブロックのひな形を作成する
+
+    Args:
+        max_size: coinbaseを除くトランザクションのサイズ合計の上限
+        coinbase_txid: 指定した場合はcoinbaseを含めたmerkle_rootを計算する
+    """
+    try:
+        if max_size is None:
+            max_size = int(os.getenv("BLOCKCHAIN_MAX_BLOCK_SIZE", "1000000")) - int(os.getenv("BLOCKCHAIN_COINBASE_RESERVED_SIZE", "1000"))
+        
+        current_block = get_block_entity("CURRENT", "0"*64)
+        entries = mempool.select_transactions(max_size)
+        
+        # coinbase(position 0)のproofはcoinbase自体のhashに依存しないため仮のleafで計算する
+        leaves = [bytes(32)] + [bytes.fromhex(entry.txid)[::-1] for entry in entries]
+        if coinbase_txid:
+            leaves[0] = bytes.fromhex(coinbase_txid)[::-1]
+        tree = MerkleTree(leaves)
+        
+        return BlockTemplate(
+            height=current_block.height + 1 if current_block else 0,
+            previous_hash=current_block.hash if current_block else "0"*64,
+            bits=os.getenv("BLOCKCHAIN_BITS"),
+            timestamp=int(time.time()),
+            subsidy=int(os.getenv("BLOCKCHAIN_SUBSIDY")),
+            total_fee=sum(entry.fee for entry in entries),
+            size=sum(entry.size for entry in entries),
+            transactions=[entry.transaction for entry in entries],
+            merkle_branch=[h[::-1].hex() for h in tree.get_proof(0)],
+            coinbase_txid=coinbase_txid,
+            merkle_root=tree.root_hex() if coinbase_txid else None,
+        )
+        
+    except Exception as e:
+        raise
+
 def create_transaction_in_mempool(tran: Transaction) :
     try:
         manager = TableConnectionManager()
 
         #Transaction check
+        deferred_checks=[]
         for i,vin in enumerate(tran.vin):
             # NOT COINBASEチェック
             if vin.utxo_txid=="0"*64:
@@ -634,18 +1700,27 @@ def create_transaction_in_mempool(tran: Transaction) :
             if is_spent_utxo(vin.utxo_txid,vin.utxo_vout):
                 raise ValueError(f"指定されたUTXOは利用済みです, utxo:{vin.utxo_txid}, vout:{vin.utxo_vout}")
             
+            # mempoolの他のトランザクションとの競合チェック
+            spending_txid=mempool.get_spending_txid(vin.utxo_txid,vin.utxo_vout)
+            if spending_txid and spending_txid!=tran.txid:
+                raise ValueError(f"指定されたUTXOはmempoolのトランザクションで利用済みです, utxo:{vin.utxo_txid}, vout:{vin.utxo_vout}, txid:{spending_txid}")
+            
             # UTXOの情報を取得してvinに設定
             vin.utxo_block_hash = utxo_output.block_hash
             vin.script_type = utxo_output.script_type
             vin.utxo_script_pubkey=utxo_output.script_pubkey_hex
             vin.utxo_value=utxo_output.value
 
-            #verify signature
-            raw_message=tran.get_hash_raw_message(i)
-            message=tran.hash256_hex(raw_message,False)
-            if not execute_script(vin.script_sig_asm,utxo_output.script_pubkey_asm,message,int(time.time())):
+            #verify script
+            message=tran.get_signature_hash(i).hex()
+            sig_checks=[] if utxo_output.script_type in DEFERRABLE_SCRIPT_TYPES else None
+            if not execute_script(vin.script_sig_hex,utxo_output.script_pubkey_hex,message,int(time.time()),sig_checks=sig_checks,script_type=utxo_output.script_type):
                 raise ValueError(f"署名検証エラーです。script sig:{vin.script_sig_asm},script pubkey:{utxo_output.script_pubkey_asm},script type:{utxo_output.script_type}")
+            deferred_checks.extend([(check,tran,i) for check in sig_checks or []])
         
+        #verify signature
+        verify_deferred_signatures(deferred_checks)
+
         # satoshis check
         tran.balance_check()
             
@@ -654,11 +1729,13 @@ def create_transaction_in_mempool(tran: Transaction) :
         tran_entity= tran.to_entity()
         entity_dict=int_to_int64(tran_entity.model_dump(exclude_none=True))
         manager.blockchain_transaction_table.create_entity(entity_dict)
+        create_transaction_index(tran_entity)
         for vin in tran.vin:
             vin.is_mempool=1
             create_transaction_vin(vin)
         for output in tran.outputs:
             create_transaction_output(output)
+        mempool.add(tran)
         
         return tran
     
@@ -1,36 +1,94 @@
 from azure.data.tables import TableServiceClient
 from azure.identity import DefaultAzureCredential
 from azure.core.exceptions import ResourceExistsError
-from managers.table_manager import TableConnectionManager
-from models.content import Content,ContentTableEntity
+from managers.table_manager import AsyncTableConnectionManager
+from models.content import Content,ContentSummary,ContentTableEntity,PreviewContent
 from models.query import QueryFilter
-from typing import List, Optional, Dict, Any
+from utils.table import query_entities_page
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
+import asyncio
 import json
 import uuid
 from pydantic import BaseModel, Field, EmailStr
 
-def query_contents(
+async def query_contents(
         query_filter:QueryFilter,
         limit: int = 50,
     ) -> List[Content]:
     
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entities = list(manager.contents_table.query_entities(**query_filter.model_dump(),results_per_page=limit))
+        entities = [e async for e in manager.contents_table.query_entities(**query_filter.model_dump(),results_per_page=limit)]
         table_entities=[ContentTableEntity.from_entity(e).to_content() for e in entities]
         
         return table_entities
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
+
+async def query_contents_page(
+        query_filter:QueryFilter,
+        limit: int = 50,
+        continuation_token: Optional[Dict[str,str]] = None,
+    ) -> Tuple[List[Content],Optional[Dict[str,str]]]:
+    """最大limit件のコンテンツと次ページのcontinuation tokenを取得する"""
+    try:
+        manager = AsyncTableConnectionManager()
+        
+        entities,next_token = await query_entities_page(manager.contents_table,query_filter,limit,continuation_token)
+        table_entities=[ContentTableEntity.from_entity(e).to_content() for e in entities]
+        
+        return table_entities,next_token
+        
+    except Exception as e:
+        raise ValueError(f"Error retrieving contents: {str(e)}")
+
+async def query_content_summaries_page(
+        query_filter:QueryFilter,
+        limit: int = 50,
+        continuation_token: Optional[Dict[str,str]] = None,
+    ) -> Tuple[List[ContentSummary],Optional[Dict[str,str]]]:
+    """一覧表示に必要な列だけを射影して、最大limit件のコンテンツと次ページのcontinuation tokenを取得する"""
+    try:
+        manager = AsyncTableConnectionManager()
+        
+        query_filter = query_filter.model_copy(update={"select": ContentSummary.table_columns})
+        entities,next_token = await query_entities_page(manager.contents_table,query_filter,limit,continuation_token)
+        table_entities=[ContentTableEntity.from_entity(e).to_content_summary() for e in entities]
+        
+        return table_entities,next_token
+        
+    except Exception as e:
+        raise ValueError(f"Error retrieving contents: {str(e)}")
     
-def get_content(content_id:str) :
+async def query_content_previews(query_filter:QueryFilter) -> List[PreviewContent]:
+    """保存済みのプレビュー列だけを射影してコンテンツのプレビューを取得する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entity=manager.contents_table.get_entity(partition_key='content',row_key=content_id)
+        query_filter = query_filter.model_copy(update={"select": PreviewContent.table_columns})
+        entities = [e async for e in manager.contents_table.query_entities(**query_filter.model_dump())]
+        table_entities=[ContentTableEntity.from_entity(e) for e in entities]
+        previews=[e.to_preview_content() for e in table_entities]
+        
+        # プレビュー未保存のコンテンツは本文から生成する
+        missing=[i for i,preview in enumerate(previews) if preview is None]
+        contents=await asyncio.gather(*[get_content(table_entities[i].RowKey) for i in missing])
+        for i,content in zip(missing,contents):
+            previews[i]=content.to_preview()
+        
+        return previews
+        
+    except Exception as e:
+        raise ValueError(f"Error retrieving contents: {str(e)}")
+    
+async def get_content(content_id:str) :
+    try:
+        manager = AsyncTableConnectionManager()
+        
+        entity=await manager.contents_table.get_entity(partition_key='content',row_key=content_id)
         content=ContentTableEntity.from_entity(entity).to_content()
         
         return content
@@ -38,40 +96,58 @@ def get_content(content_id:str) :
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
 
-def create_content(content: Content) -> bool:
+async def get_content_preview(content_id:str) -> PreviewContent:
+    """保存済みのプレビュー列だけを射影してコンテンツのプレビューを取得する"""
+    try:
+        manager = AsyncTableConnectionManager()
+        
+        entity=await manager.contents_table.get_entity(partition_key='content',row_key=content_id,select=PreviewContent.table_columns)
+        preview=ContentTableEntity.from_entity(entity).to_preview_content()
+        
+        # プレビュー未保存のコンテンツは本文から生成する
+        if preview is None:
+            content=await get_content(content_id)
+            preview=content.to_preview()
+        
+        return preview
+        
+    except Exception as e:
+        raise ValueError(f"Error retrieving contents: {str(e)}")
+
+async def create_content(content: Content) -> bool:
     """コンテンツの作成または更新"""
 
     try:
-        manager = TableConnectionManager()
-        content_entity=ContentTableEntity.from_content(content)
+        manager = AsyncTableConnectionManager()
+        content_entity=ContentTableEntity.from_content(content).set_preview(content.to_preview())
         
-        manager.contents_table.create_entity(content_entity.model_dump(exclude_none=True))
+        await manager.contents_table.create_entity(content_entity.model_dump(exclude_none=True))
         return True
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
 
-def update_content(content: Content) -> bool:
+async def update_content(content: Content) -> bool:
     """コンテンツの作成"""
 
     try:
-        manager = TableConnectionManager()
-        content_entity=ContentTableEntity.from_content(content)
+        manager = AsyncTableConnectionManager()
+        content_entity=ContentTableEntity.from_content(content).set_preview(content.to_preview())
         
-        manager.contents_table.update_entity(content_entity.model_dump(exclude_none=True))
+        await manager.contents_table.update_entity(content_entity.model_dump(exclude_none=True))
         return True
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
     
 
-def delete_content(content: Content) -> bool:
+async def delete_content(content: Content) -> bool:
     """指定されたIDのコンテンツを削除する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         content_entity=ContentTableEntity.from_content(content)
         
-        manager.contents_table.delete_entity(partition_key=content_entity.PartitionKey,row_key=content_entity.RowKey)
+        await manager.contents_table.delete_entity(partition_key=content_entity.PartitionKey,row_key=content_entity.RowKey)
         return True
         
     except Exception as e:
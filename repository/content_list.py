@@ -0,0 +1,163 @@
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceModifiedError, ResourceExistsError
+from azure.storage.blob import ContentSettings
+from managers.blob_manager import BLOBConnectionManager
+from models.content import PreviewContent
+from typing import List, Optional, Dict, Any, Tuple
+from threading import Lock
+import brotli
+import gzip
+import hashlib
+import json
+import os
+
+# コンテンツ一覧ファイル(JSON)とgzip/brotli版、マニフェストを同じコンテナに保存する
+# マニフェスト: {"list_hash": 全項目のhashから計算したhash, "items": {content_id: {"hash": 項目JSONのhash, "item": 項目}}}
+_lock = Lock()
+MAX_RETRIES = 3
+
+
+def get_blob_names() -> Dict[str, str]:
+    name = os.getenv("CONTENT_LIST_FILE_NAME")
+    return {
+        "list": name,
+        "gzip": f"{name}.gz",
+        "br": f"{name}.br",
+        "manifest": f"{name}.manifest.json",
+    }
+
+
+def get_blob_client(blob_name: str):
+    manager = BLOBConnectionManager()
+    return manager.client.get_blob_client(
+        container=os.getenv("AZURE_BLOB_CONTAINER_NAME", "root"),
+        blob=blob_name,
+    )
+
+
+def hash_json(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def to_item(preview: PreviewContent) -> Dict[str, Any]:
+    return json.loads(preview.model_dump_json())
+
+
+def load_manifest() -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """マニフェストとETagを取得する。存在しない場合は(None, None)"""
+    try:
+        downloader = get_blob_client(get_blob_names()["manifest"]).download_blob()
+        return json.loads(downloader.readall()), downloader.properties.etag
+    except ResourceNotFoundError:
+        return None, None
+
+
+def save_manifest(manifest: Dict[str, Any], etag: Optional[str]) -> None:
+    """ETagが一致する場合のみマニフェストを保存する(他の更新と競合した場合はResourceModifiedError/ResourceExistsError)"""
+    blob_client = get_blob_client(get_blob_names()["manifest"])
+    data = json.dumps(manifest).encode()
+    content_settings = ContentSettings(content_type="application/json")
+    if etag:
+        blob_client.upload_blob(data, overwrite=True, etag=etag, match_condition=MatchConditions.IfNotModified,
+                                content_settings=content_settings)
+    else:
+        blob_client.upload_blob(data, overwrite=False, content_settings=content_settings)
+
+
+def upload_list(items: List[Dict[str, Any]]) -> None:
+    """一覧JSONと圧縮版をContent-Encoding/Cache-Control付きで保存する"""
+    names = get_blob_names()
+    cache_control = os.getenv("CONTENT_LIST_CACHE_CONTROL", "public, max-age=300")
+    contents_list = json.dumps(items).encode()
+    variants = [
+        (names["list"], contents_list, None),
+        (names["gzip"], gzip.compress(contents_list), "gzip"),
+        (names["br"], brotli.compress(contents_list), "br"),
+    ]
+    for blob_name, data, content_encoding in variants:
+        get_blob_client(blob_name).upload_blob(
+            data,
+            overwrite=True,
+            content_settings=ContentSettings(
+                content_type="application/json",
+                content_encoding=content_encoding,
+                cache_control=cache_control,
+            ),
+        )
+
+
+def build_list(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # テーブルの取得順(RowKey順)と同じ並び
+    return [manifest["items"][content_id]["item"] for content_id in sorted(manifest["items"])]
+
+
+def apply_changes(update, rebuild: bool = False, force: bool = False) -> Optional[bool]:
+    """
+    マニフェストにupdate(items)を適用し、一覧に変更があればアップロードする
+    一覧と圧縮版をアップロードしてから、最後にETag条件付きでマニフェストを保存する
+
+    Args:
+        update: マニフェストのitems(content_id -> {"hash", "item"})を更新する関数
+        rebuild: マニフェストを使わずに作り直す場合True
+        force: 変更がない場合もアップロードする場合True
+
+    Returns:
+        アップロードした場合True、変更がない場合False、
+        マニフェストが存在せず作り直しが必要な場合None
+    """
+    with _lock:
+        for _ in range(MAX_RETRIES):
+            manifest, etag = load_manifest()
+            if manifest is None and not rebuild:
+                return None
+            items = {} if rebuild else dict(manifest["items"])
+            update(items)
+
+            new_manifest = {
+                "list_hash": hash_json([[content_id, items[content_id]["hash"]] for content_id in sorted(items)]),
+                "items": items,
+            }
+            if not force and manifest is not None and new_manifest["list_hash"] == manifest.get("list_hash"):
+                return False
+
+            # マニフェストは一覧のアップロード後に保存する(途中で失敗しても次回の更新で再アップロードされる)
+            upload_list(build_list(new_manifest))
+            try:
+                save_manifest(new_manifest, etag)
+            except (ResourceModifiedError, ResourceExistsError):
+                # 競合した更新を取り込んで一覧を再アップロードする
+                continue
+            return True
+
+        raise ValueError("コンテンツ一覧ファイルの更新が競合しました")
+
+
+def upsert_previews(previews: List[PreviewContent]) -> Optional[bool]:
+    """コンテンツの作成/更新時に該当する項目だけを更新する"""
+    def update(items: Dict[str, Any]):
+        for preview in previews:
+            item = to_item(preview)
+            item_hash = hash_json(item)
+            current = items.get(str(preview.id))
+            if current is None or current["hash"] != item_hash:
+                items[str(preview.id)] = {"hash": item_hash, "item": item}
+
+    return apply_changes(update)
+
+
+def delete_preview(content_id: str) -> Optional[bool]:
+    """コンテンツの削除時に該当する項目を削除する"""
+    def update(items: Dict[str, Any]):
+        items.pop(str(content_id), None)
+
+    return apply_changes(update)
+
+
+def rebuild(previews: List[PreviewContent], force: bool = False) -> bool:
+    """全コンテンツから作り直す(forceがFalseで内容が同じ場合はアップロードしない)"""
+    def update(items: Dict[str, Any]):
+        for preview in previews:
+            item = to_item(preview)
+            items[str(preview.id)] = {"hash": hash_json(item), "item": item}
+
+    return apply_changes(update, rebuild=True, force=force)
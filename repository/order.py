@@ -1,96 +1,107 @@
 from azure.data.tables import TableServiceClient,UpdateMode
 from azure.identity import DefaultAzureCredential
 from azure.core.exceptions import ResourceExistsError
-from managers.table_manager import TableConnectionManager
+from managers.table_manager import AsyncTableConnectionManager
 from models.order import Order,OrderTableEntity,OrderStatus,OrderItem
+from models.user import User
+from models.content import Content
 from models.query import QueryFilter
+from utils.table import query_entities_page
 from repository import user as user_repo
 from repository import content as content_repo
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
+import asyncio
 import json
 import uuid
 
 
-def query_orders(
+async def query_orders_page(
         query_filter:QueryFilter,
         limit: int = 50,
-    ) :
+        continuation_token: Optional[Dict[str,str]] = None,
+    ) -> Tuple[List[Order],Optional[Dict[str,str]]]:
+    """最大limit件の注文情報と次ページのcontinuation tokenを取得する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entities = list(manager.order_table.query_entities(**query_filter.model_dump(),results_per_page=limit))
+        entities,next_token = await query_entities_page(manager.order_table,query_filter,limit,continuation_token)
         table_entities=[OrderTableEntity.from_entity(e) for e in entities]
-        orders:List[Order]=[]
+        users,contents=await load_users_and_contents(table_entities)
+        orders:List[Order]=[
+            order_entity.to_order(users[order_entity.user_id],contents[order_entity.content_id])
+            for order_entity in table_entities
+        ]
         
-        for order_entity in table_entities:
-            user=user_repo.get_user(order_entity.user_id)
-            content=content_repo.get_content(order_entity.content_id)
-            deserialized_created_at = datetime.fromisoformat(order_entity.created_at) if order_entity.created_at else None
-            deserialized_updated_at = datetime.fromisoformat(order_entity.updated_at) if order_entity.updated_at else None
-            order=Order(id=order_entity.RowKey,user=user,content=content,created_at=deserialized_created_at,updated_at=deserialized_updated_at,
-            checkout_status=order_entity.checkout_status,quantity=order_entity.quantity)
-            orders.append(order)
-        
-        return orders
+        return orders,next_token
         
     except Exception as e:
         raise ValueError(f"Error retrieving users: {str(e)}")
 
-def get_order(order_id:str):
+async def get_order(order_id:str):
     """注文情報を取得する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entity=manager.order_table.get_entity(partition_key='order',row_key=order_id)
+        entity=await manager.order_table.get_entity(partition_key='order',row_key=order_id)
         order_entity=OrderTableEntity.from_entity(entity)
         
-        user=user_repo.get_user(order_entity.user_id)
-        content=content_repo.get_content(order_entity.content_id)
-        deserialized_created_at = datetime.fromisoformat(order_entity.created_at) if order_entity.created_at else None
-        deserialized_updated_at = datetime.fromisoformat(order_entity.updated_at) if order_entity.updated_at else None
-        order=Order(id=order_entity.RowKey,user=user,content=content,created_at=deserialized_created_at,updated_at=deserialized_updated_at,
-                    checkout_status=order_entity.checkout_status,quantity=order_entity.quantity)
+        users,contents=await load_users_and_contents([order_entity])
+        order=order_entity.to_order(users[order_entity.user_id],contents[order_entity.content_id])
         
         return order
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
 
-def create_order(order: Order) -> bool:
+async def load_users_and_contents(order_entities:List[OrderTableEntity]) -> Tuple[Dict[str,User],Dict[str,Content]]:
+    """注文に紐づくユーザーとコンテンツを重複なく並行して取得する"""
+    user_ids=list(dict.fromkeys(e.user_id for e in order_entities))
+    content_ids=list(dict.fromkeys(e.content_id for e in order_entities))
+    
+    results=await asyncio.gather(
+        *[user_repo.get_user(user_id) for user_id in user_ids],
+        *[content_repo.get_content(content_id) for content_id in content_ids],
+    )
+    users=dict(zip(user_ids,results[:len(user_ids)]))
+    contents=dict(zip(content_ids,results[len(user_ids):]))
+    
+    return users,contents
+
+async def create_order(order: Order) -> bool:
     """新しい注文を作成する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         order.update_timestamp('create')
         order_entity=OrderTableEntity.from_order(order)
         
-        manager.order_table.create_entity(order_entity.model_dump(exclude_none=True))
+        await manager.order_table.create_entity(order_entity.model_dump(exclude_none=True))
         return True
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
     
     
-def update_order_status(order_id:str,status: OrderStatus) :
+async def update_order_status(order_id:str,status: OrderStatus) :
     """注文ステータスをアップデートする"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entity=manager.order_table.get_entity(partition_key='order',row_key=order_id)
+        entity=await manager.order_table.get_entity(partition_key='order',row_key=order_id)
         entity["checkout_status"]=status
         entity["updated_at"]=datetime.now().isoformat()
-        manager.order_table.update_entity(mode=UpdateMode.MERGE, entity=entity)
+        await manager.order_table.update_entity(mode=UpdateMode.MERGE, entity=entity)
         order_item=OrderTableEntity.from_entity(entity).to_order_item()
         return order_item
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
     
-def delete_order(order_id: str) -> bool:
+async def delete_order(order_id: str) -> bool:
     """注文情報を削除する"""
     try:
-        manager = TableConnectionManager()
-        manager.order_table.delete_entity(partition_key='order',row_key=order_id)
+        manager = AsyncTableConnectionManager()
+        await manager.order_table.delete_entity(partition_key='order',row_key=order_id)
         return True
         
     except Exception as e:
@@ -1,64 +1,67 @@
 from azure.data.tables import TableServiceClient
 from azure.identity import DefaultAzureCredential
 from azure.core.exceptions import ResourceExistsError
-from managers.table_manager import TableConnectionManager
+from managers.table_manager import AsyncTableConnectionManager
 from models.user import User, UserTableEntity
 from models.query import QueryFilter
-from typing import List, Optional, Dict, Any
+from utils.table import query_entities_page
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 import json
 import uuid
 
 
-def query_users(
+async def query_users_page(
         query_filter:QueryFilter,
         limit: int = 50,
-    ) :
+        continuation_token: Optional[Dict[str,str]] = None,
+    ) -> Tuple[List[User],Optional[Dict[str,str]]]:
+    """最大limit件のユーザーと次ページのcontinuation tokenを取得する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entities = list(manager.user_table.query_entities(**query_filter.model_dump(),results_per_page=limit))
+        entities,next_token = await query_entities_page(manager.user_table,query_filter,limit,continuation_token)
         table_entities=[UserTableEntity.from_entity(e).to_user() for e in entities]
         
-        return table_entities
+        return table_entities,next_token
         
     except Exception as e:
         raise ValueError(f"Error retrieving users: {str(e)}")
     
 
-def create_user(user: User) -> bool:
+async def create_user(user: User) -> bool:
     """新しいユーザーを作成する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         user.set_timestamp('create')
         user_entity=UserTableEntity.from_user(user)
         
-        manager.user_table.create_entity(user_entity.model_dump(exclude_none=True))
+        await manager.user_table.create_entity(user_entity.model_dump(exclude_none=True))
         return True
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")
 
-def get_user(user_id: str):
+async def get_user(user_id: str):
     """ユーザーを取得する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         
-        entity=manager.user_table.get_entity(partition_key='user',row_key=user_id)
+        entity=await manager.user_table.get_entity(partition_key='user',row_key=user_id)
         user = UserTableEntity.from_entity(entity).to_user()
         return user
         
     except Exception as e:
         raise ValueError(f"Error retrieving contents: {str(e)}")  
 
-def update_user(user: User) -> bool:
+async def update_user(user: User) -> bool:
     """ユーザーを更新する"""
     try:
-        manager = TableConnectionManager()
+        manager = AsyncTableConnectionManager()
         user.set_timestamp('update')
         user_entity=UserTableEntity.from_user(user)
         
-        manager.user_table.update_entity(user_entity.model_dump(exclude_none=True))
+        await manager.user_table.update_entity(user_entity.model_dump(exclude_none=True))
         return True
         
     except Exception as e:
@@ -66,11 +69,11 @@ def update_user(user: User) -> bool:
 
 
 
-def delete_user(user_id: str) -> bool:
+async def delete_user(user_id: str) -> bool:
     """ユーザーを削除する"""
     try:
-        manager = TableConnectionManager()
-        manager.user_table.delete_entity(partition_key='user',row_key=user_id)
+        manager = AsyncTableConnectionManager()
+        await manager.user_table.delete_entity(partition_key='user',row_key=user_id)
         return True
         
     except Exception as e:
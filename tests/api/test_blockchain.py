@@ -2,6 +2,8 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 from api import app
+from models.blockchain import Transaction, TransactionVin, TransactionOutput
+from repository.blockchain import Mempool
 
 
 @pytest.fixture
@@ -340,4 +342,282 @@ class TestGetTransactionMempoolList:
             response = client.get("/blockchain/transaction/mempool/list")
 
             assert response.status_code == 500
-            assert "内部サーバーエラー" in response.json()["detail"]
\ No newline at end of file
+            assert "内部サーバーエラー" in response.json()["detail"]
+
+class TestPostTransaction:
+    """post_transaction APIのテストクラス"""
+
+    def test_valid_txid(self, client):
+        """txidがシリアライズ結果のhashと一致する場合のテスト"""
+        transaction = {
+            "txid": "f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16",
+            "version": 1,
+            "locktime": 0,
+            "vin": [
+                {
+                    "utxo_txid": "0437cd7f8525ceed2324359c2d0ba26006d92d856a9c20fa0241106ee5a597c9",
+                    "utxo_vout": 0,
+                    "sequence": 4294967295,
+                    "script_sig_hex": "47304402204e45e16932b8af514961a1d3a1a25fdf3f4f7732e9d624c6c61548ab5fb8cd410220181522ec8eca07de4860a4acdd12909d831cc56cbbac4622082221a8768d1d0901"
+                }
+            ],
+            "outputs": [
+                {
+                    "value": 1000000000,
+                    "script_pubkey_hex": "4104ae1a62fe09c5f51b13905f07f06b99a2f7159b2225f374cd378d71302fa28414e7aab37397f554a7df5f142c21c1b7303b8a0626f1baded5c72a704f7e6cd84cac"
+                },
+                {
+                    "value": 4000000000,
+                    "script_pubkey_hex": "410411db93e1dcdb8a016b49840f8c53bc1eb68a382e97b1482ecad7b148a6909a5cb2e0eaddfb84ccf9744464f82e160bfa9b8b64f9d4c03f999b8643f656b412a3ac"
+                }
+            ]
+        }
+
+        response = client.post("/blockchain/transaction", json=transaction)
+
+        assert response.status_code == 200
+        assert response.json()["txid"] == transaction["txid"]
+
+    def test_invalid_txid(self, client, sample_transaction):
+        """txidがシリアライズ結果のhashと一致しない場合のテスト"""
+        sample_transaction["txid"] = "0" * 63 + "1"
+
+        response = client.post("/blockchain/transaction", json=sample_transaction)
+
+        assert response.status_code == 422
+        assert "txidが正しくないです" in response.text
+
+
+class TestGetTransactionProof:
+    """get_transaction_proof APIのテストクラス"""
+
+    txids = [
+        "b1fea52486ce0c62bb442b530a3f0132b826c74e473d1f2c220bfa78111c5082",
+        "f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16",
+    ]
+    block_hash = "00000000d1145790a8694403d4063f323d499e655c83426834d4ce2f8dd4a2ee"
+    merkle_root = "7dac2c5666815c17a3b36427de37bb9d2e2c5ccec3f8633eb91a4205cb4c10ff"
+
+    def transaction_entities(self):
+        entities = []
+        for position, txid in enumerate(self.txids):
+            entity = MagicMock()
+            entity.txid = txid
+            entity.block_hash = self.block_hash
+            entity.position = position
+            entities.append(entity)
+        return entities
+
+    def test_get_proof_success(self, client):
+        """Merkle proofの取得テスト"""
+        entities = self.transaction_entities()
+        block_entity = MagicMock()
+        block_entity.merkle_root = self.merkle_root
+
+        with patch('repository.blockchain.get_transaction_entity_by_txid') as mock_get_transaction_entity, \
+             patch('repository.blockchain.query_transaction_entity') as mock_query, \
+             patch('repository.blockchain.get_block_entity') as mock_get_block_entity:
+            mock_get_transaction_entity.return_value = entities[1]
+            mock_query.return_value = entities
+            mock_get_block_entity.return_value = block_entity
+
+            response = client.get(f"/blockchain/transaction/proof?txid={self.txids[1]}")
+
+            assert response.status_code == 200
+            result = response.json()
+            assert result["position"] == 1
+            assert result["merkle_root"] == self.merkle_root
+            assert result["branch"] == [self.txids[0]]
+            mock_get_transaction_entity.assert_called_once_with(self.txids[1])
+
+    def test_transaction_round_trip(self, client, sample_transaction):
+        """取得したトランザクション(positionを含む)をそのまま送信できるテスト"""
+        transaction = Transaction.model_validate(sample_transaction)
+        transaction.position = 1
+
+        with patch('repository.blockchain.get_transaction') as mock_get_transaction:
+            mock_get_transaction.return_value = transaction
+
+            response = client.get(f"/blockchain/transaction?txid={transaction.txid}")
+
+            assert response.status_code == 200
+            fetched = response.json()
+            assert fetched["position"] == 1
+
+        body = {**sample_transaction, "position": fetched["position"]}
+        response = client.post("/blockchain/transaction", json=body)
+
+        assert response.status_code == 200
+        assert response.json()["txid"] == transaction.txid
+        assert response.json()["position"] is None
+
+    def test_get_proof_mempool(self, client):
+        """mempoolのトランザクションのテスト"""
+        entity = self.transaction_entities()[0]
+        entity.block_hash = "0" * 64
+
+        with patch('repository.blockchain.get_transaction_entity_by_txid') as mock_get_transaction_entity:
+            mock_get_transaction_entity.return_value = entity
+
+            response = client.get(f"/blockchain/transaction/proof?txid={self.txids[0]}")
+
+            assert response.status_code == 400
+            assert "mempool" in response.json()["detail"]
+
+
+
+class TestGetBlockTemplate:
+    """get_block_template APIのテストクラス"""
+
+    # 170 blockのcoinbaseとHal Finneyへの送金トランザクション
+    coinbase_txid = TestGetTransactionProof.txids[0]
+    merkle_root = TestGetTransactionProof.merkle_root
+
+    def mempool(self, fee=0):
+        transaction = Transaction.model_validate({
+            "txid": "f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16",
+            "version": 1,
+            "locktime": 0,
+            "fee": fee,
+            "vin": [
+                {
+                    "utxo_txid": "0437cd7f8525ceed2324359c2d0ba26006d92d856a9c20fa0241106ee5a597c9",
+                    "utxo_vout": 0,
+                    "sequence": 4294967295,
+                    "script_sig_hex": "47304402204e45e16932b8af514961a1d3a1a25fdf3f4f7732e9d624c6c61548ab5fb8cd410220181522ec8eca07de4860a4acdd12909d831cc56cbbac4622082221a8768d1d0901"
+                }
+            ],
+            "outputs": [
+                {
+                    "value": 1000000000,
+                    "script_pubkey_hex": "4104ae1a62fe09c5f51b13905f07f06b99a2f7159b2225f374cd378d71302fa28414e7aab37397f554a7df5f142c21c1b7303b8a0626f1baded5c72a704f7e6cd84cac"
+                },
+                {
+                    "value": 4000000000,
+                    "script_pubkey_hex": "410411db93e1dcdb8a016b49840f8c53bc1eb68a382e97b1482ecad7b148a6909a5cb2e0eaddfb84ccf9744464f82e160bfa9b8b64f9d4c03f999b8643f656b412a3ac"
+                }
+            ]
+        })
+        mempool = Mempool()
+        mempool.add(transaction)
+        return mempool
+
+    @staticmethod
+    def make_transaction(utxo_txid, utxo_vout, fee, value=1000):
+        """1入力1出力のトランザクション(サイズは62バイト)"""
+        body = {
+            "version": 1,
+            "locktime": 0,
+            "fee": fee,
+            "vin": [{"utxo_txid": utxo_txid, "utxo_vout": utxo_vout, "sequence": 4294967295, "script_sig_hex": "51"}],
+            "outputs": [{"value": value, "script_pubkey_hex": "51"}],
+        }
+        draft = Transaction.model_construct(
+            version=1,
+            locktime=0,
+            vin=[TransactionVin.model_validate(v) for v in body["vin"]],
+            outputs=[TransactionOutput.model_validate(o) for o in body["outputs"]],
+        )
+        return Transaction.model_validate({**body, "txid": draft.txid_bytes()[::-1].hex()})
+
+    @staticmethod
+    def mempool_of(*transactions):
+        mempool = Mempool()
+        for transaction in transactions:
+            mempool.add(transaction)
+        mempool.loaded = True
+        return mempool
+
+    def get_template(self, client, mempool, query=""):
+        with patch('repository.blockchain.mempool', mempool), \
+             patch('repository.blockchain.Mempool.refresh'), \
+             patch('repository.blockchain.get_block_entity') as mock_get_block_entity, \
+             patch.dict('os.environ', {"BLOCKCHAIN_BITS": "1D00FFFF", "BLOCKCHAIN_SUBSIDY": "5000000000"}):
+            mock_get_block_entity.return_value = self.current_block_entity()
+
+            response = client.get(f"/blockchain/block/template{query}")
+
+            assert response.status_code == 200
+            return response.json()
+
+    def current_block_entity(self):
+        entity = MagicMock()
+        entity.hash = "000000002a22cfee1f2c846adbd12b3e183d4f97683f85dad08a79780a84bd55"
+        entity.height = 169
+        return entity
+
+    def test_get_template_with_coinbase(self, client):
+        """coinbase_txidを指定した場合のテスト"""
+        with patch('repository.blockchain.mempool', self.mempool()), \
+             patch('repository.blockchain.Mempool.refresh'), \
+             patch('repository.blockchain.get_block_entity') as mock_get_block_entity, \
+             patch.dict('os.environ', {"BLOCKCHAIN_BITS": "1D00FFFF", "BLOCKCHAIN_SUBSIDY": "5000000000"}):
+            mock_get_block_entity.return_value = self.current_block_entity()
+
+            response = client.get(f"/blockchain/block/template?coinbase_txid={self.coinbase_txid}")
+
+            assert response.status_code == 200
+            result = response.json()
+            assert result["height"] == 170
+            assert result["previous_hash"] == self.current_block_entity().hash
+            assert [t["txid"] for t in result["transactions"]] == ["f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16"]
+            assert result["merkle_root"] == self.merkle_root
+            assert result["merkle_branch"] == ["f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16"]
+
+    def test_get_template_max_size(self, client):
+        """max_sizeを超えるトランザクションを含めないテスト"""
+        with patch('repository.blockchain.mempool', self.mempool(fee=10000)), \
+             patch('repository.blockchain.Mempool.refresh'), \
+             patch('repository.blockchain.get_block_entity') as mock_get_block_entity, \
+             patch.dict('os.environ', {"BLOCKCHAIN_BITS": "1D00FFFF", "BLOCKCHAIN_SUBSIDY": "5000000000"}):
+            mock_get_block_entity.return_value = self.current_block_entity()
+
+            response = client.get("/blockchain/block/template?max_size=100")
+
+            assert response.status_code == 200
+            result = response.json()
+            assert result["transactions"] == []
+            assert result["total_fee"] == 0
+            assert result["merkle_branch"] == []
+            assert result["merkle_root"] is None
+
+    def test_get_template_fee_rate_order(self, client):
+        """手数料率の高い順に並ぶテスト"""
+        low = self.make_transaction("aa" * 32, 0, 100)
+        high = self.make_transaction("aa" * 32, 1, 300)
+        middle = self.make_transaction("aa" * 32, 2, 200)
+
+        result = self.get_template(client, self.mempool_of(low, high, middle))
+
+        assert [t["txid"] for t in result["transactions"]] == [high.txid, middle.txid, low.txid]
+        assert result["total_fee"] == 600
+        assert result["size"] == 62 * 3
+
+    def test_get_template_ancestor_package(self, client):
+        """手数料の低い親を、手数料の高い子とまとめて(親を先に)選択するテスト"""
+        parent = self.make_transaction("aa" * 32, 0, 0)
+        child = self.make_transaction(parent.txid, 0, 1000)
+        other = self.make_transaction("aa" * 32, 1, 300)
+        mempool = self.mempool_of(child, other, parent)
+
+        result = self.get_template(client, mempool)
+        assert [t["txid"] for t in result["transactions"]] == [parent.txid, child.txid, other.txid]
+
+        # パッケージ(親子)の手数料率(1000/124)が単独の300/62より高い
+        result = self.get_template(client, mempool, "?max_size=124")
+        assert [t["txid"] for t in result["transactions"]] == [parent.txid, child.txid]
+
+    def test_get_template_excludes_conflicts(self, client):
+        """ブロックに取り込まれたトランザクションと競合するトランザクションと子孫を含めないテスト"""
+        conflict = self.make_transaction("aa" * 32, 0, 100)
+        descendant = self.make_transaction(conflict.txid, 0, 5000)
+        other = self.make_transaction("aa" * 32, 1, 50)
+        mempool = self.mempool_of(conflict, descendant, other)
+
+        block = MagicMock()
+        block.transactions = [self.make_transaction("aa" * 32, 0, 10, value=900)]
+        mempool.connect_block(block)
+
+        result = self.get_template(client, mempool)
+        assert [t["txid"] for t in result["transactions"]] == [other.txid]
+        assert ("aa" * 32, 0) not in mempool.by_outpoint
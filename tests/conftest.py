@@ -9,6 +9,9 @@ def load_env_from_json():
     # conftest.py の場所を基準にプロジェクトルートを探す
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     settings_path = os.path.join(base_dir, 'local.settings.json')
+    # 設定ファイルはリポジトリに含めないため、ない場合は環境変数のみを使う
+    if not os.path.exists(settings_path):
+        return
     
     with open(settings_path, 'r') as f:
         settings = json.load(f)
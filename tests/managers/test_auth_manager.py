@@ -0,0 +1,93 @@
+import json
+import time
+import jwt
+import pytest
+from unittest.mock import patch
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from managers.auth_manager import AuthManager
+
+TENANT_ID = "tenant"
+AUDIENCE = "api-app-id"
+ISSUER = f"https://{TENANT_ID}.ciamlogin.com/{TENANT_ID}/v2.0"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def make_jwk(kid: str):
+    jwk = json.loads(RSAAlgorithm.to_jwk(PRIVATE_KEY.public_key()))
+    jwk.update(kid=kid, use="sig")
+    return jwk
+
+
+def make_token(kid: str = "key1", **claims):
+    now = int(time.time())
+    payload = {"sub": "user", "aud": AUDIENCE, "iss": ISSUER, "iat": now - 10, "nbf": now - 10, "exp": now + 600}
+    payload.update(claims)
+    return jwt.encode(payload, PRIVATE_KEY, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def jwks_fetch():
+    """JWKSの取得をモックし、新しいAuthManagerのインスタンスを使用する"""
+    with patch.object(AuthManager, "_get_jwt_keys", return_value=[make_jwk("key1")]) as mock_get_jwt_keys, \
+         patch.dict("os.environ", {"AZURE_B2C_TENANT_ID": TENANT_ID, "AZURE_API_APP_ID": AUDIENCE,
+                                   "AUTH_JWKS_REFRESH_INTERVAL_SECONDS": "60"}), \
+         patch.object(AuthManager, "_instance", None):
+        yield mock_get_jwt_keys
+
+
+class TestJWKSRefresh:
+    """検証キー(JWKS)の再取得のテストクラス"""
+
+    def test_unknown_kid_refreshes_once_per_interval(self, jwks_fetch):
+        """未知のkidによる即時再取得はrefresh_intervalに1回までのテスト"""
+        manager = AuthManager()
+        assert jwks_fetch.call_count == 1
+
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                manager.verify_jwt_token(make_token(kid="unknown"))
+
+        assert jwks_fetch.call_count == 2
+
+    def test_expired_token_does_not_fetch_jwks(self, jwks_fetch):
+        """期限切れのトークンでは検証キーを再取得しないテスト"""
+        manager = AuthManager()
+
+        for _ in range(5):
+            with pytest.raises(Exception) as e:
+                manager.verify_jwt_token(make_token(exp=int(time.time()) - 600))
+            assert e.value.status_code == 401
+
+        assert jwks_fetch.call_count == 1
+
+
+class TestTokenCache:
+    """検証済みトークンのキャッシュのテストクラス"""
+
+    def test_cached_payload_is_copied(self, jwks_fetch):
+        """返されたクレームを変更してもキャッシュに影響しないテスト"""
+        manager = AuthManager()
+        token = make_token()
+
+        decoded = manager.verify_jwt_token(token)
+        decoded["sub"] = "other"
+        cached = manager.verify_jwt_token(token)
+        cached["sub"] = "other"
+
+        assert manager.verify_jwt_token(token)["sub"] == "user"
+
+    @pytest.mark.parametrize("env", [
+        {"AZURE_API_APP_ID": "other-app-id"},
+        {"AZURE_B2C_TENANT_ID": "other-tenant"},
+    ])
+    def test_cache_hit_rejects_wrong_aud_or_iss(self, jwks_fetch, env):
+        """キャッシュ済みのトークンでもaud/issが一致しない場合は拒否するテスト"""
+        manager = AuthManager()
+        token = make_token()
+        manager.verify_jwt_token(token)
+
+        with patch.dict("os.environ", env):
+            with pytest.raises(Exception) as e:
+                manager.verify_jwt_token(token)
+            assert e.value.status_code == 401
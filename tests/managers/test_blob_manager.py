@@ -0,0 +1,62 @@
+import datetime
+import pytest
+from unittest.mock import MagicMock, patch
+from managers.blob_manager import BLOBConnectionManager
+from utils.cache import LRUCache
+
+NOW = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def manager():
+    """接続文字列を解析せずにSAS URLのキャッシュだけを持つBLOBConnectionManager"""
+    instance = object.__new__(BLOBConnectionManager)
+    instance.client = MagicMock()
+    instance.client.get_blob_client.return_value.url = "https://account.blob.core.windows.net/private/a.png"
+    instance.account_name = "account"
+    instance.account_key = "key"
+    instance.sas_refresh_margin = datetime.timedelta(minutes=5)
+    instance._sas_cache = LRUCache(16)
+    with patch("managers.blob_manager.generate_blob_sas", side_effect=lambda **kwargs: f"se={kwargs['expiry'].isoformat()}") as mock_generate:
+        yield instance, mock_generate
+
+
+class TestSasUrlCache:
+    """SAS URLのキャッシュのテストクラス"""
+
+    def test_cache_hit(self, manager):
+        """有効期間の半分が過ぎるまでは同じSAS URLを返すテスト"""
+        instance, mock_generate = manager
+        url = instance._get_sas_url("private", "a.png", NOW)
+
+        assert instance._get_sas_url("private", "a.png", NOW + datetime.timedelta(minutes=29)) == url
+        mock_generate.assert_called_once()
+
+    def test_reissue_after_half_lifetime(self, manager):
+        """残りの有効期間が半分を切った場合は署名し直すテスト"""
+        instance, mock_generate = manager
+        url = instance._get_sas_url("private", "a.png", NOW)
+
+        later = NOW + datetime.timedelta(minutes=31)
+        reissued = instance._get_sas_url("private", "a.png", later)
+        assert reissued != url
+        assert mock_generate.call_count == 2
+        assert mock_generate.call_args.kwargs["expiry"] == later + instance.sas_lifetime
+
+    def test_longer_margin_used(self, manager):
+        """BLOB_SAS_REFRESH_MARGIN_SECONDSが有効期間の半分より長い場合はその秒数を使うテスト"""
+        instance, mock_generate = manager
+        instance.sas_refresh_margin = datetime.timedelta(minutes=45)
+        instance._get_sas_url("private", "a.png", NOW)
+
+        instance._get_sas_url("private", "a.png", NOW + datetime.timedelta(minutes=16))
+        assert mock_generate.call_count == 2
+
+    def test_cache_per_blob(self, manager):
+        """blob名ごとに別のSAS URLをキャッシュするテスト"""
+        instance, mock_generate = manager
+        instance._get_sas_url("private", "a.png", NOW)
+        instance._get_sas_url("private", "b.png", NOW)
+        instance._get_sas_url("private", "a.png", NOW)
+
+        assert mock_generate.call_count == 2
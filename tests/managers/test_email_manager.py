@@ -0,0 +1,57 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from managers.email_manager import EmailDispatcher
+
+
+def make_client(send_delay: float = 0.0):
+    client = MagicMock()
+
+    async def begin_send(message):
+        await asyncio.sleep(send_delay)
+
+    client.begin_send = AsyncMock(side_effect=begin_send)
+    client.close = AsyncMock()
+    return client
+
+
+class TestEmailDispatcherShutdown:
+    """EmailDispatcherの終了処理のテストクラス"""
+
+    def test_shutdown_sends_queued_messages(self):
+        """終了時にキューに残ったメッセージを送信してからクライアントを閉じるテスト"""
+        client = make_client(send_delay=0.01)
+
+        async def run():
+            with patch("managers.email_manager.AsyncEmailClient.from_connection_string", return_value=client):
+                dispatcher = EmailDispatcher()
+                for i in range(10):
+                    await dispatcher.enqueue({"id": i})
+                drained = await EmailDispatcher.shutdown(timeout=5)
+            return drained, dispatcher
+
+        drained, dispatcher = asyncio.run(run())
+
+        assert drained is True
+        assert client.begin_send.await_count == 10
+        assert dispatcher.metrics["sent"] == 10
+        assert dispatcher.workers == []
+        client.close.assert_awaited_once()
+
+    def test_shutdown_timeout(self):
+        """送信が終わらない場合はtimeout秒で打ち切るテスト"""
+        client = make_client(send_delay=10)
+
+        async def run():
+            with patch("managers.email_manager.AsyncEmailClient.from_connection_string", return_value=client):
+                dispatcher = EmailDispatcher()
+                await dispatcher.enqueue({"id": 0})
+                return await EmailDispatcher.shutdown(timeout=0.05)
+
+        assert asyncio.run(run()) is False
+        client.close.assert_awaited_once()
+
+    def test_shutdown_without_instance(self):
+        """インスタンスが作成されていない場合は何もしないテスト"""
+        with patch("managers.email_manager.AsyncEmailClient.from_connection_string") as from_connection_string:
+            assert asyncio.run(EmailDispatcher.shutdown(timeout=1)) is True
+        from_connection_string.assert_not_called()
@@ -0,0 +1,63 @@
+import pytest
+from models.blockchain import Transaction, TransactionVin, TransactionOutput
+from utils.blockchain import hash256
+
+
+def make_transaction(vin_count):
+    """入力ごとにutxoとscript_pubkeyが異なるトランザクション"""
+    return Transaction.model_construct(
+        version=1,
+        locktime=0,
+        vin=[
+            TransactionVin.model_validate({
+                "utxo_txid": f"{i + 1:02x}" * 32,
+                "utxo_vout": i,
+                "utxo_script_pubkey": "76a914" + f"{i + 1:02x}" * 20 + "88ac",
+                "sequence": 4294967295 - i,
+                "script_sig_hex": "51",
+            })
+            for i in range(vin_count)
+        ],
+        outputs=[
+            TransactionOutput.model_validate({"value": 1000, "script_pubkey_hex": "51"}),
+            TransactionOutput.model_validate({"value": 2000, "script_pubkey_hex": "52"}),
+        ],
+    )
+
+
+def serialize_for_signature(transaction, target_index):
+    """キャッシュを使わずに署名メッセージを組み立てる"""
+    data = transaction.version.to_bytes(4, "little") + bytes([len(transaction.vin)])
+    for i, vin in enumerate(transaction.vin):
+        data += bytes.fromhex(vin.get_unsigned_data(i == target_index))
+    data += bytes([len(transaction.outputs)])
+    for output in transaction.outputs:
+        data += output.serialize()
+    return data + transaction.locktime.to_bytes(4, "little") + (1).to_bytes(4, "little")
+
+
+class TestSignatureHash:
+    """midstateを共有する署名メッセージのテストクラス"""
+
+    @pytest.mark.parametrize("vin_count", [1, 3, 5])
+    def test_matches_raw_message(self, vin_count):
+        """全入力でget_signature_hashがget_hash_raw_messageのhash256と一致するテスト"""
+        transaction = make_transaction(vin_count)
+
+        for i in range(vin_count):
+            raw_message = transaction.get_hash_raw_message(i)
+            assert raw_message == serialize_for_signature(transaction, i).hex()
+            assert transaction.get_signature_hash(i) == hash256(bytes.fromhex(raw_message))
+
+    def test_out_of_order_access(self):
+        """後ろの入力から計算してもmidstateが正しく共有されるテスト"""
+        transaction = make_transaction(4)
+        expected = [hash256(serialize_for_signature(transaction, i)) for i in range(4)]
+
+        assert [transaction.get_signature_hash(i) for i in [3, 0, 2, 1]] == [expected[i] for i in [3, 0, 2, 1]]
+
+    def test_hashes_differ_per_input(self):
+        """入力ごとに異なる署名メッセージになるテスト"""
+        transaction = make_transaction(3)
+
+        assert len({transaction.get_signature_hash(i) for i in range(3)}) == 3
@@ -0,0 +1,64 @@
+import uuid
+from datetime import datetime, timezone
+from models.content import Content, ContentTableEntity, PreviewContent
+
+HTML = "<p>導入</p><h2>見出し</h2><p>本文1</p><p>本文2</p><h2>次の見出し</h2><p>続き</p>"
+
+
+def make_content(content_html=HTML):
+    return Content(
+        id=uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        title_no=1,
+        title="タイトル",
+        content_text="本文",
+        content_html=content_html,
+        image_url="https://example.com/a.png",
+        price=100,
+        category="tech",
+        tags=["a", "b"],
+        publish_date=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        preview_speech_url="https://example.com/preview.mp3",
+        full_speech_url="https://example.com/full.mp3",
+    )
+
+
+def project(entity: ContentTableEntity) -> ContentTableEntity:
+    """PreviewContent.table_columnsで射影して読み込んだエンティティ"""
+    row = entity.model_dump(exclude_none=True)
+    return ContentTableEntity.from_entity({k: v for k, v in row.items() if k in PreviewContent.table_columns})
+
+
+class TestContentPreview:
+    """コンテンツのプレビューのテストクラス"""
+
+    def test_to_preview(self):
+        """最初のh2と続くp要素をプレビューにするテスト"""
+        preview = make_content().to_preview()
+
+        assert preview.preview_html == "<h2>見出し</h2><p>本文1</p><p>本文2</p>"
+        assert preview.preview_text == "見出し本文1本文2"
+        assert preview.remaining_text_length == len("導入次の見出し続き")
+
+    def test_to_preview_without_h2(self):
+        """h2がない記事はプレビューを空にし、全文の長さを残りの長さにするテスト"""
+        preview = make_content("<p>本文だけ</p><p>続き</p>").to_preview()
+
+        assert preview.preview_html == ""
+        assert preview.preview_text == ""
+        assert preview.remaining_text_length == len("本文だけ続き")
+
+    def test_stored_preview_round_trip(self):
+        """保存したプレビューを射影して読み込むと本文から生成したものと一致するテスト"""
+        content = make_content()
+        expected = content.to_preview()
+        entity = ContentTableEntity.from_content(content).set_preview(expected)
+
+        preview = project(entity).to_preview_content()
+
+        assert preview == expected
+
+    def test_legacy_row_without_preview(self):
+        """プレビュー未保存の行はNoneを返すテスト"""
+        entity = ContentTableEntity.from_content(make_content())
+
+        assert project(entity).to_preview_content() is None
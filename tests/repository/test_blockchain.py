@@ -0,0 +1,720 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from models.blockchain import Block, BlockEntity, BlockHeightEntity, TransactionEntity, TransactionIndexEntity
+from repository.blockchain import (
+    UTXOSet,
+    HeaderChain,
+    is_spent_utxo,
+    create_block,
+    delete_mempool_conflicts,
+    get_block_entity_by_height,
+    get_block_entities_in_range,
+    delete_block_height_entity,
+    get_transaction_entity_by_txid,
+    create_transaction_indexes,
+    delete_transaction_index,
+    get_merkle_proof,
+    get_block,
+    load_transactions,
+)
+
+GENESIS_HASH = "11" * 32
+
+
+def make_block_entity(block_hash, height, previous_hash):
+    return BlockEntity(PartitionKey="HISTORY", RowKey=block_hash, hash=block_hash, version=1, height=height,
+                       previous_hash=previous_hash, merkle_root="00" * 32, timestamp=0, bits="1d00ffff", nonce=0)
+
+
+class FakeChainStorage:
+    """複数インスタンスで共有するTable storageの代わり(CURRENT/HISTORY, output, vin, 使用済みoutpoint)"""
+
+    def __init__(self):
+        self.blocks = {}
+        # height -> BlockHeightEntity
+        self.heights = {}
+        self.current_hash = None
+        self.add_block(GENESIS_HASH)
+        self.outputs = [self.output("aa" * 32, 0, GENESIS_HASH), self.output("aa" * 32, 1, GENESIS_HASH)]
+        self.vins = []
+        self.spent_outpoints = {}
+        # block hash -> トランザクション
+        self.transactions = {}
+        self.output_scans = 0
+
+    @staticmethod
+    def output(txid, n, block_hash):
+        entity = MagicMock()
+        entity.txid = txid
+        entity.n = n
+        entity.block_hash = block_hash
+        return entity
+
+    def add_block(self, block_hash, previous_hash=None, indexed=True):
+        """
+        他のインスタンスでブロックを追加する(previous_hashを指定しない場合はCURRENTに続ける)
+        indexedでない場合はheightインデックスを作成しない(インデックス追加前のブロック)
+        """
+        previous = self.blocks.get(previous_hash or self.current_hash)
+        self.blocks[block_hash] = make_block_entity(block_hash, previous.height + 1 if previous else 0,
+                                                    previous.hash if previous else "0" * 64)
+        if indexed:
+            self.create_block_height_entity(self.blocks[block_hash])
+        self.current_hash = block_hash
+        return self.blocks[block_hash]
+
+    def get_block_height_entity(self, height):
+        return self.heights.get(height)
+
+    def query_block_height_entity(self, qf):
+        start, end = int(qf.parameters["StartRowKey"]), int(qf.parameters["EndRowKey"])
+        return [self.heights[height] for height in sorted(self.heights) if start <= height <= end]
+
+    def query_block_entity_by_height(self, start_height, end_height):
+        return [e for e in self.blocks.values() if start_height <= e.height <= end_height]
+
+    def create_block_height_entity(self, block_entity):
+        self.heights[block_entity.height] = BlockHeightEntity.from_block_entity(block_entity)
+
+    def spend(self, txid, vout, block_hash, legacy=False, connected=True, outputs=()):
+        """
+        他のインスタンスでoutpointを使用するブロックを追加する
+        legacyの場合は使用済みoutpointを作成しない(使用済みoutpointテーブル追加前のvin)
+        connectedでない場合はHISTORYを作成しない(書き込みに失敗したブロック)
+
+        Args:
+            outputs: ブロックのトランザクションが作成するoutputの(txid, n)
+        """
+        vin = MagicMock()
+        vin.utxo_txid = txid
+        vin.utxo_vout = vout
+        vin.spent_block_hash = block_hash
+        vin.is_mempool = 0
+        vin.to_original.return_value = vin
+        self.vins.append(vin)
+        if not legacy:
+            self.spent_outpoints[(txid, vout)] = vin
+
+        transactions = []
+        for output_txid, n in outputs:
+            output = self.output(output_txid, n, block_hash)
+            output.to_entity.return_value = output
+            self.outputs.append(output)
+            transaction = MagicMock(txid=output_txid, vin=[], outputs=[output])
+            transactions.append(transaction)
+        transactions.append(MagicMock(txid="ff" * 32, vin=[vin], outputs=[]))
+        self.transactions[block_hash] = transactions
+        if connected:
+            self.add_block(block_hash)
+
+    def query_transaction(self, qf):
+        return list(self.transactions.get(qf.parameters["PartitionKey"], []))
+
+    def query_transaction_output_entity(self, qf):
+        self.output_scans += 1
+        return list(self.outputs)
+
+    def query_transaction_vin_entity(self, qf):
+        """vinの検索(utxo_txid/utxo_voutの条件のみ解釈する)"""
+        vins = list(self.vins)
+        if "utxo_txid" in qf.parameters:
+            vins = [vin for vin in vins if vin.utxo_txid == qf.parameters["utxo_txid"]
+                    and f"utxo_vout eq {vin.utxo_vout}L" in qf.query_filter]
+        return vins
+
+    def get_spent_outpoint_entity(self, utxo_txid, utxo_vout):
+        return self.spent_outpoints.get((utxo_txid, utxo_vout))
+
+    def create_spent_outpoint(self, vin):
+        self.spent_outpoints[(vin.utxo_txid, vin.utxo_vout)] = vin
+        return vin
+
+    def get_block_entity(self, partition_type, row_key):
+        if partition_type == "CURRENT":
+            entity = self.blocks.get(self.current_hash)
+            return entity.model_copy(update={"PartitionKey": "CURRENT", "RowKey": "0" * 64}) if entity else None
+        return self.blocks.get(row_key)
+
+    def query_block_entity_by_partition(self, partition_type):
+        return list(self.blocks.values())
+
+    def patches(self):
+        return [
+            patch('repository.blockchain.get_block_entity', side_effect=self.get_block_entity),
+            patch('repository.blockchain.query_block_entity_by_partition', side_effect=self.query_block_entity_by_partition),
+            patch('repository.blockchain.get_block_height_entity', side_effect=self.get_block_height_entity),
+            patch('repository.blockchain.query_block_height_entity', side_effect=self.query_block_height_entity),
+            patch('repository.blockchain.query_block_entity_by_height', side_effect=self.query_block_entity_by_height),
+            patch('repository.blockchain.create_block_height_entity', side_effect=self.create_block_height_entity),
+            patch('repository.blockchain.query_transaction', side_effect=self.query_transaction),
+            patch('repository.blockchain.query_transaction_output_entity', side_effect=self.query_transaction_output_entity),
+            patch('repository.blockchain.query_transaction_vin_entity', side_effect=self.query_transaction_vin_entity),
+            patch('repository.blockchain.get_spent_outpoint_entity', side_effect=self.get_spent_outpoint_entity),
+            patch('repository.blockchain.create_spent_outpoint', side_effect=self.create_spent_outpoint),
+        ]
+
+
+@pytest.fixture
+def storage():
+    storage = FakeChainStorage()
+    patches = storage.patches()
+    for p in patches:
+        p.start()
+    yield storage
+    for p in patches:
+        p.stop()
+
+
+class TestUTXOSet:
+    """UTXOSetのテストクラス"""
+
+    def test_reload_after_other_instance_connects_block(self, storage):
+        """他のインスタンスでブロックが追加された場合に読み込み直すテスト"""
+        utxo_set = UTXOSet()
+        assert utxo_set.get("aa" * 32, 0) is not None
+
+        storage.spend("aa" * 32, 0, "22" * 32)
+
+        # refresh_interval内はCURRENTを確認しない
+        assert utxo_set.get("aa" * 32, 0) is not None
+
+        utxo_set.refresh_interval = 0
+        assert utxo_set.get("aa" * 32, 0) is None
+        assert utxo_set.get("aa" * 32, 1) is not None
+        assert utxo_set.tip_hash == "22" * 32
+
+    def test_refresh_applies_extension_incrementally(self, storage):
+        """他のインスタンスでtipに続くブロックが追加された場合は、そのブロックだけを反映するテスト"""
+        utxo_set = UTXOSet()
+        utxo_set.refresh()
+        utxo_set.refresh_interval = 0
+        storage.spend("aa" * 32, 0, "22" * 32, outputs=[("bb" * 32, 0)])
+        storage.spend("aa" * 32, 1, "33" * 32)
+
+        assert utxo_set.get("aa" * 32, 0) is None
+        assert utxo_set.get("aa" * 32, 1) is None
+        assert utxo_set.get("bb" * 32, 0) is not None
+        assert utxo_set.tip_hash == "33" * 32
+        assert storage.output_scans == 1
+
+    def test_refresh_reloads_on_fork(self, storage):
+        """tipに続かないブロックがCURRENTになった場合は読み込み直すテスト"""
+        utxo_set = UTXOSet()
+        utxo_set.refresh()
+        utxo_set.refresh_interval = 0
+        storage.spend("aa" * 32, 0, "22" * 32)
+        assert utxo_set.get("aa" * 32, 0) is None
+
+        # 22を含まないチェーンに切り替わる
+        storage.vins.clear()
+        storage.blocks.pop("22" * 32)
+        storage.add_block("33" * 32, previous_hash=GENESIS_HASH)
+
+        assert utxo_set.get("aa" * 32, 0) is not None
+        assert utxo_set.tip_hash == "33" * 32
+        assert storage.output_scans == 2
+
+    def test_load_ignores_unconnected_block(self, storage):
+        """HISTORYのない(書き込みに失敗した)ブロックのoutput/vinを読み込まないテスト"""
+        storage.outputs.append(storage.output("bb" * 32, 0, "33" * 32))
+        storage.spend("aa" * 32, 0, "33" * 32, connected=False)
+
+        utxo_set = UTXOSet()
+
+        assert utxo_set.get("bb" * 32, 0) is None
+        assert utxo_set.get("aa" * 32, 0) is not None
+
+    def test_connect_block_on_stale_tip_clears(self, storage):
+        """読み込み時のCURRENTに続かないブロックを反映する場合は破棄するテスト"""
+        utxo_set = UTXOSet()
+        utxo_set.refresh()
+        block = MagicMock()
+        block.previous_hash = "33" * 32
+        block.transactions = []
+
+        utxo_set.connect_block(block)
+
+        assert utxo_set.loaded is False
+
+
+class TestIsSpentUTXO:
+    """is_spent_utxoのテストクラス"""
+
+    def test_stale_set_rejects_respend(self, storage):
+        """他のインスタンスで使用されたoutpointを、古いUTXOセットのインスタンスでも使用済みと判定するテスト"""
+        stale_utxo_set = UTXOSet()
+        stale_utxo_set.refresh()
+        storage.spend("aa" * 32, 0, "22" * 32)
+
+        with patch('repository.blockchain.utxo_set', stale_utxo_set):
+            # メモリ上は未使用のまま
+            assert stale_utxo_set.get("aa" * 32, 0) is not None
+            assert is_spent_utxo("aa" * 32, 0) is True
+            assert is_spent_utxo("aa" * 32, 1) is False
+
+    def test_legacy_vin_without_spent_outpoint(self, storage):
+        """使用済みoutpointがない旧データのvinでも使用済みと判定し、使用済みoutpointを作成するテスト"""
+        storage.spend("aa" * 32, 0, "22" * 32, legacy=True)
+        assert ("aa" * 32, 0) not in storage.spent_outpoints
+
+        assert is_spent_utxo("aa" * 32, 0) is True
+        assert is_spent_utxo("aa" * 32, 1) is False
+        assert ("aa" * 32, 0) in storage.spent_outpoints
+        assert ("aa" * 32, 1) not in storage.spent_outpoints
+
+    def test_unconnected_block_is_ignored(self, storage):
+        """HISTORYのない(書き込みに失敗した)ブロックの使用済みoutpointは未使用と判定するテスト"""
+        storage.spend("aa" * 32, 0, "33" * 32, connected=False)
+
+        assert is_spent_utxo("aa" * 32, 0) is False
+
+
+class TestCreateBlock:
+    """create_blockの書き込み順序と検証のテストクラス"""
+
+    @pytest.fixture(autouse=True)
+    def env(self):
+        with patch.dict("os.environ", {"BLOCKCHAIN_BITS": "1D00FFFF", "BLOCKCHAIN_SUBSIDY": "5000000000"}), \
+             patch('repository.blockchain.utxo_set', UTXOSet()) as utxo_set:
+            yield utxo_set
+
+    @staticmethod
+    def make_block(transactions):
+        return Block.model_construct(hash="22" * 32, version=1, previous_hash=GENESIS_HASH, merkle_root="00" * 32,
+                                     timestamp=0, bits="1d00ffff", nonce=0, transactions=transactions)
+
+    @staticmethod
+    def coinbase():
+        transaction = MagicMock()
+        transaction.is_coinbase.return_value = True
+        transaction.outputs[0].value = 5000000000
+        return transaction
+
+    @staticmethod
+    def spending_transaction(txid, *outpoints):
+        transaction = MagicMock()
+        transaction.txid = txid
+        transaction.is_coinbase.return_value = False
+        transaction.vin = []
+        for utxo_txid, utxo_vout in outpoints:
+            vin = MagicMock()
+            vin.utxo_txid = utxo_txid
+            vin.utxo_vout = utxo_vout
+            transaction.vin.append(vin)
+        return transaction
+
+    @pytest.mark.parametrize("transactions", [
+        # 別のトランザクションで同じUTXOを使用
+        lambda: [TestCreateBlock.spending_transaction("b1" * 32, ("aa" * 32, 0)),
+                 TestCreateBlock.spending_transaction("b2" * 32, ("aa" * 32, 0))],
+        # 同じトランザクションの2つのvinで同じUTXOを使用
+        lambda: [TestCreateBlock.spending_transaction("b1" * 32, ("aa" * 32, 0), ("aa" * 32, 0))],
+    ])
+    def test_duplicate_outpoint_rejected(self, storage, transactions):
+        """ブロック内で同じUTXOを使用する場合は書き込み前に拒否するテスト"""
+        block = self.make_block([self.coinbase(), *transactions()])
+
+        with patch('repository.blockchain.TableConnectionManager'), \
+             patch('repository.blockchain.create_transactions') as mock_create_transactions:
+            with pytest.raises(ValueError, match="同じUTXOが複数回使用されています"):
+                create_block(block)
+
+        mock_create_transactions.assert_not_called()
+
+    def test_history_removed_when_current_update_fails(self, storage):
+        """CURRENTの更新に失敗した場合はHISTORYとheightインデックスを取り消すテスト"""
+        block = self.make_block([self.coinbase()])
+
+        with patch('repository.blockchain.TableConnectionManager') as mock_table_manager, \
+             patch('repository.blockchain.create_transactions') as mock_create_transactions, \
+             patch('repository.blockchain.create_block_height_entity'), \
+             patch('repository.blockchain.delete_block_height_entity') as mock_delete_height, \
+             patch('repository.blockchain.create_transaction_indexes') as mock_create_indexes, \
+             patch('repository.blockchain.delete_mempool_transactions') as mock_delete_mempool:
+            block_table = mock_table_manager.return_value.blockchain_block_table
+            block_table.upsert_entity.side_effect = Exception("CURRENTの更新に失敗")
+
+            with pytest.raises(Exception, match="CURRENTの更新に失敗"):
+                create_block(block)
+
+        mock_create_transactions.assert_called_once()
+        block_table.create_entity.assert_called_once()
+        block_table.delete_entity.assert_called_once_with(partition_key="HISTORY", row_key=block.hash)
+        mock_delete_height.assert_called_once()
+        # mempoolとtxidインデックスはブロックの書き込み完了まで変更しない
+        mock_create_indexes.assert_not_called()
+        mock_delete_mempool.assert_not_called()
+
+
+    def test_utxo_set_refreshed_before_validation(self, storage, env):
+        """refresh_interval内でも、検証前にUTXOセットをCURRENTに追従させるテスト"""
+        utxo_set = env
+        utxo_set.refresh()
+        storage.spend("aa" * 32, 0, "22" * 32)
+        block = self.make_block([self.coinbase()])
+
+        with patch('repository.blockchain.TableConnectionManager'):
+            with pytest.raises(ValueError, match="previous_hashが不正です"):
+                create_block(block)
+
+        assert utxo_set.tip_hash == "22" * 32
+        assert utxo_set.unspent.get(("aa" * 32, 0)) is None
+
+class TestDeleteMempoolConflicts:
+    """delete_mempool_conflictsのテストクラス"""
+
+    def test_deletes_conflicts_and_descendants(self):
+        """競合するトランザクションと、そのoutputを使用する子孫をストレージから削除するテスト"""
+        conflict, child, grandchild, other = "c1" * 32, "c2" * 32, "c3" * 32, "d1" * 32
+        # txid -> outputを使用するmempoolのトランザクション
+        spenders = {(conflict, 0): child, (child, 0): grandchild}
+
+        def query_outputs(qf):
+            txid = qf.parameters["PartitionKey"]
+            return [FakeChainStorage.output(txid, 0, "0" * 64)]
+
+        def get_spent(utxo_txid, utxo_vout):
+            spender = spenders.get((utxo_txid, utxo_vout))
+            return MagicMock(spent_txid=spender, is_mempool=1) if spender else None
+
+        with patch('repository.blockchain.query_transaction_output_entity', side_effect=query_outputs), \
+             patch('repository.blockchain.get_spent_outpoint_entity', side_effect=get_spent), \
+             patch('repository.blockchain.delete_transaction') as mock_delete_transaction:
+            deleted = delete_mempool_conflicts({conflict})
+
+        assert deleted == [conflict, child, grandchild]
+        assert [c.args for c in mock_delete_transaction.call_args_list] == [("0" * 64, txid) for txid in deleted]
+        assert other not in deleted
+
+
+class TestBlockHeightIndex:
+    """heightインデックスのテストクラス"""
+
+    @pytest.fixture(autouse=True)
+    def header_chain(self):
+        """ヘッダーチェーンを使用せずにインデックスを読む"""
+        header_chain = MagicMock()
+        header_chain.get_by_height.return_value = None
+        header_chain.get_range.return_value = None
+        with patch('repository.blockchain.header_chain', header_chain):
+            yield header_chain
+
+    def test_point_read(self, storage):
+        """heightインデックスからブロックを取得するテスト"""
+        storage.add_block("22" * 32)
+
+        with patch.object(storage, "query_block_entity_by_height", side_effect=AssertionError("HISTORYを検索しない")):
+            block_entity = get_block_entity_by_height(1)
+
+        assert block_entity.hash == "22" * 32
+        assert block_entity.PartitionKey == "HISTORY"
+        assert get_block_entity_by_height(2) is None
+
+    def test_range_query(self, storage):
+        """heightの範囲をheight順に取得するテスト"""
+        for block_hash in ["22" * 32, "33" * 32, "44" * 32]:
+            storage.add_block(block_hash)
+
+        block_entities = get_block_entities_in_range(1, 5)
+
+        assert [e.hash for e in block_entities] == ["22" * 32, "33" * 32, "44" * 32]
+        assert [e.height for e in block_entities] == [1, 2, 3]
+
+    def test_legacy_blocks_backfilled(self, storage):
+        """インデックスのない旧データのブロックをHISTORYから取得し、インデックスを作成するテスト"""
+        storage.add_block("22" * 32, indexed=False)
+        storage.add_block("33" * 32, indexed=False)
+        storage.add_block("44" * 32)
+
+        assert get_block_entity_by_height(1).hash == "22" * 32
+        assert storage.heights[1].hash == "22" * 32
+
+        block_entities = get_block_entities_in_range(0, 3)
+
+        assert [e.height for e in block_entities] == [0, 1, 2, 3]
+        assert sorted(storage.heights) == [0, 1, 2, 3]
+        assert storage.heights[2].hash == "33" * 32
+
+    def test_delete_keeps_other_block(self, storage):
+        """同じheightに別のブロックが登録されている場合は削除しないテスト"""
+        storage.add_block("22" * 32)
+        fork = make_block_entity("33" * 32, 1, GENESIS_HASH)
+
+        with patch('repository.blockchain.TableConnectionManager') as mock_table_manager:
+            assert delete_block_height_entity(fork) is False
+            mock_table_manager.return_value.blockchain_block_height_table.delete_entity.assert_not_called()
+
+            assert delete_block_height_entity(storage.blocks["22" * 32]) is True
+            mock_table_manager.return_value.blockchain_block_height_table.delete_entity.assert_called_once_with(
+                partition_key="HEIGHT", row_key=f"{1:020d}")
+
+
+class FakeTransactionStorage:
+    """トランザクションテーブルとtxidインデックスの代わり"""
+
+    def __init__(self):
+        # (block hash, txid) -> TransactionEntity
+        self.transactions = {}
+        # txid -> TransactionIndexEntity
+        self.index = {}
+        self.scans = 0
+
+    def add(self, txid, block_hash, position=None, indexed=True):
+        entity = TransactionEntity(PartitionKey=block_hash, RowKey=txid, txid=txid, block_hash=block_hash,
+                                   block_height=1, version=1, locktime=0, position=position)
+        self.transactions[(block_hash, txid)] = entity
+        if indexed:
+            self.create_transaction_index(entity)
+        return entity
+
+    def get_transaction_index_entity(self, txid):
+        return self.index.get(txid)
+
+    def get_transaction_entity(self, block_hash, txid):
+        return self.transactions.get((block_hash, txid))
+
+    def query_transaction_entity(self, qf):
+        self.scans += 1
+        return [e for (_, txid), e in self.transactions.items() if txid == qf.parameters["RowKey"]]
+
+    def create_transaction_index(self, transaction_entity):
+        self.index[transaction_entity.txid] = TransactionIndexEntity.from_transaction_entity(transaction_entity)
+
+
+@pytest.fixture
+def transaction_storage():
+    storage = FakeTransactionStorage()
+    with patch('repository.blockchain.get_transaction_index_entity', side_effect=storage.get_transaction_index_entity), \
+         patch('repository.blockchain.get_transaction_entity', side_effect=storage.get_transaction_entity), \
+         patch('repository.blockchain.query_transaction_entity', side_effect=storage.query_transaction_entity), \
+         patch('repository.blockchain.create_transaction_index', side_effect=storage.create_transaction_index):
+        yield storage
+
+
+class TestTransactionIndex:
+    """txidインデックスのテストクラス"""
+
+    def test_index_point_read(self, transaction_storage):
+        """インデックスからブロックを特定してポイント読み込みするテスト"""
+        transaction_storage.add("aa" * 32, "22" * 32)
+
+        transaction_entity = get_transaction_entity_by_txid("aa" * 32)
+
+        assert transaction_entity.block_hash == "22" * 32
+        assert transaction_storage.scans == 0
+
+    def test_legacy_transaction_backfilled(self, transaction_storage):
+        """インデックスのない旧データのトランザクションを検索し、インデックスを作成するテスト"""
+        transaction_storage.add("aa" * 32, "22" * 32, indexed=False)
+
+        assert get_transaction_entity_by_txid("aa" * 32).block_hash == "22" * 32
+        assert transaction_storage.index["aa" * 32].block_hash == "22" * 32
+        assert get_transaction_entity_by_txid("bb" * 32) is None
+        assert transaction_storage.scans == 2
+
+        get_transaction_entity_by_txid("aa" * 32)
+        assert transaction_storage.scans == 2
+
+    def test_stale_mempool_index_overwritten(self, transaction_storage):
+        """mempoolを指したままのインデックスは、ブロックに取り込まれたトランザクションで上書きするテスト"""
+        transaction_storage.add("aa" * 32, "0" * 64)
+        transaction_storage.transactions.pop(("0" * 64, "aa" * 32))
+        transaction_storage.add("aa" * 32, "22" * 32, indexed=False)
+
+        assert get_transaction_entity_by_txid("aa" * 32).block_hash == "22" * 32
+        assert transaction_storage.index["aa" * 32].block_hash == "22" * 32
+
+    def test_mined_index_kept_when_mempool_row_deleted(self, transaction_storage):
+        """ブロックに取り込まれた後は、mempoolのトランザクションの削除でインデックスを削除しないテスト"""
+        transaction = MagicMock()
+        transaction.to_entity.return_value = transaction_storage.add("aa" * 32, "22" * 32, position=1, indexed=False)
+
+        with patch('repository.blockchain.TableConnectionManager') as mock_table_manager:
+            create_transaction_indexes([transaction])
+            index_table = mock_table_manager.return_value.blockchain_transaction_index_table
+            (operations,), _ = index_table.submit_transaction.call_args
+            assert [(op, e["PartitionKey"], e["RowKey"], e["block_hash"]) for op, e in operations] == \
+                [("upsert", "aa" * 32, "CURRENT", "22" * 32)]
+
+            transaction_storage.create_transaction_index(transaction.to_entity())
+            assert delete_transaction_index("aa" * 32, "0" * 64) is False
+            index_table.delete_entity.assert_not_called()
+
+    def test_merkle_proof_uses_index(self, transaction_storage):
+        """Merkle proofのトランザクションをインデックスから取得するテスト"""
+        transaction_storage.add("aa" * 32, "22" * 32, position=1)
+        tree = MagicMock()
+
+        with patch('repository.blockchain.get_merkle_tree', return_value=tree) as mock_get_merkle_tree, \
+             patch('repository.blockchain.MerkleProof.from_tree') as mock_from_tree:
+            get_merkle_proof("aa" * 32)
+
+        mock_get_merkle_tree.assert_called_once_with("22" * 32)
+        mock_from_tree.assert_called_once_with(tree, "22" * 32, 1)
+        assert transaction_storage.scans == 0
+
+
+@pytest.fixture
+def header_storage(storage):
+    """get_block_entityをヘッダーチェーンを経由しないストレージの読み込みに置き換える"""
+    for block_hash in ["22" * 32, "33" * 32]:
+        storage.add_block(block_hash)
+    return storage
+
+
+class TestHeaderChain:
+    """HeaderChainのテストクラス"""
+
+    def test_load(self, header_storage):
+        """CURRENTからgenesisまでを読み込み、CURRENTに続かないブロックを含めないテスト"""
+        header_storage.blocks["44" * 32] = make_block_entity("44" * 32, 1, GENESIS_HASH)
+        header_chain = HeaderChain()
+
+        assert header_chain.get_by_height(2).hash == "33" * 32
+        assert header_chain.get_by_height(1).hash == "22" * 32
+        assert header_chain.get_by_hash("44" * 32) is None
+        assert header_chain.tip.hash == "33" * 32
+        assert [r.hash for r in header_chain.get_range(0, 2)] == [GENESIS_HASH, "22" * 32, "33" * 32]
+        assert header_chain.get_range(0, 3) is None
+
+    def test_refresh_extends_by_one_block(self, header_storage):
+        """他のインスタンスでtipに続くブロックが追加された場合は、そのブロックだけを追加するテスト"""
+        header_chain = HeaderChain()
+        header_chain.refresh()
+        header_chain.refresh_interval = 0
+        header_storage.add_block("44" * 32)
+
+        with patch.object(HeaderChain, "load", side_effect=AssertionError("読み込み直さない")):
+            assert header_chain.get_by_height(3).hash == "44" * 32
+        assert header_chain.tip.hash == "44" * 32
+        assert header_chain.get_by_height(2).hash == "33" * 32
+
+    def test_refresh_reloads_on_fork(self, header_storage):
+        """tipに続かないブロックがCURRENTになった場合は読み込み直すテスト"""
+        header_chain = HeaderChain()
+        header_chain.refresh()
+        header_chain.refresh_interval = 0
+        header_storage.add_block("44" * 32, previous_hash="22" * 32)
+
+        assert header_chain.get_by_height(2).hash == "44" * 32
+        assert header_chain.get_by_hash("33" * 32) is None
+        assert header_chain.tip.hash == "44" * 32
+
+    def test_refresh_interval(self, header_storage):
+        """refresh_interval内はCURRENTを確認しないテスト"""
+        header_chain = HeaderChain()
+        header_chain.refresh()
+        header_storage.add_block("44" * 32)
+
+        assert header_chain.get_by_height(3) is None
+        assert header_chain.tip.hash == "33" * 32
+
+    def test_connect_block(self, header_storage):
+        """tipに続くブロックを追加し、続かないブロックの場合は破棄するテスト"""
+        header_chain = HeaderChain()
+        header_chain.refresh()
+
+        header_chain.connect_block(make_block_entity("44" * 32, 3, "33" * 32))
+        assert header_chain.tip.hash == "44" * 32
+        assert header_chain.by_height[3].hash == "44" * 32
+
+        header_chain.connect_block(make_block_entity("55" * 32, 3, "33" * 32))
+        assert header_chain.loaded is False
+        assert header_chain.by_hash == {}
+
+    def test_disconnect_block(self, header_storage):
+        """tipを削除して前のブロックに戻し、tip以外の場合は破棄するテスト"""
+        header_chain = HeaderChain()
+        header_chain.refresh()
+
+        header_chain.disconnect_block("33" * 32)
+        assert header_chain.tip.hash == "22" * 32
+        assert 2 not in header_chain.by_height
+        assert "33" * 32 not in header_chain.by_hash
+
+        header_chain.disconnect_block(GENESIS_HASH)
+        assert header_chain.loaded is False
+
+    def test_rewind_to_empty_chain(self, header_storage):
+        """genesisを削除した場合はtipがなくなるテスト"""
+        header_chain = HeaderChain()
+        header_chain.refresh()
+        for block_hash in ["33" * 32, "22" * 32, GENESIS_HASH]:
+            header_chain.disconnect_block(block_hash)
+
+        assert header_chain.tip is None
+        assert header_chain.by_hash == {}
+        assert header_chain.loaded is True
+
+
+class TestLoadTransactions:
+    """トランザクションのvin/output並列読み込みのテストクラス"""
+
+    def make_entities(self, count):
+        storage = FakeTransactionStorage()
+        return [storage.add(f"{i + 1:02x}" * 32, "aa" * 32, position=i) for i in range(count)]
+
+    def test_each_transaction_gets_own_partition(self):
+        """読み込みの完了順が入れ替わっても、各トランザクションに自分のvin/outputが付き順序が保たれるテスト"""
+        entities = self.make_entities(6)
+        delays = {e.txid: 0.01 * (len(entities) - i) for i, e in enumerate(entities)}
+
+        def query_vin(qf):
+            txid = qf.parameters["PartitionKey"]
+            time.sleep(delays[txid])
+            return [f"vin-{txid}"]
+
+        def query_output(qf):
+            txid = qf.parameters["PartitionKey"]
+            time.sleep(delays[txid] / 2)
+            return [f"output-{txid}"]
+
+        with patch('repository.blockchain.query_transaction_vin', side_effect=query_vin), \
+             patch('repository.blockchain.query_transaction_output', side_effect=query_output):
+            transactions = load_transactions(entities)
+
+        assert [t.txid for t in transactions] == [e.txid for e in entities]
+        for t in transactions:
+            assert t.vin == [f"vin-{t.txid}"]
+            assert t.outputs == [f"output-{t.txid}"]
+
+    def test_empty(self):
+        """エンティティがない場合は読み込みを行わないテスト"""
+        with patch('repository.blockchain.query_transaction_vin') as mock_vin, \
+             patch('repository.blockchain.query_transaction_output') as mock_output:
+            assert load_transactions([]) == []
+        mock_vin.assert_not_called()
+        mock_output.assert_not_called()
+
+    def test_read_error_raised(self):
+        """vinの読み込みに失敗した場合は例外を送出するテスト"""
+        entities = self.make_entities(2)
+        with patch('repository.blockchain.query_transaction_vin', side_effect=RuntimeError("read failed")), \
+             patch('repository.blockchain.query_transaction_output', return_value=[]):
+            with pytest.raises(RuntimeError):
+                load_transactions(entities)
+
+
+class TestGetBlock:
+    """get_blockのテストクラス"""
+
+    def test_transactions_not_found(self):
+        """トランザクションの読み込み結果がNoneでも空のブロックを返すテスト"""
+        block_entity = make_block_entity("22" * 32, 1, GENESIS_HASH)
+        with patch('repository.blockchain.get_block_entity', return_value=block_entity), \
+             patch('repository.blockchain.query_transaction', return_value=None):
+            block = get_block("HISTORY", block_entity.hash)
+
+        assert block.hash == block_entity.hash
+        assert block.transactions == []
+
+    def test_transactions_sorted_by_position(self):
+        """positionがある場合はブロック内の順序に並べ替えるテスト"""
+        block_entity = make_block_entity("22" * 32, 1, GENESIS_HASH)
+        transactions = [MagicMock(position=2), MagicMock(position=0), MagicMock(position=1)]
+        with patch('repository.blockchain.get_block_entity', return_value=block_entity), \
+             patch('repository.blockchain.query_transaction', return_value=transactions):
+            block = get_block("HISTORY", block_entity.hash)
+
+        assert [t.position for t in block.transactions] == [0, 1, 2]
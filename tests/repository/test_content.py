@@ -0,0 +1,72 @@
+import asyncio
+import uuid
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+from models.content import Content, ContentTableEntity, PreviewContent
+from repository.content import get_content_preview
+
+
+def make_content():
+    return Content(
+        id=uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        title_no=1,
+        title="タイトル",
+        content_text="本文",
+        content_html="<p>導入</p><h2>見出し</h2><p>本文1</p><h2>次の見出し</h2><p>続き</p>",
+        image_url="https://example.com/a.png",
+        price=100,
+        category="tech",
+        tags=["a", "b"],
+        publish_date=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def table_row(entity: ContentTableEntity, select=None):
+    """get_entityが返す行(selectがある場合は射影する)"""
+    row = entity.model_dump(exclude_none=True)
+    if select is None:
+        return row
+    return {k: v for k, v in row.items() if k in select}
+
+
+@pytest.fixture
+def contents_table():
+    with patch("repository.content.AsyncTableConnectionManager") as mock_manager:
+        table = mock_manager.return_value.contents_table
+        yield table
+
+
+class TestGetContentPreview:
+    """get_content_previewのテストクラス"""
+
+    def test_stored_preview(self, contents_table):
+        """保存済みのプレビューを射影した列だけで返すテスト"""
+        content = make_content()
+        entity = ContentTableEntity.from_content(content).set_preview(content.to_preview())
+        contents_table.get_entity = AsyncMock(side_effect=lambda partition_key, row_key, select=None: table_row(entity, select))
+
+        preview = asyncio.run(get_content_preview(str(content.id)))
+
+        assert preview == content.to_preview()
+        contents_table.get_entity.assert_awaited_once_with(
+            partition_key="content", row_key=str(content.id), select=PreviewContent.table_columns)
+
+    def test_legacy_row_falls_back_to_content(self, contents_table):
+        """プレビュー未保存の行は本文を読み込んでプレビューを生成するテスト"""
+        content = make_content()
+        entity = ContentTableEntity.from_content(content)
+        contents_table.get_entity = AsyncMock(side_effect=lambda partition_key, row_key, select=None: table_row(entity, select))
+
+        preview = asyncio.run(get_content_preview(str(content.id)))
+
+        assert preview == content.to_preview()
+        assert contents_table.get_entity.await_count == 2
+        assert "select" not in contents_table.get_entity.await_args.kwargs
+
+    def test_not_found(self, contents_table):
+        """行が取得できない場合はValueErrorを送出するテスト"""
+        contents_table.get_entity = AsyncMock(side_effect=Exception("not found"))
+
+        with pytest.raises(ValueError):
+            asyncio.run(get_content_preview("missing"))
@@ -0,0 +1,185 @@
+import gzip
+import json
+import uuid
+import brotli
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceModifiedError, ResourceExistsError
+from models.content import PreviewContent
+from repository import content_list
+
+LIST_NAME = "contents.json"
+MANIFEST_NAME = f"{LIST_NAME}.manifest.json"
+
+
+def make_preview(n, title=None):
+    return PreviewContent(
+        id=uuid.UUID(int=n),
+        title_no=n,
+        title=title or f"タイトル{n}",
+        preview_text="本文",
+        preview_html="<p>本文</p>",
+        image_url="https://example.com/a.png",
+        price=100,
+        category="tech",
+        tags=["a"],
+        publish_date=datetime(2026, 1, n, tzinfo=timezone.utc),
+        remaining_text_length=10,
+    )
+
+
+class FakeBlobStore:
+    """ETag条件付きの書き込みを再現するBlobコンテナの代わり"""
+
+    def __init__(self):
+        # blob名 -> (data, etag, content_settings)
+        self.blobs = {}
+        self.version = 0
+        self.uploads = []
+        # 一覧をアップロードした直後に呼ぶ関数(他のインスタンスの更新を再現する)
+        self.on_list_upload = None
+
+    def put(self, name, data, content_settings=None):
+        self.version += 1
+        self.blobs[name] = (data, f'"{self.version}"', content_settings)
+
+    def get_blob_client(self, blob_name):
+        client = MagicMock()
+        client.download_blob.side_effect = lambda: self.download(blob_name)
+        client.upload_blob.side_effect = lambda data, **kwargs: self.upload(blob_name, data, **kwargs)
+        return client
+
+    def download(self, name):
+        if name not in self.blobs:
+            raise ResourceNotFoundError("not found")
+        data, etag, _ = self.blobs[name]
+        downloader = MagicMock()
+        downloader.readall.return_value = data
+        downloader.properties.etag = etag
+        return downloader
+
+    def upload(self, name, data, overwrite=False, etag=None, match_condition=None, content_settings=None):
+        if not overwrite and name in self.blobs:
+            raise ResourceExistsError("exists")
+        if match_condition == MatchConditions.IfNotModified and self.blobs.get(name, (None, None, None))[1] != etag:
+            raise ResourceModifiedError("modified")
+        self.put(name, data, content_settings)
+        self.uploads.append(name)
+        if name == LIST_NAME and self.on_list_upload:
+            on_list_upload, self.on_list_upload = self.on_list_upload, None
+            on_list_upload()
+
+    def manifest(self):
+        return json.loads(self.blobs[MANIFEST_NAME][0])
+
+    def listed(self):
+        return json.loads(self.blobs[LIST_NAME][0])
+
+
+@pytest.fixture
+def store():
+    store = FakeBlobStore()
+    with patch.object(content_list, "get_blob_client", side_effect=store.get_blob_client), \
+         patch.dict("os.environ", {"CONTENT_LIST_FILE_NAME": LIST_NAME}):
+        yield store
+
+
+class TestContentList:
+    """コンテンツ一覧ファイルの差分更新のテストクラス"""
+
+    def test_missing_manifest_requires_rebuild(self, store):
+        """マニフェストがない場合は何もアップロードせずNoneを返すテスト"""
+        assert content_list.upsert_previews([make_preview(1)]) is None
+        assert content_list.delete_preview(str(uuid.UUID(int=1))) is None
+        assert store.uploads == []
+
+    def test_rebuild_uploads_list_and_variants(self, store):
+        """作り直しで一覧と圧縮版、マニフェストを保存するテスト"""
+        previews = [make_preview(2), make_preview(1)]
+
+        assert content_list.rebuild(previews) is True
+
+        expected = [json.loads(p.model_dump_json()) for p in sorted(previews, key=lambda p: str(p.id))]
+        assert store.listed() == expected
+        assert json.loads(gzip.decompress(store.blobs[f"{LIST_NAME}.gz"][0])) == expected
+        assert json.loads(brotli.decompress(store.blobs[f"{LIST_NAME}.br"][0])) == expected
+        assert store.blobs[f"{LIST_NAME}.br"][2].content_encoding == "br"
+        assert store.uploads[-1] == MANIFEST_NAME
+
+    def test_unchanged_skips_upload(self, store):
+        """hashが同じ場合はアップロードしないテスト"""
+        content_list.rebuild([make_preview(1), make_preview(2)])
+        store.uploads.clear()
+
+        assert content_list.upsert_previews([make_preview(1)]) is False
+        assert content_list.rebuild([make_preview(1), make_preview(2)]) is False
+        assert content_list.delete_preview(str(uuid.UUID(int=3))) is False
+        assert store.uploads == []
+
+    def test_force_uploads_unchanged(self, store):
+        """forceの場合は変更がなくてもアップロードするテスト"""
+        content_list.rebuild([make_preview(1)])
+        store.uploads.clear()
+
+        assert content_list.rebuild([make_preview(1)], force=True) is True
+        assert LIST_NAME in store.uploads
+
+    def test_changed_item_uploaded(self, store):
+        """変更した項目だけhashが変わり、一覧が更新されるテスト"""
+        content_list.rebuild([make_preview(1), make_preview(2)])
+        before = store.manifest()
+
+        assert content_list.upsert_previews([make_preview(2, title="変更後")]) is True
+
+        after = store.manifest()
+        id1, id2 = str(uuid.UUID(int=1)), str(uuid.UUID(int=2))
+        assert after["items"][id1]["hash"] == before["items"][id1]["hash"]
+        assert after["items"][id2]["hash"] != before["items"][id2]["hash"]
+        assert after["list_hash"] != before["list_hash"]
+        assert [item["title"] for item in store.listed()] == ["タイトル1", "変更後"]
+
+    def test_delete_preview(self, store):
+        """削除した項目が一覧から除かれるテスト"""
+        content_list.rebuild([make_preview(1), make_preview(2)])
+
+        assert content_list.delete_preview(str(uuid.UUID(int=1))) is True
+        assert [item["title_no"] for item in store.listed()] == [2]
+
+    def test_etag_conflict_retried(self, store):
+        """マニフェストの保存が競合した場合は他の更新を取り込んで再アップロードするテスト"""
+        content_list.rebuild([make_preview(1)])
+
+        def concurrent_update():
+            manifest = store.manifest()
+            item = json.loads(make_preview(2).model_dump_json())
+            manifest["items"][str(uuid.UUID(int=2))] = {"hash": content_list.hash_json(item), "item": item}
+            store.put(MANIFEST_NAME, json.dumps(manifest).encode())
+
+        store.on_list_upload = concurrent_update
+        assert content_list.upsert_previews([make_preview(3)]) is True
+
+        assert [item["title_no"] for item in store.listed()] == [1, 2, 3]
+        assert sorted(store.manifest()["items"]) == [str(uuid.UUID(int=n)) for n in [1, 2, 3]]
+
+    def test_conflict_retries_exhausted(self, store):
+        """競合が続く場合はValueErrorを送出するテスト"""
+        content_list.rebuild([make_preview(1)])
+
+        with patch.object(content_list, "save_manifest", side_effect=ResourceModifiedError("modified")) as mock_save:
+            with pytest.raises(ValueError):
+                content_list.upsert_previews([make_preview(2)])
+        assert mock_save.call_count == content_list.MAX_RETRIES
+
+    def test_concurrent_first_rebuild(self, store):
+        """マニフェストがない状態で別の作り直しが先に保存した場合は、そのマニフェストに対して再試行するテスト"""
+        def concurrent_rebuild():
+            item = json.loads(make_preview(1).model_dump_json())
+            manifest = {"list_hash": "", "items": {str(uuid.UUID(int=1)): {"hash": content_list.hash_json(item), "item": item}}}
+            store.put(MANIFEST_NAME, json.dumps(manifest).encode())
+
+        store.on_list_upload = concurrent_rebuild
+        assert content_list.rebuild([make_preview(2)]) is True
+
+        assert [item["title_no"] for item in store.listed()] == [2]
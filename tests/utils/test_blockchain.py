@@ -0,0 +1,170 @@
+import hashlib
+import pytest
+from unittest.mock import patch, MagicMock
+from coincurve import PrivateKey
+import utils.blockchain
+from utils.blockchain import (
+    execute_script,
+    script_to_hex,
+    hash160,
+    verify_standard_script,
+    verify_signature,
+    verify_signatures,
+    signature_cache,
+    SignatureCheck,
+)
+from repository.blockchain import verify_deferred_signatures
+
+
+def push(data: bytes) -> bytes:
+    return bytes([len(data)]) + data
+
+
+# 固定の秘密鍵(coincurveの署名はRFC6979で決定的)
+KEY = PrivateKey(bytes.fromhex("11" * 32))
+OTHER_KEY = PrivateKey(bytes.fromhex("22" * 32))
+PUBKEY = KEY.public_key.format(True)
+OTHER_PUBKEY = OTHER_KEY.public_key.format(True)
+MESSAGE = hashlib.sha256(b"message").digest()
+SIGNATURE = KEY.sign(MESSAGE, hasher=None) + b"\x01"
+BAD_SIGNATURE = OTHER_KEY.sign(MESSAGE, hasher=None) + b"\x01"
+P2PK = push(PUBKEY) + b"\xac"
+P2PKH = b"\x76\xa9" + push(hash160(PUBKEY)) + b"\x88\xac"
+TIMESTAMP = 2**31 - 1
+
+
+class TestExecuteScript:
+    """execute_scriptのテストクラス
+
+    期待値はASM文字列を解釈していた書き換え前のインタプリタでの実行結果
+    """
+
+    cases = {
+        "p2pk": (push(SIGNATURE).hex(), P2PK.hex(), True),
+        "p2pkh": ((push(SIGNATURE) + push(PUBKEY)).hex(), P2PKH.hex(), True),
+        "p2pk_bad_signature": (push(BAD_SIGNATURE).hex(), P2PK.hex(), False),
+        "p2pkh_bad_signature": ((push(BAD_SIGNATURE) + push(PUBKEY)).hex(), P2PKH.hex(), False),
+        "p2pkh_wrong_pubkey": ((push(SIGNATURE) + push(OTHER_PUBKEY)).hex(), P2PKH.hex(), False),
+        "checksig_underflow": (push(SIGNATURE).hex(), "ac", False),
+        "dup_underflow": ("", script_to_hex("OP_DUP"), False),
+        "add_underflow": (script_to_hex("OP_1"), script_to_hex("OP_ADD"), False),
+        "verify_failed": (script_to_hex("OP_0"), script_to_hex("OP_VERIFY OP_1"), False),
+        "verify_succeeded": (script_to_hex("OP_1"), script_to_hex("OP_VERIFY OP_1"), True),
+        "equalverify_failed": (script_to_hex("OP_1 OP_2"), script_to_hex("OP_EQUALVERIFY OP_1"), False),
+        "unknown_opcode_skipped": (script_to_hex("OP_1"), "ff", True),
+        "unknown_opcode_only": ("", "ff", False),
+        "arithmetic": (script_to_hex("OP_2 OP_3"), script_to_hex("OP_ADD OP_5 OP_EQUAL"), True),
+        "op_return": (script_to_hex("OP_1"), script_to_hex("OP_RETURN"), False),
+    }
+
+    @pytest.mark.parametrize("name", list(cases))
+    def test_same_result_as_previous_interpreter(self, name):
+        """書き換え前のインタプリタと同じ結果になるテスト"""
+        script_sig_hex, script_pubkey_hex, expected = self.cases[name]
+
+        assert execute_script(script_sig_hex, script_pubkey_hex, MESSAGE.hex(), TIMESTAMP) is expected
+
+    def test_truncated_push(self):
+        """pushデータが足りないスクリプトのテスト"""
+        assert execute_script("4b00", "51", MESSAGE.hex(), TIMESTAMP) is False
+
+
+class TestVerifyStandardScript:
+    """verify_standard_script(P2PK/P2PKHのテンプレート検証)のテストクラス"""
+
+    def test_p2pk_template(self):
+        """P2PKのテンプレートに一致する場合のテスト"""
+        assert verify_standard_script("P2PK", push(SIGNATURE), P2PK, MESSAGE.hex(), TIMESTAMP) is True
+
+    def test_p2pkh_template(self):
+        """P2PKHのテンプレートに一致する場合はインタプリタを使わないテスト"""
+        with patch("utils.blockchain.compile_script", wraps=utils.blockchain.compile_script) as mock_compile:
+            result = execute_script((push(SIGNATURE) + push(PUBKEY)).hex(), P2PKH.hex(), MESSAGE.hex(), TIMESTAMP,
+                                    script_type="P2PKH")
+
+            assert result is True
+            # script_sigの解析のみ
+            assert mock_compile.call_count == 1
+
+    def test_near_miss_falls_back(self):
+        """テンプレートに一致しないscript_sig(OP_NOPを含む)はインタプリタで実行するテスト"""
+        script_sig = push(SIGNATURE) + b"\x61" + push(PUBKEY)
+
+        assert verify_standard_script("P2PKH", script_sig, P2PKH, MESSAGE.hex(), TIMESTAMP) is None
+        with patch("utils.blockchain.compile_script", wraps=utils.blockchain.compile_script) as mock_compile:
+            result = execute_script(script_sig.hex(), P2PKH.hex(), MESSAGE.hex(), TIMESTAMP, script_type="P2PKH")
+
+            assert result is True
+            assert mock_compile.call_count == 3
+
+    def test_script_type_mismatch_falls_back(self):
+        """script_typeとscript_pubkeyが一致しない場合のテスト"""
+        assert verify_standard_script("P2PK", push(SIGNATURE) + push(PUBKEY), P2PKH, MESSAGE.hex(), TIMESTAMP) is None
+
+    def test_pubkey_hash_mismatch(self):
+        """公開鍵のhash160がscript_pubkeyと一致しない場合のテスト"""
+        script_sig = push(SIGNATURE) + push(OTHER_PUBKEY)
+
+        assert verify_standard_script("P2PKH", script_sig, P2PKH, MESSAGE.hex(), TIMESTAMP) is False
+        assert execute_script(script_sig.hex(), P2PKH.hex(), MESSAGE.hex(), TIMESTAMP, script_type="P2PKH") is False
+
+
+class TestSignatureCache:
+    """署名キャッシュのテストクラス"""
+
+    def setup_method(self):
+        signature_cache.clear()
+
+    def test_cached_signature_not_reverified(self):
+        """検証済みの署名はECDSA検証を省略するテスト"""
+        assert verify_signature(PUBKEY.hex(), SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP) is True
+
+        with patch("utils.blockchain.PublicKey") as mock_public_key:
+            assert verify_signature(PUBKEY.hex(), SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP) is True
+            mock_public_key.assert_not_called()
+
+    def test_invalid_signature_not_cached(self):
+        """検証に失敗した署名はキャッシュしないテスト"""
+        assert verify_signature(PUBKEY.hex(), BAD_SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP) is False
+
+        with patch("utils.blockchain.PublicKey") as mock_public_key:
+            mock_public_key.return_value.verify.return_value = False
+            assert verify_signature(PUBKEY.hex(), BAD_SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP) is False
+            mock_public_key.assert_called_once()
+
+    def test_different_message_not_cached(self):
+        """同じ署名と公開鍵でもメッセージが異なる場合はキャッシュを使わないテスト"""
+        assert verify_signature(PUBKEY.hex(), SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP) is True
+
+        other_message = hashlib.sha256(b"other").digest()
+        assert verify_signature(PUBKEY.hex(), SIGNATURE.hex(), other_message.hex(), TIMESTAMP) is False
+
+
+class TestBatchVerification:
+    """署名をまとめて検証する処理のテストクラス"""
+
+    def setup_method(self):
+        signature_cache.clear()
+
+    def test_batch_results_in_order(self):
+        """まとめて検証した結果がchecksと同じ順序になるテスト"""
+        good = SignatureCheck(PUBKEY.hex(), SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP)
+        bad = SignatureCheck(PUBKEY.hex(), BAD_SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP)
+
+        assert verify_signatures([good, bad, good]) == [True, False, True]
+
+    def test_empty_batch(self):
+        """検証対象がない場合は空の結果を返すテスト"""
+        assert verify_signatures([]) == []
+
+    def test_one_bad_signature_fails_transaction(self):
+        """1つでも不正な署名があればトランザクション全体がエラーになるテスト"""
+        transaction = MagicMock()
+        transaction.txid = "ab" * 32
+        good = SignatureCheck(PUBKEY.hex(), SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP)
+        bad = SignatureCheck(PUBKEY.hex(), BAD_SIGNATURE.hex(), MESSAGE.hex(), TIMESTAMP)
+
+        verify_deferred_signatures([(good, transaction, 0), (good, transaction, 2)])
+        with pytest.raises(ValueError) as e:
+            verify_deferred_signatures([(good, transaction, 0), (bad, transaction, 1), (good, transaction, 2)])
+        assert f"txid:{transaction.txid},vin:1" in str(e.value)
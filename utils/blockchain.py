@@ -1,4 +1,4 @@
-from typing import Dict, Optional, Tuple,List,Literal,get_args
+from typing import Callable, Dict, Optional, Tuple,List,Literal,NamedTuple,get_args
 from pydantic import BaseModel, Field, field_validator, computed_field, model_validator
 import hashlib
 from cryptography.hazmat.primitives.asymmetric import ec
@@ -6,16 +6,148 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
 from coincurve import PublicKey
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from utils.cache import LRUCache
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+_UINT8 = struct.Struct("<B")
+_UINT16 = struct.Struct("<H")
+_UINT32 = struct.Struct("<I")
+_UINT64 = struct.Struct("<Q")
+
+
+def hash256(data: bytes) -> bytes:
+    """SHA256を2回適用したダイジェスト(内部バイト順)を返す"""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def compact_size_to_bytes(value: int) -> bytes:
+    if value < 0:
+        raise ValueError("値は0以上である必要があります")
+    if value < 253:
+        return _UINT8.pack(value)
+    elif value <= 0xFFFF:  # 65535
+        return b"\xfd" + _UINT16.pack(value)
+    elif value <= 0xFFFFFFFF:  # 4294967295
+        return b"\xfe" + _UINT32.pack(value)
+    elif value <= 0xFFFFFFFFFFFFFFFF:  # 18446744073709551615
+        return b"\xff" + _UINT64.pack(value)
+    else:
+        raise ValueError(f"値が大きすぎます.{value}")
+
+
+class ByteWriter:
+    """シリアライズ用のbytearrayライター
+
+    Examples:
+        >>> w = ByteWriter()
+        >>> w.write_uint32(1).write_compact_size(2)
+        >>> w.getvalue()
+    """
+
+    __slots__ = ("buffer",)
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> "ByteWriter":
+        self.buffer += data
+        return self
+
+    def write_uint32(self, value: int) -> "ByteWriter":
+        self.buffer += _UINT32.pack(value)
+        return self
+
+    def write_uint64(self, value: int) -> "ByteWriter":
+        self.buffer += _UINT64.pack(value)
+        return self
+
+    def write_compact_size(self, value: int) -> "ByteWriter":
+        self.buffer += compact_size_to_bytes(value)
+        return self
+
+    def write_var_bytes(self, data: bytes) -> "ByteWriter":
+        """compact sizeの長さ付きでデータを書き込む"""
+        self.buffer += compact_size_to_bytes(len(data))
+        self.buffer += data
+        return self
+
+    def write_hash(self, hex_string: str) -> "ByteWriter":
+        """表示用(ビッグエンディアン)のhashを内部バイト順で書き込む"""
+        self.buffer += bytes.fromhex(hex_string)[::-1]
+        return self
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buffer)
+
+
+class MerkleTree:
+    """txid(内部バイト順)からMerkle treeを構築し、全階層を保持する
+
+    levels[0]がleaf、levels[-1]がrootのみの階層。
+    保持した階層からMerkle inclusion proofを再計算なしで返す。
+    """
+
+    __slots__ = ("levels",)
+
+    def __init__(self, leaves: List[bytes]):
+        if not leaves:
+            raise ValueError("Merkle treeのleafが空です")
+        level = list(leaves)
+        self.levels: List[List[bytes]] = [level]
+        while len(level) > 1:
+            # ペアがない場合は自分自身と結合
+            paired = level + [level[-1]] if len(level) % 2 else level
+            level = [
+                hash256(paired[i] + paired[i + 1]) for i in range(0, len(paired), 2)
+            ]
+            self.levels.append(level)
+
+    @classmethod
+    def from_txids(cls, txids: List[str]) -> "MerkleTree":
+        return cls([bytes.fromhex(txid)[::-1] for txid in txids])
+
+    @property
+    def root(self) -> bytes:
+        return self.levels[-1][0]
+
+    def root_hex(self) -> str:
+        return self.root[::-1].hex()
+
+    def get_proof(self, index: int) -> List[bytes]:
+        """index番目のleafからrootまでの兄弟ノードを返す"""
+        if not 0 <= index < len(self.levels[0]):
+            raise ValueError(f"indexが範囲外です。index:{index}")
+        branch = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            branch.append(level[sibling] if sibling < len(level) else level[index])
+            index >>= 1
+        return branch
+
+    @staticmethod
+    def verify_proof(leaf: bytes, index: int, branch: List[bytes], root: bytes) -> bool:
+        current = leaf
+        for sibling in branch:
+            if index & 1:
+                current = hash256(sibling + current)
+            else:
+                current = hash256(current + sibling)
+            index >>= 1
+        return current == root
+
 
 class Base(BaseModel):
     def hash256_hex(self, hex_string: str, is_little: bool = True) -> str:
-        data = bytes.fromhex(hex_string)
-        hash1 = hashlib.sha256(data).digest()
-        hash2 = hashlib.sha256(hash1).digest()
-        hash256 = hash2.hex()
+        digest = hash256(bytes.fromhex(hex_string))
         if is_little:
-            hash256 = self.hex_to_little_endian(hash256)
-        return hash256
+            digest = digest[::-1]
+        return digest.hex()
 
     def hex_to_little_endian(self, hex_string: str) -> str:
         return bytes.fromhex(hex_string)[::-1].hex()
@@ -29,18 +161,7 @@ class Base(BaseModel):
         )
 
     def int_to_compact_size(self, value: int) -> str:
-        if value < 0:
-            raise ValueError("値は0以上である必要があります")
-        if value < 253:
-            return self.int_to_hex(value, 1)
-        elif value <= 0xFFFF:  # 65535
-            return "fd" + self.int_to_hex(value, 2)
-        elif value <= 0xFFFFFFFF:  # 4294967295
-            return "fe" + self.int_to_hex(value, 4)
-        elif value <= 0xFFFFFFFFFFFFFFFF:  # 18446744073709551615
-            return "ff" + self.int_to_hex(value, 8)
-        else:
-            raise ValueError(f"値が大きすぎます.{value}")
+        return compact_size_to_bytes(value).hex()
 
     def compact_size_to_int(self, data: str) -> int:
         if len(data) == 0:
@@ -513,62 +634,55 @@ def hex_to_script(hex_string: str) -> str:
     return ' '.join(asm_parts)
 
 
-def cast_to_bool(value: str) -> bool:
-    """16進数文字列をブール値に変換"""
-    if not value or value == '00' or value == '80':
-        return False
-    return True
+def bytes_to_bool(value: bytes) -> bool:
+    """スタック要素をブール値に変換(負のゼロ 0x80 も偽)"""
+    for i, byte in enumerate(value):
+        if byte != 0:
+            return not (i == len(value) - 1 and byte == 0x80)
+    return False
 
 
-def hex_to_int_signed(hex_str: str) -> int:
-    """16進数文字列を符号付き整数に変換（Bitcoin Script形式）"""
-    if not hex_str:
-        return 0
-    data = bytes.fromhex(hex_str)
-    if len(data) == 0:
+def decode_num(data: bytes) -> int:
+    """スタック要素を符号付き整数に変換（Bitcoin Script形式）"""
+    if not data:
         return 0
     # 最上位ビットが符号ビット
     if data[-1] & 0x80:
         # 負の数
-        data_abs = bytearray(data)
-        data_abs[-1] &= 0x7f
-        return -int.from_bytes(data_abs, 'little')
-    else:
-        return int.from_bytes(data, 'little')
+        return -int.from_bytes(data[:-1] + bytes([data[-1] & 0x7f]), 'little')
+    return int.from_bytes(data, 'little')
 
 
-def int_to_hex_signed(value: int) -> str:
-    """整数を符号付き16進数文字列に変換（Bitcoin Script形式）"""
+def encode_num(value: int) -> bytes:
+    """整数を符号付きのスタック要素に変換（Bitcoin Script形式）"""
     if value == 0:
-        return ''
+        return b''
     
-    is_negative = value < 0
     abs_value = abs(value)
+    data = bytearray(abs_value.to_bytes((abs_value.bit_length() + 7) // 8, 'little'))
     
-    # バイト列に変換
-    if abs_value == 0:
-        hex_bytes = b''
-    else:
-        hex_bytes = abs_value.to_bytes((abs_value.bit_length() + 7) // 8, 'little')
-    
-    hex_list = list(hex_bytes)
-    
-    if len(hex_list) == 0:
-        return ''
-    
-    # 負の数の場合、符号ビットを設定
-    if is_negative:
-        if hex_list[-1] & 0x80:
-            # 最上位バイトの最上位ビットが既に立っている場合、新しいバイトを追加
-            hex_list.append(0x80)
-        else:
-            hex_list[-1] |= 0x80
-    else:
-        # 正の数で最上位ビットが立っている場合、0x00を追加
-        if hex_list[-1] & 0x80:
-            hex_list.append(0x00)
+    if data[-1] & 0x80:
+        # 最上位バイトの最上位ビットが既に立っている場合、符号用のバイトを追加
+        data.append(0x80 if value < 0 else 0x00)
+    elif value < 0:
+        data[-1] |= 0x80
     
-    return bytes(hex_list).hex()
+    return bytes(data)
+
+
+def cast_to_bool(value: str) -> bool:
+    """16進数文字列をブール値に変換"""
+    return bytes_to_bool(bytes.fromhex(value)) if value else False
+
+
+def hex_to_int_signed(hex_str: str) -> int:
+    """16進数文字列を符号付き整数に変換（Bitcoin Script形式）"""
+    return decode_num(bytes.fromhex(hex_str)) if hex_str else 0
+
+
+def int_to_hex_signed(value: int) -> str:
+    """整数を符号付き16進数文字列に変換（Bitcoin Script形式）"""
+    return encode_num(value).hex()
 
 SigHashType = Literal[
     0x01,  # SIGHASH_ALL
@@ -582,6 +696,15 @@ SigHashType = Literal[
 # Literalから有効な値を取得
 VALID_SIGHASH_TYPES = get_args(SigHashType)
 
+# 検証済み署名のキャッシュ(Bitcoin Coreのsigcache相当)
+# mempoolで検証済みのトランザクションがブロックで再検証される際にECDSA検証を省略する
+signature_cache = LRUCache(int(os.getenv("BLOCKCHAIN_SIGNATURE_CACHE_SIZE", "50000")))
+
+
+def signature_cache_key(pubkey_bytes: bytes, signature_bytes: bytes, message_bytes: bytes) -> bytes:
+    # 公開鍵は先頭バイトで長さが決まり、DER署名は自身の長さを含むため連結しても一意になる
+    return hashlib.sha256(pubkey_bytes + signature_bytes + message_bytes).digest()
+
 def verify_signature(pubkey_hex: str, signature_hex: str, signature_message: str,timestamp:int) -> bool:
     
     # 1. 最小・最大サイズチェック
@@ -600,7 +723,6 @@ def verify_signature(pubkey_hex: str, signature_hex: str, signature_message: str
 
     try:
         # 16進数文字列をバイト列に変換
-        print("pubkey_hex,signature_without_sighash,signature_message",pubkey_hex,signature_without_sighash,signature_message)
         pubkey_bytes = bytes.fromhex(pubkey_hex)
         signature_bytes = bytes.fromhex(signature_without_sighash)
         message_bytes = bytes.fromhex(signature_message)
@@ -631,14 +753,22 @@ def verify_signature(pubkey_hex: str, signature_hex: str, signature_message: str
         if not is_valid_r_s_range(signature_bytes):
             return False
         
-        # 9. 公開鍵オブジェクトを作成して署名を検証
-        print("9. 公開鍵オブジェクトを作成して署名を検証")
+        # 9. 検証済みキャッシュを確認
+        cache_key = signature_cache_key(pubkey_bytes, signature_bytes, message_bytes)
+        if signature_cache.get(cache_key):
+            return True
+
+        # 10. 公開鍵オブジェクトを作成して署名を検証
+        logger.debug("署名を検証します。pubkey:%s, message:%s", pubkey_hex, signature_message)
         pubkey_object = PublicKey(pubkey_bytes)
-        return pubkey_object.verify(
+        result = pubkey_object.verify(
             signature_bytes,
             message_bytes,
             hasher=None
         )
+        if result:
+            signature_cache.put(cache_key, True)
+        return result
         
     except (ValueError, TypeError) as e:
         return False
@@ -793,434 +923,390 @@ def normalize_to_low_s(sig: bytes) -> bytes:
     
     return b'\x30' + bytes([len(r_der + s_der)]) + r_der + s_der
     
-def execute_script(script_sig_asm: str, script_pubkey_asm: str,message:str,
-                   timestamp:int,
-                   debug: bool = True,base:Optional[Base]=None) -> bool:
-        """
-        ASM形式のスクリプトを実行
+class SignatureCheck(NamedTuple):
+    pubkey_hex: str
+    signature_hex: str
+    message: str
+    timestamp: int
+
+
+# OP_CHECKSIGが最後に評価され、署名検証の失敗がそのままスクリプトの失敗になる形式
+DEFERRABLE_SCRIPT_TYPES = ("P2PK", "P2PKH")
+
+# インタプリタを使わずにテンプレートで検証する形式
+STANDARD_SCRIPT_TYPES = ("P2PK", "P2PKH")
+
+_signature_executor: Optional[ThreadPoolExecutor] = None
+_signature_executor_lock = Lock()
+
+
+def get_signature_executor() -> ThreadPoolExecutor:
+    global _signature_executor
+    if _signature_executor is None:
+        with _signature_executor_lock:
+            if _signature_executor is None:
+                max_workers = int(os.getenv("BLOCKCHAIN_VERIFY_WORKERS", "0")) or os.cpu_count()
+                _signature_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="sigverify"
+                )
+    return _signature_executor
+
+
+def verify_signatures(checks: List[SignatureCheck]) -> List[bool]:
+    """
+    署名をまとめて検証し、checksと同じ順序で結果を返す
+    coincurveは検証中にGILを解放するため、スレッドプールで並列に実行する
+    """
+    if len(checks) < 2:
+        return [verify_signature(*check) for check in checks]
+    executor = get_signature_executor()
+    return list(executor.map(lambda check: verify_signature(*check), checks))
+
+
+class ScriptError(Exception):
+    pass
+
+
+class ScriptContext:
+    """スクリプト実行中の状態(スタック要素はbytes)"""
+
+    __slots__ = ("stack", "alt_stack", "message", "timestamp", "sig_checks")
+
+    def __init__(self, message: str, timestamp: int, sig_checks: Optional[List[SignatureCheck]]):
+        self.stack: List[bytes] = []
+        self.alt_stack: List[bytes] = []
+        self.message = message
+        self.timestamp = timestamp
+        self.sig_checks = sig_checks
+
+    def pop_num(self) -> int:
+        return decode_num(self.stack.pop())
+
+    def push_bool(self, value: bool) -> None:
+        self.stack.append(b'\x01' if value else b'')
+
+
+# opcode -> 処理関数
+OPCODE_HANDLERS: Dict[int, Callable[[ScriptContext, int], None]] = {}
+
+
+def opcode_handler(*opcodes: int):
+    def register(func: Callable[[ScriptContext, int], None]):
+        for opcode in opcodes:
+            OPCODE_HANDLERS[opcode] = func
+        return func
+    return register
+
+
+def compile_script(script: bytes) -> List[Tuple[int, Optional[bytes]]]:
+    """
+    スクリプトを(opcode, pushデータ)の列に変換する
+    OP_0, OP_PUSHBYTES_X, OP_PUSHDATAX, OP_1NEGATE, OP_1-OP_16はpushデータに解決する
+    """
+    operations: List[Tuple[int, Optional[bytes]]] = []
+    length = len(script)
+    i = 0
+    while i < length:
+        opcode = script[i]
+        i += 1
+        if opcode <= 0x4e:
+            if opcode <= 0x4b:
+                # OP_0, OP_PUSHBYTES_1 to OP_PUSHBYTES_75
+                size = opcode
+            else:
+                # OP_PUSHDATA1/2/4
+                width = {0x4c: 1, 0x4d: 2, 0x4e: 4}[opcode]
+                if i + width > length:
+                    raise ValueError(f"Missing length bytes for {OPCODE_MAP[opcode]}")
+                size = int.from_bytes(script[i:i + width], 'little')
+                i += width
+            if i + size > length:
+                raise ValueError(f"Insufficient data for {OPCODE_MAP[opcode]}")
+            operations.append((opcode, script[i:i + size]))
+            i += size
+        elif opcode == 0x4f:
+            # OP_1NEGATE
+            operations.append((opcode, encode_num(-1)))
+        elif 0x51 <= opcode <= 0x60:
+            # OP_1 から OP_16
+            operations.append((opcode, encode_num(opcode - 0x50)))
+        else:
+            operations.append((opcode, None))
+    return operations
+
+
+# === Stack Operations ===
+
+@opcode_handler(0x76)  # OP_DUP
+def _op_dup(ctx: ScriptContext, opcode: int):
+    ctx.stack.append(ctx.stack[-1])
+
+@opcode_handler(0x75)  # OP_DROP
+def _op_drop(ctx: ScriptContext, opcode: int):
+    ctx.stack.pop()
+
+@opcode_handler(0x6e)  # OP_2DUP
+def _op_2dup(ctx: ScriptContext, opcode: int):
+    if len(ctx.stack) < 2:
+        raise ScriptError("stack underflow")
+    ctx.stack.extend(ctx.stack[-2:])
+
+@opcode_handler(0x6f)  # OP_3DUP
+def _op_3dup(ctx: ScriptContext, opcode: int):
+    if len(ctx.stack) < 3:
+        raise ScriptError("stack underflow")
+    ctx.stack.extend(ctx.stack[-3:])
+
+@opcode_handler(0x6d)  # OP_2DROP
+def _op_2drop(ctx: ScriptContext, opcode: int):
+    if len(ctx.stack) < 2:
+        raise ScriptError("stack underflow")
+    del ctx.stack[-2:]
+
+@opcode_handler(0x7c)  # OP_SWAP
+def _op_swap(ctx: ScriptContext, opcode: int):
+    ctx.stack[-1], ctx.stack[-2] = ctx.stack[-2], ctx.stack[-1]
+
+@opcode_handler(0x78)  # OP_OVER
+def _op_over(ctx: ScriptContext, opcode: int):
+    ctx.stack.append(ctx.stack[-2])
+
+@opcode_handler(0x7b)  # OP_ROT
+def _op_rot(ctx: ScriptContext, opcode: int):
+    if len(ctx.stack) < 3:
+        raise ScriptError("stack underflow")
+    ctx.stack.append(ctx.stack.pop(-3))
+
+@opcode_handler(0x6b)  # OP_TOALTSTACK
+def _op_toaltstack(ctx: ScriptContext, opcode: int):
+    ctx.alt_stack.append(ctx.stack.pop())
+
+@opcode_handler(0x6c)  # OP_FROMALTSTACK
+def _op_fromaltstack(ctx: ScriptContext, opcode: int):
+    ctx.stack.append(ctx.alt_stack.pop())
+
+# === Comparison ===
+
+@opcode_handler(0x87)  # OP_EQUAL
+def _op_equal(ctx: ScriptContext, opcode: int):
+    ctx.push_bool(ctx.stack.pop() == ctx.stack.pop())
+
+@opcode_handler(0x88)  # OP_EQUALVERIFY
+def _op_equalverify(ctx: ScriptContext, opcode: int):
+    if ctx.stack.pop() != ctx.stack.pop():
+        raise ScriptError("OP_EQUALVERIFY failed")
+
+# === Arithmetic ===
+
+UNARY_NUM_OPERATIONS: Dict[int, Callable[[int], int]] = {
+    0x8b: lambda a: a + 1,  # OP_1ADD
+    0x8c: lambda a: a - 1,  # OP_1SUB
+    0x8f: lambda a: -a,  # OP_NEGATE
+    0x90: abs,  # OP_ABS
+    0x91: lambda a: int(a == 0),  # OP_NOT
+    0x92: lambda a: int(a != 0),  # OP_0NOTEQUAL
+}
+
+BINARY_NUM_OPERATIONS: Dict[int, Callable[[int, int], int]] = {
+    0x93: lambda a, b: a + b,  # OP_ADD
+    0x94: lambda a, b: a - b,  # OP_SUB
+    0x9a: lambda a, b: int(a != 0 and b != 0),  # OP_BOOLAND
+    0x9b: lambda a, b: int(a != 0 or b != 0),  # OP_BOOLOR
+    0x9c: lambda a, b: int(a == b),  # OP_NUMEQUAL
+    0x9f: lambda a, b: int(a < b),  # OP_LESSTHAN
+    0xa0: lambda a, b: int(a > b),  # OP_GREATERTHAN
+    0xa3: min,  # OP_MIN
+    0xa4: max,  # OP_MAX
+}
+
+@opcode_handler(*UNARY_NUM_OPERATIONS)
+def _op_unary_num(ctx: ScriptContext, opcode: int):
+    ctx.stack.append(encode_num(UNARY_NUM_OPERATIONS[opcode](ctx.pop_num())))
+
+@opcode_handler(*BINARY_NUM_OPERATIONS)
+def _op_binary_num(ctx: ScriptContext, opcode: int):
+    if len(ctx.stack) < 2:
+        raise ScriptError("stack underflow")
+    b = ctx.pop_num()
+    a = ctx.pop_num()
+    ctx.stack.append(encode_num(BINARY_NUM_OPERATIONS[opcode](a, b)))
+
+@opcode_handler(0x9d)  # OP_NUMEQUALVERIFY
+def _op_numequalverify(ctx: ScriptContext, opcode: int):
+    if len(ctx.stack) < 2:
+        raise ScriptError("stack underflow")
+    if ctx.pop_num() != ctx.pop_num():
+        raise ScriptError("OP_NUMEQUALVERIFY failed")
+
+# === Crypto ===
+
+def hash160(data: bytes) -> bytes:
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+HASH_OPERATIONS: Dict[int, Callable[[bytes], bytes]] = {
+    0xa6: lambda data: hashlib.new('ripemd160', data).digest(),  # OP_RIPEMD160
+    0xa7: lambda data: hashlib.sha1(data).digest(),  # OP_SHA1
+    0xa8: lambda data: hashlib.sha256(data).digest(),  # OP_SHA256
+    0xa9: hash160,  # OP_HASH160
+    0xaa: hash256,  # OP_HASH256
+}
+
+@opcode_handler(*HASH_OPERATIONS)
+def _op_hash(ctx: ScriptContext, opcode: int):
+    ctx.stack.append(HASH_OPERATIONS[opcode](ctx.stack.pop()))
+
+def check_signature(ctx: ScriptContext) -> bool:
+    if len(ctx.stack) < 2:
+        raise ScriptError("stack underflow")
+    pubkey = ctx.stack.pop()
+    signature = ctx.stack.pop()
+    
+    # 空チェック
+    if not signature or not pubkey:
+        return False
+    
+    # 署名検証
+    check = SignatureCheck(pubkey.hex(), signature.hex(), ctx.message, ctx.timestamp)
+    if ctx.sig_checks is not None:
+        ctx.sig_checks.append(check)
+        return True
+    return verify_signature(*check)
+
+@opcode_handler(0xac)  # OP_CHECKSIG
+def _op_checksig(ctx: ScriptContext, opcode: int):
+    ctx.push_bool(check_signature(ctx))
+
+@opcode_handler(0xad)  # OP_CHECKSIGVERIFY
+def _op_checksigverify(ctx: ScriptContext, opcode: int):
+    if not check_signature(ctx):
+        raise ScriptError("OP_CHECKSIGVERIFY failed")
+
+# === Other ===
+
+@opcode_handler(0x69)  # OP_VERIFY
+def _op_verify(ctx: ScriptContext, opcode: int):
+    if not bytes_to_bool(ctx.stack.pop()):
+        raise ScriptError("OP_VERIFY failed")
+
+@opcode_handler(0x61, *range(0xb0, 0xba))  # OP_NOP, OP_NOP1-10
+def _op_nop(ctx: ScriptContext, opcode: int):
+    pass
+
+@opcode_handler(0x6a)  # OP_RETURN
+def _op_return(ctx: ScriptContext, opcode: int):
+    raise ScriptError("OP_RETURN")
+
+def is_p2pk_script(script: bytes) -> bool:
+    # <33 or 65 bytes pubkey> OP_CHECKSIG
+    return ((len(script) == 35 and script[0] == 0x21 and script[34] == 0xac) or
+            (len(script) == 67 and script[0] == 0x41 and script[66] == 0xac))
+
+
+def is_p2pkh_script(script: bytes) -> bool:
+    # OP_DUP OP_HASH160 <20 bytes> OP_EQUALVERIFY OP_CHECKSIG
+    return (len(script) == 25 and script[:3] == b'\x76\xa9\x14' and
+            script[23] == 0x88 and script[24] == 0xac)
+
+
+def verify_standard_script(script_type: Optional[str], script_sig: bytes, script_pubkey: bytes,
+                           message: str, timestamp: int,
+                           sig_checks: Optional[List[SignatureCheck]] = None) -> Optional[bool]:
+    """
+    P2PK/P2PKHをインタプリタを使わずに検証する
+    テンプレートに一致しない場合はNoneを返す(汎用エンジンで実行すること)
+    """
+    try:
+        operations = compile_script(script_sig)
+    except ValueError:
+        return None
+    pushes = [data for _, data in operations]
+    if None in pushes:
+        return None
+    
+    if script_type == "P2PK" and is_p2pk_script(script_pubkey) and len(pushes) == 1:
+        signature = pushes[0]
+        pubkey = script_pubkey[1:-1]
+    elif script_type == "P2PKH" and is_p2pkh_script(script_pubkey) and len(pushes) == 2:
+        signature, pubkey = pushes
+        if hash160(pubkey) != script_pubkey[3:23]:
+            return False
+    else:
+        return None
+    
+    if not signature:
+        return False
+    check = SignatureCheck(pubkey.hex(), signature.hex(), message, timestamp)
+    if sig_checks is not None:
+        sig_checks.append(check)
+        return True
+    return verify_signature(*check)
+
+
+def execute_script(script_sig_hex: str, script_pubkey_hex: str, message: str,
+                   timestamp: int,
+                   debug: bool = False,
+                   sig_checks: Optional[List[SignatureCheck]] = None,
+                   script_type: Optional[str] = None) -> bool:
         """
-        if base is None:
-            base=Base()
+        raw script(16進数文字列)を実行
 
-        stacks: List[str] = []
-        alt_stack: List[str] = []  # 代替スタック
-        scripts = (script_sig_asm + ' ' + script_pubkey_asm).split()
-        
-        i = 0
-        while i < len(scripts):
-            s = scripts[i]
+        sig_checksを指定した場合、OP_CHECKSIGの署名検証は行わずにsig_checksへ追加し、
+        成功したものとして実行を続ける(DEFERRABLE_SCRIPT_TYPESのみで使用すること)。
+        追加された署名はverify_signaturesでまとめて検証する。
+        script_typeがP2PK/P2PKHの場合はverify_standard_scriptで検証する。
+        """
+        try:
+            script_sig = bytes.fromhex(script_sig_hex)
+            script_pubkey = bytes.fromhex(script_pubkey_hex)
+            
+            if script_type in STANDARD_SCRIPT_TYPES:
+                result = verify_standard_script(script_type, script_sig, script_pubkey, message, timestamp, sig_checks)
+                if result is not None:
+                    if debug:
+                        print(f"{script_type}テンプレート検証結果: {result}")
+                    return result
             
+            operations = compile_script(script_sig) + compile_script(script_pubkey)
+        except ValueError as e:
             if debug:
-                print(f"[{i}] {s} | Stack: {stacks}")
+                print(f"エラー: {e}")
+            return False
+        
+        if debug:
+            print(f"script: {hex_to_script(script_sig_hex)} {hex_to_script(script_pubkey_hex)}")
+        
+        ctx = ScriptContext(message, timestamp, sig_checks)
+        for i, (opcode, data) in enumerate(operations):
+            if debug:
+                print(f"[{i}] {get_opcode_name(opcode)} | Stack: {[item.hex() for item in ctx.stack]}")
             
-            # オペコードでない場合（データ）
-            if not s.startswith('OP_'):
-                i += 1
+            # pushデータ
+            if data is not None:
+                ctx.stack.append(data)
                 continue
             
-            s_hex = get_opcode_hex(s)
+            handler = OPCODE_HANDLERS.get(opcode)
+            if handler is None:
+                if debug:
+                    print(f"未対応のオペコード: {get_opcode_name(opcode)} ({hex(opcode)})")
+                continue
             
             try:
-                # OP_PUSHBYTES_X (0x01-0x4b)
-                if 0x01 <= s_hex <= 0x4b:
-                    if i + 1 < len(scripts):
-                        stacks.append(scripts[i + 1])
-                        i += 2
-                    else:
-                        return False
-                        
-                # OP_PUSHDATA1 (0x4c)
-                elif s_hex == 0x4c:
-                    if i + 2 < len(scripts):
-                        stacks.append(scripts[i + 2])
-                        i += 3
-                    else:
-                        return False
-                        
-                # OP_PUSHDATA2/4
-                elif s_hex in [0x4d, 0x4e]:
-                    if i + 2 < len(scripts):
-                        stacks.append(scripts[i + 2])
-                        i += 3
-                    else:
-                        return False
-                
-                # OP_0 / OP_FALSE
-                elif s_hex == 0x00:
-                    stacks.append('')
-                    i += 1
-                    
-                # OP_1NEGATE
-                elif s_hex == 0x4f:
-                    stacks.append(int_to_hex_signed(-1))
-                    i += 1
-                    
-                # OP_1 から OP_16 (0x51-0x60)
-                elif 0x51 <= s_hex <= 0x60:
-                    value = s_hex - 0x50
-                    stacks.append(int_to_hex_signed(value))
-                    i += 1
-                
-                # === Stack Operations ===
-                
-                # OP_DUP (0x76)
-                elif s_hex == 0x76:
-                    if len(stacks) < 1:
-                        return False
-                    stacks.append(stacks[-1])
-                    i += 1
-                    
-                # OP_DROP (0x75)
-                elif s_hex == 0x75:
-                    if len(stacks) < 1:
-                        return False
-                    stacks.pop()
-                    i += 1
-                    
-                # OP_2DUP (0x6e)
-                elif s_hex == 0x6e:
-                    if len(stacks) < 2:
-                        return False
-                    stacks.append(stacks[-2])
-                    stacks.append(stacks[-2])
-                    i += 1
-                    
-                # OP_3DUP (0x6f)
-                elif s_hex == 0x6f:
-                    if len(stacks) < 3:
-                        return False
-                    stacks.extend([stacks[-3], stacks[-2], stacks[-1]])
-                    i += 1
-                    
-                # OP_2DROP (0x6d)
-                elif s_hex == 0x6d:
-                    if len(stacks) < 2:
-                        return False
-                    stacks.pop()
-                    stacks.pop()
-                    i += 1
-                    
-                # OP_SWAP (0x7c)
-                elif s_hex == 0x7c:
-                    if len(stacks) < 2:
-                        return False
-                    stacks[-1], stacks[-2] = stacks[-2], stacks[-1]
-                    i += 1
-                    
-                # OP_OVER (0x78)
-                elif s_hex == 0x78:
-                    if len(stacks) < 2:
-                        return False
-                    stacks.append(stacks[-2])
-                    i += 1
-                    
-                # OP_ROT (0x7b)
-                elif s_hex == 0x7b:
-                    if len(stacks) < 3:
-                        return False
-                    stacks.append(stacks.pop(-3))
-                    i += 1
-                    
-                # OP_TOALTSTACK (0x6b)
-                elif s_hex == 0x6b:
-                    if len(stacks) < 1:
-                        return False
-                    alt_stack.append(stacks.pop())
-                    i += 1
-                    
-                # OP_FROMALTSTACK (0x6c)
-                elif s_hex == 0x6c:
-                    if len(alt_stack) < 1:
-                        return False
-                    stacks.append(alt_stack.pop())
-                    i += 1
-                
-                # === Comparison ===
-                
-                # OP_EQUAL (0x87)
-                elif s_hex == 0x87:
-                    if len(stacks) < 2:
-                        return False
-                    a = stacks.pop()
-                    b = stacks.pop()
-                    stacks.append(int_to_hex_signed(1) if a == b else '')
-                    i += 1
-                    
-                # OP_EQUALVERIFY (0x88)
-                elif s_hex == 0x88:
-                    if len(stacks) < 2:
-                        return False
-                    a = stacks.pop()
-                    b = stacks.pop()
-                    if a != b:
-                        return False
-                    i += 1
-                
-                # === Arithmetic (Baseクラスを活用) ===
-                
-                # OP_1ADD (0x8b)
-                elif s_hex == 0x8b:
-                    if len(stacks) < 1:
-                        return False
-                    value = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(value + 1))
-                    i += 1
-                    
-                # OP_1SUB (0x8c)
-                elif s_hex == 0x8c:
-                    if len(stacks) < 1:
-                        return False
-                    value = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(value - 1))
-                    i += 1
-                    
-                # OP_NEGATE (0x8f)
-                elif s_hex == 0x8f:
-                    if len(stacks) < 1:
-                        return False
-                    value = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(-value))
-                    i += 1
-                    
-                # OP_ABS (0x90)
-                elif s_hex == 0x90:
-                    if len(stacks) < 1:
-                        return False
-                    value = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(abs(value)))
-                    i += 1
-                    
-                # OP_NOT (0x91)
-                elif s_hex == 0x91:
-                    if len(stacks) < 1:
-                        return False
-                    value = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(1 if value == 0 else 0))
-                    i += 1
-                    
-                # OP_0NOTEQUAL (0x92)
-                elif s_hex == 0x92:
-                    if len(stacks) < 1:
-                        return False
-                    value = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(1 if value != 0 else 0))
-                    i += 1
-                    
-                # OP_ADD (0x93)
-                elif s_hex == 0x93:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(a + b))
-                    i += 1
-                    
-                # OP_SUB (0x94)
-                elif s_hex == 0x94:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(a - b))
-                    i += 1
-                    
-                # OP_BOOLAND (0x9a)
-                elif s_hex == 0x9a:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    result = 1 if (a != 0 and b != 0) else 0
-                    stacks.append(int_to_hex_signed(result))
-                    i += 1
-                    
-                # OP_BOOLOR (0x9b)
-                elif s_hex == 0x9b:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    result = 1 if (a != 0 or b != 0) else 0
-                    stacks.append(int_to_hex_signed(result))
-                    i += 1
-                    
-                # OP_NUMEQUAL (0x9c)
-                elif s_hex == 0x9c:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(1 if a == b else 0))
-                    i += 1
-                    
-                # OP_NUMEQUALVERIFY (0x9d)
-                elif s_hex == 0x9d:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    if a != b:
-                        return False
-                    i += 1
-                    
-                # OP_LESSTHAN (0x9f)
-                elif s_hex == 0x9f:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(1 if a < b else 0))
-                    i += 1
-                    
-                # OP_GREATERTHAN (0xa0)
-                elif s_hex == 0xa0:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(1 if a > b else 0))
-                    i += 1
-                    
-                # OP_MIN (0xa3)
-                elif s_hex == 0xa3:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(min(a, b)))
-                    i += 1
-                    
-                # OP_MAX (0xa4)
-                elif s_hex == 0xa4:
-                    if len(stacks) < 2:
-                        return False
-                    b = hex_to_int_signed(stacks.pop())
-                    a = hex_to_int_signed(stacks.pop())
-                    stacks.append(int_to_hex_signed(max(a, b)))
-                    i += 1
-                
-                # === Crypto ===
-                
-                # OP_RIPEMD160 (0xa6)
-                elif s_hex == 0xa6:
-                    if len(stacks) < 1:
-                        return False
-                    data = stacks.pop()
-                    result = hashlib.new('ripemd160', bytes.fromhex(data)).digest()
-                    stacks.append(result.hex())
-                    i += 1
-                    
-                # OP_SHA1 (0xa7)
-                elif s_hex == 0xa7:
-                    if len(stacks) < 1:
-                        return False
-                    data = stacks.pop()
-                    result = hashlib.sha1(bytes.fromhex(data)).digest()
-                    stacks.append(result.hex())
-                    i += 1
-                    
-                # OP_SHA256 (0xa8)
-                elif s_hex == 0xa8:
-                    if len(stacks) < 1:
-                        return False
-                    data = stacks.pop()
-                    result = hashlib.sha256(bytes.fromhex(data)).digest()
-                    stacks.append(result.hex())
-                    i += 1
-                    
-                # OP_HASH160 (0xa9)
-                elif s_hex == 0xa9:
-                    if len(stacks) < 1:
-                        return False
-                    data = stacks.pop()
-                    sha256_hash = hashlib.sha256(bytes.fromhex(data)).digest()
-                    ripemd160_hash = hashlib.new('ripemd160', sha256_hash).digest()
-                    stacks.append(ripemd160_hash.hex())
-                    i += 1
-                    
-                # OP_HASH256 (0xaa) 
-                elif s_hex == 0xaa:
-                    if len(stacks) < 1:
-                        return False
-                    data = stacks.pop()
-                    # is_little=Falseでビッグエンディアンのまま取得
-                    result = base.hash256_hex(data, is_little=False)
-                    stacks.append(result)
-                    i += 1
-                
-                # === Other ===
-                
-                # OP_VERIFY (0x69)
-                elif s_hex == 0x69:
-                    if len(stacks) < 1:
-                        return False
-                    value = stacks.pop()
-                    if not cast_to_bool(value):
-                        return False
-                    i += 1
-                
-                # OP_CHECKSIG (0xac)
-                elif s_hex == 0xac:
-                    if len(stacks) < 2:
-                        return False
-                    
-                    pubkey_hex = stacks.pop()
-                    signature_hex = stacks.pop()
-                    
-                    # 空チェック
-                    if not signature_hex or not pubkey_hex:
-                        stacks.append('')
-                        i += 1
-                        continue
-                    
-                    # 署名検証
-                    result=verify_signature(pubkey_hex,signature_hex,message,timestamp)
-
-                        
-                    if debug:
-                        print(f"署名検証: {'成功' if result else '失敗'}")
-
-                    stacks.append(int_to_hex_signed(1) if result else '')
-                    i += 1
-                    
-                # OP_CHECKSIGVERIFY (0xad)
-                elif s_hex == 0xad:
-                    if len(stacks) < 2:
-                        return False
-                    pubkey = stacks.pop()
-                    signature = stacks.pop()
-                    result = len(signature) > 0 and len(pubkey) > 0
-                    if not result:
-                        return False
-                    i += 1
-                    
-                # OP_NOP, OP_NOP1-10 (0x61, 0xb0-0xb9)
-                elif s_hex == 0x61 or (0xb0 <= s_hex <= 0xb9):
-                    i += 1
-                    
-                # OP_RETURN (0x6a)
-                elif s_hex == 0x6a:
-                    return False
-                    
-                else:
-                    if debug:
-                        print(f"未対応のオペコード: {s} ({hex(s_hex)})")
-                    i += 1
-                    
-            except Exception as e:
+                handler(ctx, opcode)
+            except (ScriptError, IndexError, ValueError) as e:
                 if debug:
-                    print(f"エラー: {e}")
+                    print(f"エラー: {get_opcode_name(opcode)} {e}")
                 return False
         
         # スタックに1つだけ要素が残り、それが非ゼロであれば有効
-        if len(stacks) != 1:
+        if len(ctx.stack) != 1:
             if debug:
-                print(f"スタック検証失敗: {len(stacks)}個の要素が残っています")
+                print(f"スタック検証失敗: {len(ctx.stack)}個の要素が残っています")
             return False
         
-        result = cast_to_bool(stacks[0])
+        result = bytes_to_bool(ctx.stack[0])
         if debug:
-            print(f"最終スタック: {stacks}")
+            print(f"最終スタック: {[item.hex() for item in ctx.stack]}")
             print(f"結果: {result}")
         return result
 
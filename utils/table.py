@@ -0,0 +1,65 @@
+from azure.data.tables import TableEntity
+from models.query import QueryFilter
+from typing import List, Optional, Dict, Tuple
+import base64
+import json
+
+# 次ページがある場合にcontinuation tokenを返すレスポンスヘッダー
+CONTINUATION_TOKEN_HEADER = "x-continuation-token"
+
+
+def encode_continuation_token(continuation_token: Optional[Dict[str, str]]) -> Optional[str]:
+    """
+    Azure Tablesのcontinuation token(next_partition_key/next_row_key)をURLで扱える文字列にする
+
+    Examples:
+        >>> encode_continuation_token({"PartitionKey": "user", "RowKey": "0123"})
+    """
+    if not continuation_token:
+        return None
+    payload = json.dumps(
+        [continuation_token.get("PartitionKey"), continuation_token.get("RowKey")],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_continuation_token(token: Optional[str]) -> Optional[Dict[str, str]]:
+    """encode_continuation_tokenで作成した文字列を戻す。不正な場合はValueError"""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        partition_key, row_key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError(f"continuation tokenが正しくないです。token:{token}")
+    if not isinstance(partition_key, (str, type(None))) or not isinstance(row_key, (str, type(None))):
+        raise ValueError(f"continuation tokenが正しくないです。token:{token}")
+    return {"PartitionKey": partition_key, "RowKey": row_key}
+
+
+async def query_entities_page(
+        table_client,
+        query_filter: QueryFilter,
+        limit: int,
+        continuation_token: Optional[Dict[str, str]] = None,
+    ) -> Tuple[List[TableEntity], Optional[Dict[str, str]]]:
+    """
+    最大limit件のエンティティと次ページのcontinuation tokenを取得する(aioのTableClient用)
+
+    Azure Tablesは$top未満の件数でcontinuation tokenを返すことがあるため、limit件に達するまで続きを取得する。
+    """
+    entities: List[TableEntity] = []
+    while True:
+        pages = table_client.query_entities(
+            **query_filter.model_dump(),
+            results_per_page=limit - len(entities),
+        ).by_page(continuation_token=continuation_token)
+        try:
+            page = await pages.__anext__()
+        except StopAsyncIteration:
+            return entities, None
+        entities.extend([e async for e in page])
+        continuation_token = pages.continuation_token
+        if not continuation_token or len(entities) >= limit:
+            return entities, continuation_token or None